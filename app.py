@@ -1,16 +1,31 @@
 import streamlit as st
 import pandas as pd
-import tempfile
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+import uuid
 
 # Import your custom modules
 from modules.darwinbox_client import DarwinboxClient
 from modules.ai_analyzer import AIAnalyzer
-from utils.file_processor import download_file, extract_text_from_file
+from modules.analysis_pipeline import AnalysisPipeline, is_failed_result, candidate_id_of
+from modules.run_journal import AnalysisRunJournal
+from modules.prerank import prerank_candidates, parse_keywords
+from modules.results_buffer import ResultsBuffer, RESULTS_REFRESH_S, LIVE_TOP_K
+from modules.resume_prefetcher import ResumePrefetcher, PREFETCH_REFRESH_S
+from modules.job_queue import get_analysis_job_queue
+from modules.decision_submitter import DecisionSubmitter
+from utils.file_processor import extract_text_from_bytes, get_download_pool_stats
 from utils.file_saver import save_data, create_resume_folder
 from utils.gsheets_client import GSheetsClient
+from utils.candidate_store import get_candidate_store, sync_candidates, partition_by_prior_scores
+from utils.candidate_data import candidates_to_dataframe
+from utils.analysis_cache import hash_text
+from utils import metrics
+from utils.tracing import Tracer, trace_path_for
+from utils.text_compaction import describe_reduction
+
+# The finished results table is paged above this many rows.
+RESULTS_PAGE_SIZE = 500
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Darwinbox AI Resume Analyzer", layout="wide", page_icon="🤖")
@@ -19,12 +34,16 @@ st.set_page_config(page_title="Darwinbox AI Resume Analyzer", layout="wide", pag
 def init_session_state():
     if "app_step" not in st.session_state:
         st.session_state.app_step = 0
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
     for key, default in [
         ("db_client", None), ("ai_analyzer", None), ("gsheets_client", None), ("job_list", []),
         ("selected_job_id", None), ("selected_job_code", None), ("selected_job_str", "N/A"),
         ("candidates", pd.DataFrame()), ("analysis_results", pd.DataFrame()),
         ("jd_text", ""), ("jd_file_details", None), ("jd_input_method", "Manual Input"),
-        ("finalized_candidates", pd.DataFrame())
+        ("finalized_candidates", pd.DataFrame()), ("archive_resumes", True), ("analyze_only_new", False),
+        ("trace_analysis", False), ("analysis_trace", None), ("prerank_enabled", False), ("prerank_top_n", 0),
+        ("prerank_min_score", 0), ("prerank_keywords", ""), ("batch_analysis", False), ("resume_prefetcher", None)
     ]:
         if key not in st.session_state:
             st.session_state[key] = default
@@ -47,6 +66,8 @@ def reset_app():
     current_job_list = st.session_state.job_list
     current_gsheets_client = st.session_state.gsheets_client
     jd_method = st.session_state.get("jd_input_method", "Manual Input")
+    if st.session_state.get("resume_prefetcher") is not None:
+        st.session_state.resume_prefetcher.stop()
     
     for key in list(st.session_state.keys()):
         del st.session_state[key]
@@ -59,69 +80,89 @@ def reset_app():
     st.session_state.jd_input_method = jd_method
     st.session_state.app_step = 1
 
-def flatten_candidate_data(df):
-    if 'application_data' not in df.columns: return df
-    def get_biographical(x, field):
-        try: return str(x.get('Biographical', {}).get(field))
-        except: return None
-    def get_work_experience(x):
-        try:
-            titles = [exp.get('Job Title') for exp in x.get('Work Experience', []) if exp.get('Job Title')]
-            return ', '.join(titles) if titles else None
-        except: return None
-    def get_education(x):
-        try:
-            degrees = [edu.get('Education Degree') for edu in x.get('Education', []) if edu.get('Education Degree')]
-            return ', '.join(degrees) if degrees else None
-        except: return None
-    df['experience_level'] = df['application_data'].apply(lambda x: get_biographical(x, 'Are you a Fresher or Experienced?'))
-    df['total_experience'] = df['application_data'].apply(lambda x: get_biographical(x, 'Total Work Experience (in months)?'))
-    df['notice_period'] = df['application_data'].apply(lambda x: get_biographical(x, 'Notice period'))
-    df['highest_qualification'] = df['application_data'].apply(lambda x: get_biographical(x, 'Highest Educational Qualification'))
-    df['work_experience_titles'] = df['application_data'].apply(get_work_experience)
-    df['education_degrees'] = df['application_data'].apply(get_education)
-    df['application_data'] = df['application_data'].astype(str)
-    return df
-
-def analyze_single_resume(candidate_data, jd_text, ai_analyzer, resume_save_path, api_key):
-    resume_url = candidate_data.get('darwinbox_resume_url')
-    result_dict = {
-        'Candidate Name': candidate_data.get('name', 'N/A'),
-        'Candidate ID': candidate_data.get('candidate_unique_id'),
-        'Score (%)': 0,
-        'Resume Link': 'N/A'
-    }
-    if not resume_url:
-        result_dict['AI Remarks'] = 'Skipped: No resume URL found.'
-        return result_dict
-    result_dict['Resume Link'] = resume_url
-    safe_name = "".join(c for c in candidate_data.get('name', 'candidate') if c.isalnum() or c in (' ', '_')).rstrip()
-    file_id = candidate_data.get('candidate_unique_id') or candidate_data.get('candidate_id') or 'no_id'
-    local_filename = f"{safe_name}_{file_id}.pdf"
-    local_path = os.path.join(resume_save_path, local_filename)
-    text_content = ""
-    if download_file(resume_url, local_path):
-        text_content = extract_text_from_file(local_path)
-    else:
-        text_content = "Error: Could not download resume."
-    if "Error:" in text_content:
-        ai_result = {'overall_score': 0, 'summary': text_content}
-    else:
-        ai_result = ai_analyzer.analyze_resume(text_content, jd_text, api_key)
-    result_dict['Score (%)'] = ai_result.get('overall_score', 0)
-    result_dict['AI Remarks'] = ai_result.get('summary', 'No summary generated.')
-    return result_dict
-
-def analyze_resume_batch(resume_batch, api_key, jd_text, ai_analyzer, resume_save_path):
-    """Processes a small batch of resumes using the same API key."""
-    results = []
-    for resume_data in resume_batch:
-        result = analyze_single_resume(resume_data, jd_text, ai_analyzer, resume_save_path, api_key)
-        results.append(result)
-    return results
+def start_resume_prefetch(candidates: pd.DataFrame):
+    """Starts downloading and extracting the chosen candidates' resumes while the JD is still being written."""
+    if st.session_state.resume_prefetcher is not None:
+        st.session_state.resume_prefetcher.stop()
+    resume_folder_path = create_resume_folder(st.session_state.selected_job_code) if st.session_state.archive_resumes else None
+    # Only the download and extraction stages run, so the JD isn't needed yet.
+    pipeline = AnalysisPipeline(st.session_state.ai_analyzer, "", resume_folder_path,
+                                archive_resumes=st.session_state.archive_resumes)
+    st.session_state.resume_prefetcher = ResumePrefetcher(pipeline, candidates.to_dict('records')).start()
+
+@st.fragment(run_every=PREFETCH_REFRESH_S)
+def render_prefetch_progress():
+    """Redraws on its own timer, without rerunning the rest of the page."""
+    prefetcher = st.session_state.resume_prefetcher
+    if prefetcher is None:
+        return
+    progress = prefetcher.progress()
+    if not progress['total']:
+        return
+    text = (f"Preparing resumes in the background: {progress['done']}/{progress['total']} downloaded and parsed "
+            f"({progress['unusable']} unusable), {progress['elapsed_s']:.0f}s")
+    if not progress['running']:
+        text = (f"{progress['ready']} of {progress['total']} resumes are downloaded and parsed; "
+                f"the analysis will only need the AI calls for them.")
+    st.progress(progress['done'] / progress['total'], text=text)
+
+def count_failed_results(results: pd.DataFrame) -> int:
+    """Vectorized is_failed_result over a results DataFrame."""
+    if results.empty or 'Analysis Status' not in results.columns:
+        return 0
+    return int((results['Analysis Status'] == 'failed').sum())
+
+def render_live_results(slot, results):
+    """Fills `slot` with summary stats and the current top rows of a ResultsBuffer."""
+    summary = results.summary()
+    with slot.container():
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Results", summary['rows'])
+        col2.metric("Mean score", f"{summary['mean_score']:.1f}" if summary['mean_score'] is not None else "–")
+        col3.metric("Scored 70+", summary['scored_70_plus'])
+        if len(results) > LIVE_TOP_K:
+            st.caption(f"Showing the top {LIVE_TOP_K} of {len(results)} so far; the full table appears when the run finishes.")
+        st.dataframe(results.top_k(LIVE_TOP_K), hide_index=True)
+
+def render_pipeline_health(slot, analyzed_count, failed_count):
+    """Fills `slot` (an st.empty) with per-stage latencies, Mistral key health and retry counters."""
+    with slot.container():
+        col1, col2 = st.columns(2)
+        col1.metric("✅ Analyzed", analyzed_count - failed_count)
+        col2.metric("❌ Failed", failed_count, delta_color="inverse")
+
+        stages = metrics.registry.histogram_summary("screening_pipeline_stage_seconds", group_by="stage")
+        if stages:
+            st.dataframe(pd.DataFrame([{"Stage": s["group"], "Items": s["count"], "p50 (s)": round(s["p50_s"], 2),
+                                        "p95 (s)": round(s["p95_s"], 2)} for s in stages]), hide_index=True)
+
+        # Recorded in the extraction worker processes and merged back per resume; scanned PDFs include their OCR time.
+        extraction = metrics.registry.histogram_summary("screening_extract_seconds", group_by="extension")
+        if extraction:
+            st.caption("Parsing by type: " + " · ".join(f"{s['group'] or '?'} {s['count']}× p95 {s['p95_s']:.2f}s" for s in extraction))
+
+        requests_by_key = {s["group"]: s for s in metrics.registry.histogram_summary("screening_llm_request_seconds", group_by="key")}
+        rate_limited = {dict(labels).get("key"): value for labels, value in metrics.registry.counter_values("screening_llm_rate_limited_total").items()}
+        if requests_by_key:
+            st.dataframe(pd.DataFrame([{"Key": key, "Requests": s["count"], "429 rate": f"{rate_limited.get(key, 0) / s['count']:.0%}",
+                                        "p95 (s)": round(s["p95_s"], 2)} for key, s in sorted(requests_by_key.items())]), hide_index=True)
+
+        def counter_total(name):
+            return sum(metrics.registry.counter_values(name).values())
+        key_wait_s = sum(s["total_s"] for s in metrics.registry.histogram_summary("screening_llm_key_wait_seconds"))
+        st.caption(f"Waiting for a free key: {key_wait_s:.0f}s · Backoff sleeps: {counter_total('screening_llm_backoff_seconds_total'):.0f}s · "
+                   f"HTTP retries: {counter_total('screening_http_retries_total'):.0f} · "
+                   f"Downloaded: {counter_total('screening_download_bytes_total') / 2**20:.1f} MB · "
+                   f"OCR pages: {counter_total('screening_ocr_pages_total'):.0f}")
+        sheets = metrics.registry.histogram_summary("screening_gsheets_append_seconds")
+        if sheets:
+            st.caption(f"Google Sheets appends: {sheets[0]['count']}, p95 {sheets[0]['p95_s']:.1f}s")
 
 # --- SIDEBAR DISPLAY FUNCTION ---
+pipeline_health_slot = None  # Sidebar placeholder that Step 4 refreshes while the pipeline runs
+
 def display_sidebar():
+    global pipeline_health_slot
     with st.sidebar:
         st.title("📊 Analysis Dashboard")
         st.divider()
@@ -133,20 +174,37 @@ def display_sidebar():
             st.markdown(f"**Selected Job:** {st.session_state.get('selected_job_str', 'N/A')}")
             st.metric("Candidates to Analyze", len(st.session_state.candidates))
         
-        if st.session_state.app_step >= 5:
+        if st.session_state.app_step >= 4:
             st.divider()
-            st.caption("AI ANALYSIS SUMMARY")
+            st.caption("PIPELINE HEALTH (all sessions since server start)")
             results = st.session_state.analysis_results
-            if not results.empty:
-                failed_count = sum(1 for r_idx, r in results.iterrows() if 'failed' in r.get('AI Remarks', '').lower() or r.get('AI Remarks', '').startswith('Error'))
-                successful_count = len(results) - failed_count
-                
-                col1, col2 = st.columns(2)
-                col1.metric("✅ Analyzed", successful_count)
-                col2.metric("❌ Failed", failed_count, delta_color="inverse")
-            else:
-                 st.metric("Analyzed", "0")
-        
+            pipeline_health_slot = st.empty()
+            render_pipeline_health(pipeline_health_slot, len(results), count_failed_results(results))
+
+        if st.session_state.ai_analyzer:
+            st.divider()
+            st.caption("AI RESULT CACHE")
+            cache_stats = st.session_state.ai_analyzer.cache.stats()
+            col1, col2 = st.columns(2)
+            col1.metric("♻️ Cache Hits", cache_stats['hits'])
+            col2.metric("🌐 Cache Misses", cache_stats['misses'])
+
+        if st.session_state.db_client and st.session_state.ai_analyzer:
+            with st.expander("🔌 Connection Pools"):
+                pool_stats = (
+                    [dict(client="Darwinbox", **p) for p in st.session_state.db_client.http.pool_stats()] +
+                    [dict(client="Darwinbox updates", **p) for p in st.session_state.db_client.update_http.pool_stats()] +
+                    [dict(client="Mistral", **p) for p in st.session_state.ai_analyzer.http.pool_stats()] +
+                    [dict(client="Downloads", **p) for p in get_download_pool_stats()]
+                )
+                if pool_stats:
+                    st.dataframe(pd.DataFrame(pool_stats), hide_index=True)
+                else:
+                    st.caption("No connections opened yet.")
+
+        if st.session_state.gsheets_client and st.session_state.gsheets_client.last_error:
+            st.warning(st.session_state.gsheets_client.last_error)
+
         st.divider()
         st.button("🔄 Start a New Analysis", on_click=reset_app, type="primary", use_container_width=True)
 
@@ -165,21 +223,22 @@ def display_step1_job_selection():
             st.info(f"Found {job_count} open jobs.")
             job_options = {f"{job['job_title']} (ID: {job['job_code']})": (job['job_id'], job['job_code']) for job in st.session_state.job_list}
             selected_job_str = st.selectbox("Choose a job:", options=job_options.keys(), disabled=is_disabled)
+            incremental_sync = st.checkbox("Only fetch candidates added since the last sync", value=True, disabled=is_disabled,
+                                           help="Earlier candidates for this job are loaded from the local candidate store.")
             if st.button(f"Fetch Candidates", type="primary", disabled=is_disabled):
                 st.session_state.selected_job_str = selected_job_str
                 st.session_state.selected_job_id, st.session_state.selected_job_code = job_options[selected_job_str]
                 with st.spinner("Fetching candidates..."):
-                    candidates_list = st.session_state.db_client.get_candidates_for_job(st.session_state.selected_job_id)
-                    df = pd.DataFrame(candidates_list)
-                    if not df.empty:
-                        if 'unique_id' in df.columns:
-                            df.rename(columns={'unique_id': 'candidate_unique_id'}, inplace=True)
-                        df_flattened = flatten_candidate_data(df.copy())
-                        st.session_state.candidates = df_flattened
+                    candidates_list, new_keys, watermark = sync_candidates(
+                        st.session_state.db_client, st.session_state.selected_job_id, incremental=incremental_sync)
+                    if watermark:
+                        st.toast(f"{len(new_keys)} new candidate(s) since last sync on {watermark:%d-%m-%Y %H:%M}.", icon="🔄")
+                    df_flattened = candidates_to_dataframe(candidates_list, new_keys)
+                    st.session_state.candidates = df_flattened
+                    if not df_flattened.empty:
                         save_data(candidates_list, "candidates_data", st.session_state.selected_job_code, "json")
-                        st.session_state.gsheets_client.append_data_to_sheet("Candidates Data", df_flattened.to_dict('records'))
-                    else:
-                        st.session_state.candidates = df
+                        st.session_state.gsheets_client.append_data_to_sheet(
+                            "Candidates Data", df_flattened.assign(job_id=st.session_state.selected_job_id).to_dict('records'))
                 st.session_state.app_step = 2
                 st.rerun()
         else:
@@ -210,12 +269,15 @@ def display_step2_review_candidates():
         st.dataframe(filtered_df)
         if st.button("Proceed to Analysis ➡️", type="primary", disabled=is_disabled):
             st.session_state.candidates = filtered_df
+            start_resume_prefetch(filtered_df)
             st.session_state.app_step = 3
             st.rerun()
 
 def display_step3_provide_jd():
     with st.expander("✅ Step 3: Provide Job Requirements", expanded=(st.session_state.app_step == 3)):
         is_disabled = st.session_state.app_step > 3
+        if not is_disabled:
+            render_prefetch_progress()
         
         def clear_on_change():
             if st.session_state.jd_input_method == "Manual Input":
@@ -231,19 +293,36 @@ def display_step3_provide_jd():
             if uploaded_file is not None and (st.session_state.jd_file_details is None or st.session_state.jd_file_details["name"] != uploaded_file.name):
                 with st.spinner("Extracting text..."):
                     st.session_state.jd_file_details = {"name": uploaded_file.name, "size": uploaded_file.size / 1024}
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
-                        tmp.write(uploaded_file.getvalue())
-                        st.session_state.jd_text = extract_text_from_file(tmp.name)
-                    os.unlink(tmp.name)
+                    st.session_state.jd_text = extract_text_from_bytes(uploaded_file.getvalue(), os.path.splitext(uploaded_file.name)[1], source=uploaded_file.name)
                     st.success("Text extracted! Review below.")
         
         st.session_state.jd_text = st.text_area("Job Description Text:", value=st.session_state.jd_text, height=200, disabled=is_disabled, placeholder="Paste JD or upload a file...")
+        st.checkbox("Archive downloaded resumes to `run_archive/Candidates_resumes`", key="archive_resumes", disabled=is_disabled,
+                    help="Resumes are always parsed in memory; this only controls whether a copy is written to disk in the background.")
+        st.checkbox("Record a timeline trace of this run", key="trace_analysis", disabled=is_disabled,
+                    help="Saves a Chrome/Perfetto trace next to the results CSV showing each candidate's download, parsing, OCR and AI calls.")
+        if 'is_new' in st.session_state.candidates.columns:
+            st.checkbox("Only analyze new candidates (reuse earlier scores for this JD)", key="analyze_only_new", disabled=is_disabled,
+                        help="Candidates already scored against this exact job description keep their earlier score.")
+        st.checkbox("Pack several resumes into each AI request", key="batch_analysis", disabled=is_disabled,
+                    help="Sends the instructions and JD once for a group of resumes, so more resumes fit in the API's requests-per-minute limit.")
+        st.checkbox("Pre-rank resumes locally and only send the best matches to the AI", key="prerank_enabled", disabled=is_disabled,
+                    help="Scores every resume against the JD by keyword relevance (BM25) before any AI call. Candidates that are "
+                         "not sent to the AI still appear in the results with their local score.")
+        if st.session_state.prerank_enabled:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.number_input("Send only the top N resumes (0 = no limit)", min_value=0, step=10, key="prerank_top_n", disabled=is_disabled)
+            with col2:
+                st.slider("Minimum local score (best resume = 100)", 0, 100, key="prerank_min_score", disabled=is_disabled)
+            st.text_input("Required keywords (comma separated)", key="prerank_keywords", disabled=is_disabled,
+                          placeholder="e.g. python, aws, machine learning")
         
         if st.button(f"🚀 Start Analysis", type="primary", disabled=(is_disabled or not st.session_state.jd_text)):
             st.session_state.app_step = 4
             st.rerun()
 
-# --- CONCURRENT ANALYSIS FUNCTION (with Sequential Batching) ---
+# --- CONCURRENT ANALYSIS FUNCTION (Staged Pipeline) ---
 def display_step4_unfiltered_results():
     with st.expander("✅ Step 4: Raw Analysis Results", expanded=(st.session_state.app_step >= 4 and st.session_state.app_step < 6)):
         if st.session_state.app_step == 4:
@@ -251,85 +330,153 @@ def display_step4_unfiltered_results():
                 st.warning("No candidates were selected for analysis. Please go back to Step 2.")
                 return
 
-            # --- CONFIGURATION FOR BATCH PROCESSING ---
-            BATCH_SIZE_PER_KEY = 3
-            
             # --- SETUP ---
-            resume_folder_path = create_resume_folder(st.session_state.selected_job_code)
+            resume_folder_path = create_resume_folder(st.session_state.selected_job_code) if st.session_state.archive_resumes else None
             all_candidates_list = st.session_state.candidates.to_dict('records')
             total_candidates = len(all_candidates_list)
-            api_keys = st.session_state.ai_analyzer.api_keys_list
-            num_keys = len(api_keys)
-            
-            # Number of parallel workers will be the number of API keys, so each key runs its batches in parallel.
-            num_workers = num_keys 
+            ai_analyzer = st.session_state.ai_analyzer
+            # All sessions in this server process share one queue, so concurrent runs split the keys fairly.
+            job_queue = get_analysis_job_queue(len(ai_analyzer.api_keys_list) * ai_analyzer.max_in_flight_per_key)
+            st.session_state.analysis_trace = Tracer() if st.session_state.trace_analysis else None
+            jd_hash = hash_text(st.session_state.jd_text)
+            journal = AnalysisRunJournal(st.session_state.selected_job_id, jd_hash)
+            pipeline = AnalysisPipeline(ai_analyzer, st.session_state.jd_text, resume_folder_path,
+                                        job_queue=job_queue, session_id=st.session_state.session_id,
+                                        archive_resumes=st.session_state.archive_resumes,
+                                        tracer=st.session_state.analysis_trace, journal=journal,
+                                        batch_size=ai_analyzer.batch_max_resumes if st.session_state.batch_analysis else 1)
             
+            # The JD is digested into a rubric once; every resume is then scored against that.
+            with st.spinner("Compiling the scoring rubric from the job description..."):
+                rubric = ai_analyzer.compile_jd(st.session_state.jd_text)
+            if rubric:
+                with st.expander(f"Scoring rubric: {len(rubric['mandatory_requirements'])} mandatory requirements"):
+                    st.markdown("\n".join(f"- {req}" for req in rubric['mandatory_requirements']))
+                    if rubric['preferred_qualifications']:
+                        st.caption("Preferred: " + "; ".join(rubric['preferred_qualifications']))
+            else:
+                st.warning("Could not compile a scoring rubric; resumes will be scored against the full job description.")
+
             progress_bar = st.progress(0, text=f"Initializing analysis for {total_candidates} candidates...")
+            queue_status = st.empty()
             results_placeholder = st.empty()
-            analysis_results_list = []
+            # Rows stream into a columnar buffer; a retry result replaces the failure it retries.
+            results = ResultsBuffer()
 
-            # --- MODIFIED: Sequential Batch Creation Logic ---
-            st.info(f"Organizing {total_candidates} resumes into sequential batches of {BATCH_SIZE_PER_KEY}...")
-            
-            all_batches_to_run = []
-            key_index = 0
-            for i in range(0, total_candidates, BATCH_SIZE_PER_KEY):
-                # 1. Get a chunk of resumes
-                resume_chunk = all_candidates_list[i : i + BATCH_SIZE_PER_KEY]
-                
-                # 2. Assign the current key to this entire chunk
-                assigned_key = api_keys[key_index]
-                
-                # 3. Add the (chunk, key) pair to our list of work
-                all_batches_to_run.append((resume_chunk, assigned_key))
-                
-                # 4. Cycle to the next key for the *next* batch
-                key_index = (key_index + 1) % num_keys
-
-            # --- PASS 1: Initial Analysis using Batches ---
-            total_processed_count = 0
-            with ThreadPoolExecutor(max_workers=num_workers) as executor:
-                futures = {
-                    executor.submit(
-                        analyze_resume_batch, 
-                        batch_data, api_key,
-                        st.session_state.jd_text, st.session_state.ai_analyzer, resume_folder_path
-                    ): batch_data for batch_data, api_key in all_batches_to_run
-                }
+            # --- Resumes prefetched during Steps 2-3 skip download and extraction ---
+            # Whatever is still in flight is left to this run's pipeline rather than waited for.
+            prefetched_texts = {}
+            if st.session_state.resume_prefetcher is not None:
+                st.session_state.resume_prefetcher.stop()
+                prefetched_texts = st.session_state.resume_prefetcher.texts()
+                if prefetched_texts:
+                    st.caption(f"{len(prefetched_texts)} of {total_candidates} resumes were already downloaded and parsed in the background.")
 
-                for future in as_completed(futures):
-                    try:
-                        batch_results = future.result() # This is a list of results from a batch
-                        analysis_results_list.extend(batch_results)
-                        total_processed_count += len(batch_results)
-                        
-                        progress_text = f"Analyzed {total_processed_count}/{total_candidates} resumes..."
-                        progress_bar.progress(total_processed_count / total_candidates, text=progress_text)
-                        temp_df = pd.DataFrame(analysis_results_list)
-                        results_placeholder.dataframe(temp_df)
-                    except Exception as e:
-                        st.error(f"An error occurred during batch analysis: {e}")
-            
+            # --- Optional local pre-ranking: only the best lexical matches go on to the AI ---
+            local_scores, resume_texts, skipped_ids = {}, prefetched_texts, set()
+            if st.session_state.prerank_enabled:
+                def show_prerank_progress(done, total):
+                    progress_bar.progress(done / total, text=f"Pre-ranking: downloaded and parsed {done}/{total} resumes...")
+                all_candidates_list, resume_texts, skipped_results, local_scores = prerank_candidates(
+                    pipeline, all_candidates_list, parse_keywords(st.session_state.prerank_keywords),
+                    top_n=st.session_state.prerank_top_n or None, min_score=st.session_state.prerank_min_score or None,
+                    on_progress=show_prerank_progress, known_texts=prefetched_texts)
+                skipped_ids = {candidate_id_of(r, 'Candidate ID') for r in skipped_results} - {None}
+                results.extend(skipped_results)
+                st.info(f"Local pre-ranking kept {len(all_candidates_list)} of {total_candidates} candidates for AI analysis.")
+
+            # --- Reuse earlier scores for candidates already screened against this JD ---
+            store = get_candidate_store()
+            candidates_to_analyze = all_candidates_list
+            if st.session_state.analyze_only_new:
+                prior_scores = store.load_scores(st.session_state.selected_job_id, jd_hash)
+                candidates_to_analyze, reused_results = partition_by_prior_scores(all_candidates_list, prior_scores)
+                results.extend(reused_results)
+                st.info(f"Reusing {len(reused_results)} earlier scores; {len(candidates_to_analyze)} candidates need analysis.")
+
+            # --- Resume an interrupted run: keep journaled results, retry journaled failures ---
+            journaled_results, candidates_to_analyze, journaled_failures = journal.plan(candidates_to_analyze)
+            if journaled_results or journaled_failures:
+                results.extend(journaled_results)
+                st.info(f"Resuming an earlier run: {len(journaled_results)} results kept, {len(journaled_failures)} failures "
+                        f"will be retried, {len(candidates_to_analyze)} candidates still to analyze.")
+
+            st.info(f"Streaming {len(candidates_to_analyze)} resumes through {pipeline.download_workers} download, "
+                    f"{pipeline.extract_workers} extraction and {pipeline.llm_workers} AI workers...")
+
+            # --- Initial pass through the staged pipeline, then one retry pass for failures on fresh keys ---
+            retry_status = st.empty()
+            in_retry_pass = False
+
+            def refresh_live_view():
+                # Everything here is redrawn at most once per RESULTS_REFRESH_S, not once per result.
+                if in_retry_pass:
+                    retry_status.caption(f"Retry pass: {results.failed_count} candidates still failing after retrying on fresh keys.")
+                if pipeline_health_slot is not None:
+                    render_pipeline_health(pipeline_health_slot, len(results), results.failed_count)
+                progress_bar.progress(min(1.0, len(results) / total_candidates), text=f"Analyzed {len(results)}/{total_candidates} resumes...")
+                queue_progress = job_queue.progress(st.session_state.session_id)
+                queue_status.caption(f"Shared AI queue: {queue_progress['active_sessions']} active session(s), "
+                                     f"{queue_progress['queued_total']} calls waiting ({queue_progress['queued']} yours), "
+                                     f"{queue_progress['running']} of yours running.")
+                render_live_results(results_placeholder, results)
+
+            last_refresh = 0.0
+            for result, run_pass, row_key in pipeline.run_with_retry(candidates_to_analyze, retry_candidates=journaled_failures, texts=resume_texts):
+                if local_scores:
+                    result['Local Score'] = local_scores.get(candidate_id_of(result, 'Candidate ID'))
+                results.add(result, row_key)
+                in_retry_pass = run_pass == "retry"
+                if time.monotonic() - last_refresh >= RESULTS_REFRESH_S:
+                    refresh_live_view()
+                    last_refresh = time.monotonic()
+            refresh_live_view()
+
+            analysis_results_list = results.rows()
+            if pipeline.compaction_totals['resumes']:
+                st.caption(describe_reduction(pipeline.compaction_totals))
+            if local_scores:
+                for result in analysis_results_list:
+                    if result.get('Local Score') is None:
+                        result['Local Score'] = local_scores.get(candidate_id_of(result, 'Candidate ID'))
+            # Candidates the pre-ranking kept from the AI have no real score to reuse later.
+            scored = [r for r in analysis_results_list if not is_failed_result(r) and candidate_id_of(r, 'Candidate ID') not in skipped_ids]
+            store.save_scores(st.session_state.selected_job_id, jd_hash, scored)
+            metrics.registry.write_textfile()
             st.session_state.analysis_results = pd.DataFrame(analysis_results_list)
-            st.success("All resume batches have been analyzed!")
+            st.success("All resumes have been analyzed!")
             st.session_state.app_step = 5
-            # NOTE: Retry logic would need to be re-integrated here if desired. For clarity, it's omitted.
             st.rerun()
             
         if st.session_state.app_step >= 5:
             df_results = st.session_state.analysis_results.sort_values(by="Score (%)", ascending=False)
             
             if not st.session_state.get('analysis_saved', False):
-                save_data(df_results, "candidates_analyzed_scores", st.session_state.selected_job_code, "csv")
-                st.session_state.gsheets_client.append_data_to_sheet("AI Analysis Results", df_results.to_dict('records'))
+                csv_path = save_data(df_results, "candidates_analyzed_scores", st.session_state.selected_job_code, "csv")
+                if csv_path and st.session_state.analysis_trace is not None:
+                    trace_path = st.session_state.analysis_trace.write(trace_path_for(csv_path))
+                    if trace_path:
+                        st.info(f"Timeline trace saved to `{trace_path}`. Open it in ui.perfetto.dev or chrome://tracing.")
+                    st.session_state.analysis_trace = None
+                st.session_state.gsheets_client.append_data_to_sheet(
+                    "AI Analysis Results", df_results.assign(job_id=st.session_state.selected_job_id).to_dict('records'))
                 st.session_state.analysis_saved = True
 
             st.info("This table shows the complete, unfiltered results of the AI analysis, sorted by score.")
-            st.dataframe(df_results)
+            if len(df_results) > RESULTS_PAGE_SIZE:
+                # Big runs are shown a page at a time instead of sending every row to the browser at once.
+                page_count = (len(df_results) - 1) // RESULTS_PAGE_SIZE + 1
+                page_number = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+                start = (page_number - 1) * RESULTS_PAGE_SIZE
+                st.dataframe(df_results.iloc[start:start + RESULTS_PAGE_SIZE])
+            else:
+                st.dataframe(df_results)
             st.markdown("---")
             col1, col2 = st.columns([1, 2])
             with col1:
                 if st.button("🔄 Re-run Full Analysis"):
+                    # Start over rather than resuming from this run's journal.
+                    AnalysisRunJournal(st.session_state.selected_job_id, hash_text(st.session_state.jd_text)).archive()
                     st.session_state.analysis_results = pd.DataFrame()
                     st.session_state.finalized_candidates = pd.DataFrame()
                     st.session_state.analysis_saved = False
@@ -399,32 +546,39 @@ def display_step6_final_review():
         st.dataframe(st.session_state.finalized_candidates[['Candidate Name', 'Candidate ID', 'Final Status', 'AI Remarks']])
         st.markdown("---")
         if st.button(f"🚀 Submit {len(st.session_state.finalized_candidates)} Decisions to Darwinbox", type="primary"):
-            upload_errors, success_count = [], 0
+            upload_errors, success_count, skipped_count = [], 0, 0
             progress_bar = st.progress(0, text="Initializing submission...")
             status_text = st.empty()
-            finalized_list = list(st.session_state.finalized_candidates.iterrows())
-            total_count = len(finalized_list)
-            job_identifier = st.session_state.selected_job_id
-            for i, (_, row) in enumerate(finalized_list):
-                candidate_id, candidate_name, decision = row['Candidate ID'], row['Candidate Name'], row['Final Status']
-                status_text.text(f"Processing {i+1}/{total_count}: {candidate_name} -> {decision}")
-                success, message = False, ""
-                if decision == 'Selected':
-                    success, message = st.session_state.db_client.shortlist_candidate(candidate_id=candidate_id, job_id=job_identifier)
-                elif decision == 'Rejected':
-                    rejection_tag = row['AI Remarks'] if pd.notna(row['AI Remarks']) and row['AI Remarks'].strip() else "Rejected based on screening"
-                    success, message = st.session_state.db_client.reject_candidate(candidate_id=candidate_id, job_id=job_identifier, reason_tag=rejection_tag)
-                if success: success_count += 1
-                else: upload_errors.append(f"Failed on '{candidate_name}': {message}")
+            decisions = [
+                {
+                    'candidate_id': row['Candidate ID'],
+                    'candidate_name': row['Candidate Name'],
+                    'decision': row['Final Status'],
+                    'reason': row['AI Remarks'] if pd.notna(row['AI Remarks']) and row['AI Remarks'].strip() else None,
+                }
+                for row in st.session_state.finalized_candidates.to_dict('records')
+            ]
+            total_count = len(decisions)
+            # Decisions already confirmed by an earlier (possibly interrupted) submission are skipped.
+            submitter = DecisionSubmitter(st.session_state.db_client, st.session_state.selected_job_id)
+            for i, outcome in enumerate(submitter.submit_all(decisions)):
+                status_text.text(f"Processed {i+1}/{total_count}: {outcome['candidate_name']} -> {outcome['decision']} ({outcome['status']})")
+                if outcome['status'] == 'submitted': success_count += 1
+                elif outcome['status'] == 'skipped': skipped_count += 1
+                else: upload_errors.append(f"Failed on '{outcome['candidate_name']}': {outcome['message']}")
                 progress_bar.progress((i + 1) / total_count)
             status_text.empty()
             st.success(f"Action completed for {success_count} candidate(s).")
+            if skipped_count:
+                st.info(f"Skipped {skipped_count} candidate(s) already confirmed in an earlier submission.")
             if upload_errors:
                 st.error("The following errors occurred:")
                 st.json(upload_errors)
 
 # --- Main Application Logic ---
 init_session_state()
+if st.secrets.get("METRICS_PORT"):
+    metrics.start_metrics_server(int(st.secrets["METRICS_PORT"]))  # No-op after the first run
 display_sidebar()
 st.header("🤖 Darwinbox AI Resume Analyzer")
 
@@ -0,0 +1 @@
+# Offline benchmark suite: stub services, synthetic resumes and the runner (run_benchmark.py).
@@ -0,0 +1,133 @@
+"""
+Synthetic resume corpus for the benchmark: plain text, DOCX, text PDFs and scanned
+(image-only) PDFs, generated from a seed so runs are comparable.
+"""
+import io
+import random
+
+SKILLS = [
+    "Python", "SQL", "Django", "React", "AWS", "Docker", "Kubernetes", "Pandas", "Spark", "Java",
+    "Go", "Terraform", "Airflow", "TensorFlow", "PyTorch", "Excel", "Tableau", "Salesforce", "Figma", "Linux",
+]
+ROLES = ["Software Engineer", "Data Analyst", "Backend Developer", "Product Designer", "DevOps Engineer", "Data Scientist"]
+COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella Labs", "Hooli", "Stark Industries", "Wayne Tech"]
+FIRST_NAMES = ["Aarav", "Diya", "Rohan", "Ananya", "Vikram", "Meera", "Kabir", "Isha", "Arjun", "Priya"]
+LAST_NAMES = ["Sharma", "Reddy", "Iyer", "Nair", "Gupta", "Patel", "Rao", "Menon", "Das", "Khan"]
+
+CONTENT_TYPES = {
+    ".txt": "text/plain",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pdf": "application/pdf",
+}
+# Kinds the corpus can produce, mapped to the file extension they are served as.
+KINDS = {"txt": ".txt", "docx": ".docx", "pdf": ".pdf", "scanned_pdf": ".pdf"}
+DEFAULT_MIX = {"pdf": 0.6, "docx": 0.2, "txt": 0.1, "scanned_pdf": 0.1}
+
+JOB_DESCRIPTION = (
+    "We are hiring a Backend Developer to build data-heavy services.\n"
+    "Requirements: 3+ years of Python, SQL and Django; experience with AWS, Docker and Kubernetes.\n"
+    "Nice to have: Spark, Airflow, Terraform. Strong communication and ownership expected."
+)
+
+
+def resume_text(rng: random.Random, name: str, experience_entries: int = 4) -> str:
+    lines = [name, f"{rng.choice(ROLES)} | {name.split()[0].lower()}@example.com | +91 90000 {rng.randint(10000, 99999)}", ""]
+    lines.append("SUMMARY")
+    lines.append(f"{rng.randint(1, 12)} years of experience building products with {', '.join(rng.sample(SKILLS, 3))}.")
+    lines.append("")
+    lines.append("EXPERIENCE")
+    for _ in range(experience_entries):
+        start = rng.randint(2010, 2022)
+        lines.append(f"{rng.choice(ROLES)} at {rng.choice(COMPANIES)} ({start} - {start + rng.randint(1, 3)})")
+        for _ in range(3):
+            lines.append(f"- Delivered {rng.choice(['APIs', 'dashboards', 'pipelines', 'features'])} using "
+                         f"{rng.choice(SKILLS)} and {rng.choice(SKILLS)}, improving throughput by {rng.randint(5, 60)}%.")
+    lines.append("")
+    lines.append("SKILLS")
+    lines.append(", ".join(rng.sample(SKILLS, 8)))
+    lines.append("")
+    lines.append("EDUCATION")
+    lines.append(f"B.Tech, Computer Science, {rng.choice(['IIT Madras', 'NIT Warangal', 'BITS Pilani', 'VIT'])}")
+    return "\n".join(lines)
+
+
+def make_docx(text: str) -> bytes:
+    import docx
+    document = docx.Document()
+    for line in text.splitlines():
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_text_pdf(text: str) -> bytes:
+    import fitz
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 545, 800), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_scanned_pdf(text: str) -> bytes:
+    """A PDF with no text layer: the resume is rendered, rasterised and embedded as an image."""
+    import fitz
+    rendered = fitz.open("pdf", make_text_pdf(text))
+    pixmap = rendered[0].get_pixmap(dpi=150)
+    rendered.close()
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=pixmap.tobytes("png"))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_resume(kind: str, text: str) -> bytes:
+    if kind == "txt":
+        return text.encode("utf-8")
+    if kind == "docx":
+        return make_docx(text)
+    if kind == "pdf":
+        return make_text_pdf(text)
+    if kind == "scanned_pdf":
+        return make_scanned_pdf(text)
+    raise ValueError(f"Unknown resume kind: {kind}")
+
+
+def build_corpus(count: int, mix: dict = None, seed: int = 7):
+    """
+    Returns a list of `count` dicts with name, kind, filename, data and content_type.
+    `mix` maps kinds (see KINDS) to relative weights.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    corpus = []
+    for i in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        extension = KINDS[kind]
+        corpus.append({
+            "name": name,
+            "kind": kind,
+            "filename": f"resume_{i:05d}{extension}",
+            "data": make_resume(kind, resume_text(rng, name)),
+            "content_type": CONTENT_TYPES[extension],
+        })
+    return corpus
+
+
+def parse_mix(spec: str) -> dict:
+    """Parses "pdf=0.6,docx=0.2,txt=0.1,scanned_pdf=0.1" into a weight dict."""
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown resume kind '{kind}'; expected one of {', '.join(KINDS)}")
+        mix[kind] = float(weight or 1)
+    return mix
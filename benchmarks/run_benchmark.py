@@ -0,0 +1,319 @@
+"""
+Offline benchmark for the screening pipeline.
+
+Starts local stand-ins for Darwinbox, Mistral and the resume file host (see stub_servers.py),
+points the app at them through a throwaway `.streamlit/secrets.toml`, and measures:
+
+  * text extraction per file type (cache disabled),
+  * the sequential per-candidate path (`analyze_single_resume`),
+  * the end-to-end staged pipeline (candidate fetch + `AnalysisPipeline.run`),
+
+reporting resumes/min, p50/p95/p99 latencies per stage and peak RSS. Each of the three runs in
+its own process, so the peak RSS reported for it is that phase's alone. Everything runs in a
+temporary directory, so caches and run_archive start cold and the real ones are untouched; the
+extracted-text cache is also cleared between phases.
+
+    python benchmarks/run_benchmark.py --candidates 200 --llm-latency-ms 800 --rate-limit-ratio 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.corpus import build_corpus, parse_mix, JOB_DESCRIPTION, DEFAULT_MIX
+from benchmarks.stub_servers import StubConfig, make_darwinbox_stub, make_mistral_stub, make_file_stub
+
+BENCHMARK_JOB_ID = "bench-job-1"
+STAGE_NAMES = ("download_stage", "extract_stage", "compact_stage", "llm_stage", "llm_batch_stage")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(name, durations_s, items=None, wall_s=None):
+    line = (f"  {name:<28} n={len(durations_s):<5} p50={percentile(durations_s, 50) * 1000:8.1f}ms "
+            f"p95={percentile(durations_s, 95) * 1000:8.1f}ms p99={percentile(durations_s, 99) * 1000:8.1f}ms")
+    if items and wall_s:
+        line += f"  {items / wall_s * 60:8.1f} resumes/min"
+    print(line)
+    return {
+        "n": len(durations_s),
+        "p50_ms": percentile(durations_s, 50) * 1000,
+        "p95_ms": percentile(durations_s, 95) * 1000,
+        "p99_ms": percentile(durations_s, 99) * 1000,
+        "resumes_per_min": items / wall_s * 60 if items and wall_s else None,
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its (finished) children, in MB."""
+    # ru_maxrss is in KB on Linux and bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2**20
+    return own, children
+
+
+def write_secrets(workdir, darwinbox_url, mistral_url, num_keys, requests_per_minute, window_days):
+    secrets = {
+        "DARWINBOX_SUBDOMAIN": "benchmark",
+        "DARWINBOX_BASE_URL": darwinbox_url,
+        "DARWINBOX_CANDIDATE_WINDOW_DAYS": window_days,
+        "MISTRAL_ENDPOINT": f"{mistral_url}/v1/chat/completions",
+        "MISTRAL_REQUESTS_PER_MINUTE": requests_per_minute,
+    }
+    for suffix in ("USERNAME_GET_JOBS", "PASSWORD_GET_JOBS", "API_KEY_GET_JOBS",
+                   "USERNAME_GET_CANDIDATES", "PASSWORD_GET_CANDIDATES", "API_KEY_GET_CANDIDATES",
+                   "USERNAME_UPDATE_SCORE", "PASSWORD_UPDATE_SCORE", "API_KEY_SHORTLIST", "API_KEY_REJECT"):
+        secrets[f"DARWINBOX_{suffix}"] = "benchmark"
+    for i in range(1, num_keys + 1):
+        secrets[f"MISTRAL_API_KEY_{i}"] = f"bench-key-{i}"
+
+    os.makedirs(os.path.join(workdir, ".streamlit"), exist_ok=True)
+    with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+        for key, value in secrets.items():
+            f.write(f"{key} = {json.dumps(value)}\n")
+
+
+def build_candidates(corpus, file_base_url):
+    return [{
+        "id": f"cand-{i:05d}",
+        "unique_id": f"cand-{i:05d}",
+        "firstname": entry["name"].split()[0],
+        "lastname": entry["name"].split()[1],
+        "status": "Applied",
+        "application_data": {"Resume": {"Resume": f"{file_base_url}/resumes/{entry['filename']}"}},
+    } for i, entry in enumerate(corpus)]
+
+
+class StageTimer:
+    """
+    Wraps the module-level stage functions in modules.analysis_pipeline to record per-call durations,
+    and when each candidate entered the first stage (`entered`, by candidate id). In packed mode
+    `llm_batch_stage` is timed once per pack.
+    """
+
+    def __init__(self, pipeline_module):
+        self.module = pipeline_module
+        self.durations = defaultdict(list)
+        self.entered = {}
+        self._lock = threading.Lock()
+        self._originals = {}
+
+    def _wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            if name == "download_stage":
+                self.entered[str(args[0]['result']['Candidate ID'])] = started
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.durations[name].append(time.perf_counter() - started)
+        return timed
+
+    def __enter__(self):
+        for name in STAGE_NAMES:
+            self._originals[name] = getattr(self.module, name)
+            setattr(self.module, name, self._wrap(name, self._originals[name]))
+        return self
+
+    def __exit__(self, *exc):
+        for name, fn in self._originals.items():
+            setattr(self.module, name, fn)
+
+
+def bench_extraction(corpus):
+    from utils.file_processor import extract_text_from_file
+    print("\nText extraction from files (cache disabled):")
+    files_dir = os.path.join("run_archive", "bench_files")
+    os.makedirs(files_dir, exist_ok=True)
+    paths = []
+    for entry in corpus:
+        path = os.path.join(files_dir, entry["filename"])
+        with open(path, "wb") as f:
+            f.write(entry["data"])
+        paths.append(path)
+    by_kind = defaultdict(list)
+    started = time.perf_counter()
+    for entry, path in zip(corpus, paths):
+        t0 = time.perf_counter()
+        extract_text_from_file(path, use_cache=False)
+        by_kind[entry["kind"]].append(time.perf_counter() - t0)
+    wall = time.perf_counter() - started
+    report = {kind: summarize(kind, durations) for kind, durations in sorted(by_kind.items())}
+    report["all"] = summarize("all", [d for ds in by_kind.values() for d in ds], len(corpus), wall)
+    return report
+
+
+def bench_sequential(candidates, jd_text, ai_analyzer, limit):
+    from modules.analysis_pipeline import analyze_single_resume
+    print(f"\nSequential analyze_single_resume ({min(limit, len(candidates))} candidates):")
+    durations = []
+    started = time.perf_counter()
+    for cand in candidates[:limit]:
+        t0 = time.perf_counter()
+        analyze_single_resume(cand, jd_text, ai_analyzer, None)
+        durations.append(time.perf_counter() - t0)
+    return summarize("analyze_single_resume", durations, len(durations), time.perf_counter() - started)
+
+
+def bench_pipeline(db_client, jd_text, ai_analyzer, args):
+    import modules.analysis_pipeline as analysis_pipeline
+    from utils.candidate_data import candidates_to_dataframe
+    from utils.analysis_cache import AnalysisCache
+
+    print("\nEnd-to-end pipeline:")
+    t0 = time.perf_counter()
+    raw_candidates = db_client.get_candidates_for_job(BENCHMARK_JOB_ID)
+    candidates = candidates_to_dataframe(raw_candidates).to_dict("records")
+    fetch_s = time.perf_counter() - t0
+    print(f"  fetched {len(candidates)} candidates in {fetch_s * 1000:.0f}ms")
+
+    ai_analyzer.cache = AnalysisCache(os.path.join("run_archive", "cache", "pipeline_analysis_results.sqlite3"))
+    pipeline = analysis_pipeline.AnalysisPipeline(
+        ai_analyzer, jd_text, os.path.join("run_archive", "bench_resumes"),
+        download_workers=args.download_workers, extract_workers=args.extract_workers,
+        archive_resumes=args.archive, llm_workers=args.llm_workers, batch_size=args.batch_size,
+    )
+    failed = 0
+    latencies = []
+    with StageTimer(analysis_pipeline) as timer:
+        started = time.perf_counter()
+        for result in pipeline.run(candidates):
+            failed += analysis_pipeline.is_failed_result(result)
+            # Per candidate: from entering the download stage until its result comes out.
+            entered = timer.entered.get(str(result.get('Candidate ID')))
+            if entered is not None:
+                latencies.append(time.perf_counter() - entered)
+        wall = time.perf_counter() - started
+    report = {"fetch_ms": fetch_s * 1000, "failed": failed, "wall_s": wall}
+    for name in STAGE_NAMES:
+        if name != "llm_batch_stage" or args.batch_size > 1:
+            report[name] = summarize(name, timer.durations[name])
+    report["pipeline"] = summarize("end-to-end per candidate", latencies, len(candidates), wall)
+    print(f"  {failed} failed of {len(candidates)}")
+    return report
+
+
+def run_phase(phase, corpus, candidates, args):
+    """Runs one benchmark phase. Called in a fresh process, so the peak RSS it reports is this phase's alone."""
+    from modules.darwinbox_client import DarwinboxClient
+    from modules.ai_analyzer import AIAnalyzer
+
+    if phase == "extraction":
+        report = bench_extraction(corpus)
+    elif phase == "sequential":
+        report = bench_sequential(
+            [dict(c, name=f"{c['firstname']} {c['lastname']}", candidate_unique_id=c["unique_id"],
+                  darwinbox_resume_url=c["application_data"]["Resume"]["Resume"]) for c in candidates],
+            JOB_DESCRIPTION, AIAnalyzer(), args.sequential_limit)
+    else:
+        report = bench_pipeline(DarwinboxClient(), JOB_DESCRIPTION, AIAnalyzer(), args)
+    # Pools are shut down without waiting; children only count towards RUSAGE_CHILDREN once reaped.
+    for child in multiprocessing.active_children():
+        child.join(timeout=30)
+    own_rss, children_rss = peak_rss_mb()
+    print(f"  peak RSS: {own_rss:.0f} MB (phase process), {children_rss:.0f} MB (largest child process)")
+    sys.stdout.flush()
+    return report, {"self": own_rss, "children": children_rss}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the screening pipeline against local stub services.")
+    parser.add_argument("--candidates", type=int, default=100)
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="Resume kinds and weights, e.g. pdf=0.6,docx=0.2,txt=0.1,scanned_pdf=0.1")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keys", type=int, default=3, help="Number of fake Mistral API keys.")
+    parser.add_argument("--requests-per-minute", type=int, default=600, help="Per-key rate given to the key scheduler.")
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--llm-jitter-ms", type=float, default=150)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of Mistral calls answered with 429.")
+    parser.add_argument("--retry-after-s", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1, help="Resumes packed into each Mistral request in the pipeline run.")
+    parser.add_argument("--malformed-ratio", type=float, default=0.0, help="Fraction of packed Mistral entries returned malformed.")
+    parser.add_argument("--darwinbox-latency-ms", type=float, default=200)
+    parser.add_argument("--file-latency-ms", type=float, default=50)
+    parser.add_argument("--payload-padding-bytes", type=int, default=0, help="Extra bytes per candidate in BulkCandidatesData.")
+    parser.add_argument("--window-days", type=int, default=0,
+                        help="DARWINBOX_CANDIDATE_WINDOW_DAYS; the stub ignores dates, so >0 repeats the payload per window.")
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--extract-workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--llm-workers", type=int, default=None)
+    parser.add_argument("--sequential-limit", type=int, default=20, help="Candidates to run through the sequential path.")
+    parser.add_argument("--archive", action="store_true", help="Also archive resumes to disk during the pipeline run.")
+    parser.add_argument("--skip", action="append", default=[], choices=["extraction", "sequential", "pipeline"])
+    parser.add_argument("--json", help="Also write the report as JSON to this path.")
+    parser.add_argument("--keep-workdir", action="store_true")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+    print(f"Building {args.candidates} synthetic resumes...")
+    corpus = build_corpus(args.candidates, parse_mix(args.mix), args.seed)
+
+    files = {entry["filename"]: (entry["data"], entry["content_type"]) for entry in corpus}
+    file_server = make_file_stub(files, StubConfig(latency_ms=args.file_latency_ms, seed=args.seed)).start()
+    candidates = build_candidates(corpus, file_server.base_url)
+    jobs = [{"job_id": BENCHMARK_JOB_ID, "job_code": "BENCH-1", "job_title": "Backend Developer"}]
+    darwinbox = make_darwinbox_stub(jobs, candidates, StubConfig(latency_ms=args.darwinbox_latency_ms, seed=args.seed),
+                                    application_padding_bytes=args.payload_padding_bytes).start()
+    mistral = make_mistral_stub(StubConfig(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                                           rate_limit_ratio=args.rate_limit_ratio, retry_after_s=args.retry_after_s,
+                                           seed=args.seed), seed=args.seed, malformed_ratio=args.malformed_ratio).start()
+
+    workdir = tempfile.mkdtemp(prefix="darwinbox-bench-")
+    write_secrets(workdir, darwinbox.base_url, mistral.base_url, args.keys, args.requests_per_minute, args.window_days)
+    # Streamlit reads .streamlit/secrets.toml and the caches live under run_archive, both relative to the cwd.
+    os.chdir(workdir)
+
+    report = {"config": vars(args), "peak_rss_mb": {}}
+    try:
+        for phase in ("extraction", "sequential", "pipeline"):
+            if phase in args.skip:
+                continue
+            # Every phase starts with a cold text cache, so an earlier phase's extractions don't flatter a later one.
+            shutil.rmtree(os.path.join("run_archive", "cache", "extracted_text"), ignore_errors=True)
+            # The stubs stay in this process; the phase reaches them over HTTP like the app would.
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                report[phase], report["peak_rss_mb"][phase] = executor.submit(run_phase, phase, corpus, candidates, args).result()
+        report["stub_requests"] = {
+            "darwinbox": darwinbox.status_counts, "mistral": mistral.status_counts, "files": file_server.status_counts,
+        }
+        print(f"\nMistral stub responses: {mistral.status_counts}")
+    finally:
+        for server in (file_server, darwinbox, mistral):
+            server.stop()
+        os.chdir(REPO_ROOT)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+        else:
+            print(f"Work directory kept at {workdir}")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
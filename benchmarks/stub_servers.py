@@ -0,0 +1,194 @@
+"""
+Local HTTP stand-ins for Darwinbox, Mistral and resume file hosting.
+
+Each stub runs a ThreadingHTTPServer on localhost in a background thread. Latency,
+429 injection and payload sizes are configurable so the benchmark can reproduce
+slow or throttled upstreams without spending real API quota.
+"""
+import re
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    """Knobs shared by all stubs. Latencies are in milliseconds."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_limit_ratio=0.0, retry_after_s=1, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio  # Fraction of requests answered with 429
+        self.retry_after_s = retry_after_s
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sleep(self):
+        with self._lock:
+            delay_ms = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) if self.jitter_ms else self.latency_ms
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+    def should_rate_limit(self):
+        with self._lock:
+            return self._random.random() < self.rate_limit_ratio
+
+
+class _StubServer:
+    """Runs a request handler class on a free localhost port until `stop()`."""
+
+    def __init__(self, handler_class):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.request_count = 0
+        self.status_counts = {}
+        self._count_lock = threading.Lock()
+        self.httpd.stub = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def count(self, status):
+        with self._count_lock:
+            self.request_count += 1
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def _send(self, status, body: bytes, content_type="application/json", headers=None):
+        self.server.stub.count(status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+
+def make_darwinbox_stub(jobs, candidates, config=None, application_padding_bytes=0):
+    """
+    Serves the JobsApiv3 endpoints the app uses. `candidates` are returned by every
+    BulkCandidatesData call (windows are not filtered); `application_padding_bytes`
+    inflates each candidate's application_data to simulate heavy payloads.
+    """
+    padding = "x" * application_padding_bytes
+
+    class DarwinboxHandler(_JsonHandler):
+        def do_POST(self):
+            self.config.sleep()
+            self._read_json()
+            if self.path.endswith("/Joblist"):
+                self._send_json(200, {"status": 1, "data": jobs})
+            elif self.path.endswith("/BulkCandidatesData"):
+                data = candidates
+                if padding:
+                    data = [dict(c, application_data=dict(c.get("application_data", {}), Padding=padding)) for c in candidates]
+                self._send_json(200, {"status": 1, "data": data})
+            elif self.path.endswith("/candidatetag") or self.path.endswith("/RejectCandidate"):
+                self._send_json(200, {"status": 1, "message": "ok"})
+            else:
+                self._send_json(404, {"status": 0, "message": f"Unknown endpoint {self.path}"})
+
+    DarwinboxHandler.config = config or StubConfig()
+    return _StubServer(DarwinboxHandler)
+
+
+def make_mistral_stub(config=None, seed=0, malformed_ratio=0.0):
+    """
+    Serves /v1/chat/completions with a random but well-formed verdict, injecting 429s per config.
+    Packed prompts (several <RESUME candidate_id="..."> blocks) get one entry per resume, and
+    `malformed_ratio` of those entries come back without a score. Prompts without a resume
+    are JD rubric compilations and get a fixed rubric.
+    """
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def verdict():
+        with rng_lock:
+            score = rng.randint(0, 100)
+        return {
+            "overall_score": score,
+            "key_strengths": ["Synthetic strength"],
+            "key_weaknesses": ["Synthetic weakness"],
+            "summary": f"Synthetic verdict with score {score}.",
+        }
+
+    class MistralHandler(_JsonHandler):
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self._send_json(404, {"message": f"Unknown endpoint {self.path}"})
+                return
+            payload = self._read_json()
+            if self.config.should_rate_limit():
+                self._send_json(429, {"message": "Requests rate limit exceeded"},
+                                headers={"Retry-After": str(self.config.retry_after_s)})
+                return
+            self.config.sleep()
+            prompt = "".join(m.get("content", "") for m in payload.get("messages", []))
+            candidate_ids = re.findall(r'<RESUME candidate_id="([^"]*)">', prompt)
+            if "<RESUME_TEXT>" not in prompt and not candidate_ids:
+                content = {  # JD rubric compilation
+                    "role_title": "Backend Developer",
+                    "mandatory_requirements": ["3+ years of Python", "REST API design", "SQL databases"],
+                    "preferred_qualifications": ["AWS", "Docker"],
+                    "min_years_experience": 3,
+                }
+            elif candidate_ids:
+                entries = []
+                for candidate_id in candidate_ids:
+                    entry = dict(verdict(), candidate_id=candidate_id)
+                    with rng_lock:
+                        if rng.random() < malformed_ratio:
+                            del entry["overall_score"]
+                    entries.append(entry)
+                content = {"results": entries}
+            else:
+                content = verdict()
+            self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": json.dumps(content)}}]})
+
+    MistralHandler.config = config or StubConfig()
+    return _StubServer(MistralHandler)
+
+
+def make_file_stub(files, config=None):
+    """Serves GET /resumes/<name> from `files` ({name: (bytes, content_type)})."""
+
+    class FileHandler(_JsonHandler):
+        def do_GET(self):
+            self.config.sleep()
+            name = self.path.rsplit("/", 1)[-1]
+            if name not in files:
+                self._send(404, b"<html><body>Not found</body></html>", content_type="text/html")
+                return
+            data, content_type = files[name]
+            self._send(200, data, content_type=content_type)
+
+    FileHandler.config = config or StubConfig()
+    return _StubServer(FileHandler)
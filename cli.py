@@ -0,0 +1,268 @@
+"""
+Headless entry point for the screening pipeline, for scheduled or bulk runs on a server.
+
+Reads the same `.streamlit/secrets.toml` as the app (run it from the project root) and
+writes to the same `run_archive` folders. Examples:
+
+    python cli.py jobs
+    python cli.py screen --job-code JOB-123 --jd jd.pdf --workers 6
+    python cli.py screen --job-code JOB-123 --jd jd.txt --only-new --submit --shortlist-min-score 75
+    python cli.py screen --job-code JOB-123 --jd jd.pdf --prerank --top-n 200 --require python
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+import pandas as pd
+
+from modules.darwinbox_client import DarwinboxClient
+from modules.ai_analyzer import AIAnalyzer
+from modules.analysis_pipeline import AnalysisPipeline, is_failed_result, candidate_id_of, DEFAULT_DOWNLOAD_WORKERS, DEFAULT_EXTRACT_WORKERS
+from modules.decision_submitter import DecisionSubmitter
+from modules.run_journal import AnalysisRunJournal
+from modules.prerank import prerank_candidates, parse_keywords
+from modules.results_buffer import ResultsBuffer
+from utils.file_processor import extract_text_from_file
+from utils.file_saver import save_data, create_resume_folder
+from utils.gsheets_client import GSheetsClient
+from utils.candidate_store import get_candidate_store, sync_candidates, partition_by_prior_scores
+from utils.candidate_data import candidates_to_dataframe
+from utils.analysis_cache import hash_text
+from utils import metrics
+from utils.tracing import Tracer, trace_path_for
+from utils.text_compaction import describe_reduction
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def cmd_jobs(args):
+    jobs = DarwinboxClient().get_jobs()
+    if not jobs:
+        print("No open jobs returned by Darwinbox.", file=sys.stderr)
+        return 1
+    for job in jobs:
+        print(f"{job['job_code']}\t{job['job_id']}\t{job['job_title']}")
+    return 0
+
+
+def cmd_screen(args):
+    if args.jd:
+        jd_text = extract_text_from_file(args.jd)
+        if jd_text.startswith("Error:"):
+            print(f"Could not read JD from {args.jd}: {jd_text}", file=sys.stderr)
+            return 1
+    else:
+        jd_text = args.jd_text
+    if not jd_text or not jd_text.strip():
+        print("The job description is empty.", file=sys.stderr)
+        return 1
+
+    db_client = DarwinboxClient()
+    ai_analyzer = AIAnalyzer()
+    gsheets_client = None if args.no_sheets else GSheetsClient()
+
+    # --- Job and candidates ---
+    jobs = db_client.get_jobs()
+    job = next((j for j in jobs if str(j.get('job_code')) == args.job_code), None)
+    if job is None:
+        print(f"No open job with code {args.job_code}. Use `python cli.py jobs` to list them.", file=sys.stderr)
+        return 1
+    job_id, job_code = job['job_id'], job['job_code']
+    print(f"Job: {job['job_title']} ({job_code})")
+
+    started = time.monotonic()
+    candidates_list, new_keys, watermark = sync_candidates(db_client, job_id, incremental=not args.full_sync)
+    candidates_df = candidates_to_dataframe(candidates_list, new_keys)
+    print(f"Fetched {len(candidates_df)} candidates ({len(new_keys)} new"
+          f"{f' since {watermark:%d-%m-%Y %H:%M}' if watermark else ''}) in {_format_duration(time.monotonic() - started)}.")
+    if candidates_df.empty:
+        return 0
+    save_data(candidates_list, "candidates_data", job_code, "json")
+    if gsheets_client:
+        gsheets_client.append_data_to_sheet("Candidates Data", candidates_df.assign(job_id=job_id).to_dict('records'))
+    if args.status and 'status' in candidates_df.columns:
+        candidates_df = candidates_df[candidates_df['status'].isin(args.status)]
+        print(f"{len(candidates_df)} candidates match status {', '.join(args.status)}.")
+        if candidates_df.empty:
+            return 0
+
+    # --- Analysis ---
+    all_candidates = candidates_df.to_dict('records')
+    store = get_candidate_store()
+    jd_hash = hash_text(jd_text)
+    journal = AnalysisRunJournal(job_id, jd_hash)
+    pipeline = AnalysisPipeline(
+        ai_analyzer, jd_text, None if args.no_archive else create_resume_folder(job_code),
+        download_workers=args.download_workers, extract_workers=args.extract_workers,
+        archive_resumes=not args.no_archive, llm_workers=args.workers,
+        tracer=Tracer() if args.trace else None, journal=journal, batch_size=args.batch_size,
+    )
+    results = []
+
+    # Optional local pre-ranking: only the best lexical matches go on to the AI.
+    local_scores, prerank_texts, skipped_ids = {}, None, set()
+    if args.prerank:
+        print(f"Pre-ranking {len(all_candidates)} resumes locally...")
+        all_candidates, prerank_texts, skipped_results, local_scores = prerank_candidates(
+            pipeline, all_candidates, [k for raw in args.require or [] for k in parse_keywords(raw)],
+            top_n=args.top_n, min_score=args.min_local_score)
+        skipped_ids = {candidate_id_of(r, 'Candidate ID') for r in skipped_results} - {None}
+        results.extend(skipped_results)
+        print(f"Pre-ranking kept {len(all_candidates)} candidates for AI analysis, skipped {len(skipped_results)}.")
+
+    candidates_to_analyze = all_candidates
+    if args.only_new:
+        candidates_to_analyze, reused_results = partition_by_prior_scores(all_candidates, store.load_scores(job_id, jd_hash))
+        results.extend(reused_results)
+        print(f"Reusing {len(reused_results)} earlier scores.")
+
+    # Pick up where an interrupted run for this job + JD left off, unless asked not to.
+    if args.fresh:
+        journal.archive()
+    journaled_results, candidates_to_analyze, journaled_failures = journal.plan(candidates_to_analyze)
+    if journaled_results or journaled_failures:
+        results.extend(journaled_results)
+        print(f"Resuming an earlier run: {len(journaled_results)} results kept, {len(journaled_failures)} failures to retry.")
+    # A retry result replaces the failure it retries.
+    buffer = ResultsBuffer()
+    buffer.extend(results)
+
+    rubric = ai_analyzer.compile_jd(jd_text)
+    if rubric:
+        print(f"Scoring rubric ({len(rubric['mandatory_requirements'])} mandatory requirements):")
+        for requirement in rubric['mandatory_requirements']:
+            print(f"  - {requirement}")
+    else:
+        print("Could not compile a scoring rubric; scoring against the full job description.", file=sys.stderr)
+    total = len(candidates_to_analyze) + len(journaled_failures)
+    print(f"Analyzing {total} resumes with {pipeline.download_workers} download, "
+          f"{pipeline.extract_workers} extraction and {pipeline.llm_workers} AI workers...")
+    analysis_started = time.monotonic()
+    done = 0
+    retried = 0
+    for result, run_pass, row_key in pipeline.run_with_retry(candidates_to_analyze, retry_candidates=journaled_failures, texts=prerank_texts):
+        buffer.add(result, row_key)
+        if run_pass == "retry":
+            retried += 1
+            continue
+        done += 1
+        if done % args.progress_every == 0 or done == len(candidates_to_analyze):
+            elapsed = time.monotonic() - analysis_started
+            print(f"[{done:>{len(str(total))}}/{total}] {done / elapsed * 60:6.1f} resumes/min, "
+                  f"{buffer.failed_count} failed, elapsed {_format_duration(elapsed)}", flush=True)
+    analysis_elapsed = time.monotonic() - analysis_started
+    results = buffer.rows()
+    if local_scores:
+        for result in results:
+            if result.get('Local Score') is None:
+                result['Local Score'] = local_scores.get(candidate_id_of(result, 'Candidate ID'))
+    failed = buffer.failed_count
+    if retried:
+        print(f"Retried {retried} failed resumes on fresh keys; {failed} still failed.")
+
+    store.save_scores(job_id, jd_hash, [r for r in results if not is_failed_result(r) and candidate_id_of(r, 'Candidate ID') not in skipped_ids])
+    df_results = pd.DataFrame(results).sort_values(by="Score (%)", ascending=False)
+    csv_path = save_data(df_results, "candidates_analyzed_scores", job_code, "csv")
+    if gsheets_client:
+        gsheets_client.append_data_to_sheet("AI Analysis Results", df_results.assign(job_id=job_id).to_dict('records'))
+
+    cache_stats = ai_analyzer.cache.stats()
+    print(f"\nAnalyzed {total} resumes in {_format_duration(analysis_elapsed)} "
+          f"({total / analysis_elapsed * 60 if analysis_elapsed else 0:.1f} resumes/min), {failed} failed.")
+    print(f"AI result cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses.")
+    if pipeline.compaction_totals['resumes']:
+        print(describe_reduction(pipeline.compaction_totals))
+    for key_stats in ai_analyzer.scheduler.stats():
+        print(f"  key {key_stats['key']}: {key_stats['requests']} requests, {key_stats['rate_limited']} rate-limited, "
+              f"avg latency {key_stats['latency_s']}s")
+    for stage in metrics.registry.histogram_summary("screening_pipeline_stage_seconds", group_by="stage"):
+        print(f"  stage {stage['group']}: p50 {stage['p50_s']:.2f}s, p95 {stage['p95_s']:.2f}s over {stage['count']} items")
+    metrics.registry.write_textfile()
+    print(f"Results: {csv_path}")
+    if pipeline.tracer and csv_path:
+        print(f"Trace: {pipeline.tracer.write(trace_path_for(csv_path))}")
+    print(f"Metrics: {metrics.METRICS_TEXTFILE_PATH}")
+
+    # --- Optional submission to Darwinbox ---
+    if args.submit:
+        decisions = []
+        for row in df_results.to_dict('records'):
+            cand_id = candidate_id_of(row, 'Candidate ID')
+            if is_failed_result(row) or cand_id is None or cand_id in skipped_ids:
+                continue  # No AI score to decide on, or no id to submit it under
+            if args.shortlist_min_score is not None and row['Score (%)'] >= args.shortlist_min_score:
+                decisions.append({'candidate_id': row['Candidate ID'], 'candidate_name': row['Candidate Name'], 'decision': 'Selected'})
+            elif args.reject_max_score is not None and row['Score (%)'] <= args.reject_max_score:
+                decisions.append({'candidate_id': row['Candidate ID'], 'candidate_name': row['Candidate Name'],
+                                  'decision': 'Rejected', 'reason': row.get('AI Remarks')})
+        counts = {'submitted': 0, 'skipped': 0, 'failed': 0}
+        for outcome in DecisionSubmitter(db_client, job_id).submit_all(decisions):
+            counts[outcome['status']] += 1
+            if outcome['status'] == 'failed':
+                print(f"  failed: {outcome['candidate_name']} -> {outcome['decision']}: {outcome['message']}", file=sys.stderr)
+        print(f"Decisions: {counts['submitted']} submitted, {counts['skipped']} already confirmed, {counts['failed']} failed.")
+
+    # Sheets writes happen in the background; don't exit before they are done.
+    if gsheets_client and not gsheets_client.flush(timeout=120):
+        print("Warning: Google Sheets writes did not finish within 2 minutes.", file=sys.stderr)
+    if gsheets_client and gsheets_client.last_error:
+        print(gsheets_client.last_error, file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Darwinbox AI resume screening, without the Streamlit UI.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show per-file INFO logs.")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port while running.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("jobs", help="List open jobs.").set_defaults(func=cmd_jobs)
+
+    screen = subparsers.add_parser("screen", help="Fetch, analyze and save candidates for one job.")
+    screen.set_defaults(func=cmd_screen)
+    screen.add_argument("--job-code", required=True, help="Darwinbox job code (see `jobs`).")
+    jd = screen.add_mutually_exclusive_group(required=True)
+    jd.add_argument("--jd", help="Job description file (PDF, DOCX, TXT or image).")
+    jd.add_argument("--jd-text", help="Job description text.")
+    screen.add_argument("--status", action="append", help="Only analyze candidates with this status (repeatable).")
+    screen.add_argument("--full-sync", action="store_true", help="Fetch the full lookback period instead of only new candidates.")
+    screen.add_argument("--fresh", action="store_true", help="Ignore the journal of an interrupted run and analyze everyone again.")
+    screen.add_argument("--only-new", action="store_true", help="Reuse earlier scores for candidates already screened against this JD.")
+    screen.add_argument("--prerank", action="store_true", help="Rank resumes locally (BM25) first and only send the best to the AI.")
+    screen.add_argument("--top-n", type=int, default=None, help="With --prerank: send at most this many resumes to the AI.")
+    screen.add_argument("--min-local-score", type=float, default=None, help="With --prerank: skip resumes below this local score (best = 100).")
+    screen.add_argument("--require", action="append", help="With --prerank: keyword(s) every resume must contain, comma separated (repeatable).")
+    screen.add_argument("--workers", type=int, default=None, help="AI analysis workers (default: 2 per Mistral key).")
+    screen.add_argument("--batch-size", type=int, default=1,
+                        help="Resumes packed into each Mistral request (default 1 = one per request).")
+    screen.add_argument("--download-workers", type=int, default=DEFAULT_DOWNLOAD_WORKERS)
+    screen.add_argument("--extract-workers", type=int, default=DEFAULT_EXTRACT_WORKERS)
+    screen.add_argument("--no-archive", action="store_true", help="Don't write resumes to run_archive/Candidates_resumes.")
+    screen.add_argument("--no-sheets", action="store_true", help="Don't push results to Google Sheets.")
+    screen.add_argument("--trace", action="store_true", help="Write a Chrome/Perfetto timeline trace next to the results CSV.")
+    screen.add_argument("--progress-every", type=int, default=10, help="Print a progress line every N resumes.")
+    screen.add_argument("--submit", action="store_true", help="Submit decisions to Darwinbox using the score thresholds below.")
+    screen.add_argument("--shortlist-min-score", type=int, default=None, help="Shortlist candidates scoring at least this.")
+    screen.add_argument("--reject-max-score", type=int, default=None, help="Reject candidates scoring at most this.")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # file_processor configures INFO logging on import; that's one line per resume, too much for a batch run.
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    if args.metrics_port:
+        metrics.start_metrics_server(args.metrics_port)
+    if not os.path.exists(os.path.join(".streamlit", "secrets.toml")):
+        print("Warning: .streamlit/secrets.toml not found in the current directory.", file=sys.stderr)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,109 +1,471 @@
 import streamlit as st
 import requests
+import re
 import json
 import logging
 import time
+import threading
 from random import uniform
+from modules.key_scheduler import KeyScheduler, DEFAULT_REQUESTS_PER_MINUTE, DEFAULT_MAX_IN_FLIGHT_PER_KEY
+from utils.analysis_cache import AnalysisCache, hash_text
+from utils.http_client import PooledHttpClient
+from utils.text_compaction import estimate_tokens, DEFAULT_RESUME_TOKEN_BUDGET
+from utils import metrics, tracing
 
 logger = logging.getLogger(__name__)
 
-class AIAnalyzer:
-    def __init__(self):
-        # REMOVED: Key pool, lock, and cooldown logic.
-        # Now it just holds a simple list of keys like in Application 2.
-        self.api_keys_list = [key for key in [
-            st.secrets.get("MISTRAL_API_KEY_1"),
-            st.secrets.get("MISTRAL_API_KEY_2"),
-            st.secrets.get("MISTRAL_API_KEY_3")
-        ] if key]
-        if not self.api_keys_list:
-            raise ValueError("No Mistral API keys found in secrets.toml")
-        
-        self.endpoint = "https://api.mistral.ai/v1/chat/completions"
-        self.model = "mistral-medium-latest"
+# Bump PROMPT_VERSION whenever the templates change so cached verdicts from the old prompt are not reused.
+PROMPT_VERSION = "2"
+# Bump RUBRIC_PROMPT_VERSION whenever RUBRIC_PROMPT_TEMPLATE changes so cached rubrics are compiled again.
+RUBRIC_PROMPT_VERSION = "1"
+# After a failed rubric compilation, runs started within this long score against the raw JD without trying again.
+RUBRIC_RETRY_AFTER_S = 300
 
-    # REMOVED: The get_available_key() and set_key_cooldown() methods.
+# Run once per JD: turns it into the rubric every resume is scored against.
+RUBRIC_PROMPT_TEMPLATE = """
+        You are a world-class, meticulous HR recruitment analyst. Read the JOB DESCRIPTION below and compile the hiring rubric that every candidate for this job will be scored against.
 
-    # MODIFIED: This function now accepts an `api_key` directly and contains the retry logic.
-    def analyze_resume(self, resume_text, job_description, api_key):
-        """
-        Analyzes a resume using a specific API key with retry logic inspired by Application 2.
-        """
-        
-        prompt = f"""
-        You are a world-class, meticulous HR recruitment analyst. Your task is to perform a detailed, critical analysis of the provided RESUME against the JOB DESCRIPTION.
+        1. Identify the 3-6 most critical mandatory requirements (e.g., years of experience, specific technologies like 'React' or 'SQL', required licenses, educational degrees). Phrase each one so it can be checked against a resume.
+        2. List up to 5 preferred (nice-to-have) qualifications.
+        3. State the minimum years of relevant experience, or null if the JD does not ask for any.
 
-        Follow these steps in your reasoning:
-        1. **Deconstruct the Job Description:** Identify the 3-5 most critical mandatory requirements (e.g., years of experience, specific technologies like 'React' or 'SQL', required licenses, educational degrees).
-        2. **Scan the Resume:** Systematically search the resume for explicit evidence matching each of these critical requirements. Do not make assumptions.
-        3. **Evaluate the Match:** For each requirement, determine if it is a strong match, a partial match, or a clear gap.
-        4. **Calculate a Score:** Assign a quantitative score that reflects this evaluation. A perfect match on all critical requirements is 100. **Significantly penalize the score (e.g., below 50) if a mandatory requirement is clearly missing.**
-        5. **Generate Remarks:** Formulate a concise summary based on your findings, broken down into specific strengths and weaknesses.
-
-        You MUST return your response as a single, valid JSON object and nothing else. Do not include any introductory text like "Here is the JSON object:".
+        You MUST return your response as a single, valid JSON object and nothing else.
 
         <JSON_STRUCTURE>
         {{
-            "overall_score": <integer from 0 to 100>,
-            "key_strengths": [
-                "<A specific skill or experience that is a strong match. (e.g., '5+ years of experience in Python matches requirement')>",
-                "<Another strong match>"
-            ],
-            "key_weaknesses": [
-                "<A specific skill or requirement that is missing or weak. (e.g., 'Lacks the required PMP certification')>",
-                "<Another gap>"
-            ],
-            "summary": "<A 1-2 sentence conclusion that justifies the score based on the strengths and weaknesses.>"
+            "role_title": "<job title>",
+            "mandatory_requirements": ["<checkable requirement>", "<another>"],
+            "preferred_qualifications": ["<nice-to-have>"],
+            "min_years_experience": <number or null>
         }}
         </JSON_STRUCTURE>
 
         <JOB_DESCRIPTION>
         {job_description}
         </JOB_DESCRIPTION>
+        """
+
+# System message shared by every scoring request for a job. It only depends on the rubric, so it is
+# byte-for-byte identical across candidates (single and packed) and providers can prefix-cache it.
+SCORING_SYSTEM_TEMPLATE = """
+        You are a world-class, meticulous HR recruitment analyst. Your task is to perform a detailed, critical analysis of resumes against the hiring criteria below.
+
+        Follow these steps in your reasoning, for each resume:
+        1. **Use the Criteria:** If a RUBRIC is given, its mandatory requirements are the complete list of what is required; do not add requirements of your own. If a JOB_DESCRIPTION is given instead, first identify its 3-5 most critical mandatory requirements.
+        2. **Scan the Resume:** Systematically search the resume for explicit evidence matching each of these critical requirements. Do not make assumptions.
+        3. **Evaluate the Match:** For each requirement, determine if it is a strong match, a partial match, or a clear gap.
+        4. **Calculate a Score:** Assign a quantitative score that reflects this evaluation. A perfect match on all critical requirements is 100. **Significantly penalize the score (e.g., below 50) if a mandatory requirement is clearly missing.** Preferred qualifications only move the score a little.
+        5. **Generate Remarks:** Formulate a concise summary based on your findings, broken down into specific strengths and weaknesses.
+
+        You MUST return your response as a single, valid JSON object in the structure the user message asks for, and nothing else. Do not include any introductory text like "Here is the JSON object:".
+
+        {criteria}
+        """
+
+RESULT_FIELDS = """
+                    "overall_score": <integer from 0 to 100>,
+                    "key_strengths": ["<A specific skill or experience that is a strong match. (e.g., '5+ years of experience in Python matches requirement')>", "<Another strong match>"],
+                    "key_weaknesses": ["<A specific skill or requirement that is missing or weak. (e.g., 'Lacks the required PMP certification')>", "<Another gap>"],
+                    "summary": "<A 1-2 sentence conclusion that justifies the score based on the strengths and weaknesses.>"
+"""
+
+SINGLE_RESUME_TEMPLATE = """
+        Analyze this resume.
+
+        <JSON_STRUCTURE>
+        {{""" + RESULT_FIELDS + """        }}
+        </JSON_STRUCTURE>
 
         <RESUME_TEXT>
         {resume_text}
         </RESUME_TEXT>
         """
+
+# Packed mode: several resumes share one request and one copy of the criteria.
+BATCH_RESUMES_TEMPLATE = """
+        Analyze EACH of the {count} resumes below on its own; do not compare candidates with each other. Return exactly one entry in "results" per resume, using the candidate_id from its RESUME tag.
+
+        <JSON_STRUCTURE>
+        {{
+            "results": [
+                {{
+                    "candidate_id": "<candidate_id of the resume>",""" + RESULT_FIELDS + """                }}
+            ]
+        }}
+        </JSON_STRUCTURE>
+
+        <RESUMES>
+        {resumes}
+        </RESUMES>
+        """
+DEFAULT_BATCH_MAX_RESUMES = 6
+# Estimated input tokens of resume text per packed request; the prompt and JD come on top.
+DEFAULT_BATCH_TOKEN_BUDGET = 16000
+
+def pack_resumes(resumes, max_resumes, token_budget):
+    """Groups (candidate id, text) pairs, in order, into packs within both limits. An oversized resume gets a pack of its own."""
+    packs, current, current_tokens = [], [], 0
+    for cand_id, resume_text in resumes:
+        tokens = estimate_tokens(resume_text)
+        if current and (len(current) >= max_resumes or current_tokens + tokens > token_budget):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append((cand_id, resume_text))
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def _validate_rubric(rubric):
+    """The rubric in a normalized shape, or None if the model's answer is not usable."""
+    if not isinstance(rubric, dict):
+        return None
+    mandatory = [str(r).strip() for r in rubric.get("mandatory_requirements") or [] if str(r).strip()]
+    if not mandatory:
+        return None
+    preferred = rubric.get("preferred_qualifications") or []
+    min_years = rubric.get("min_years_experience")
+    return {
+        "role_title": str(rubric.get("role_title") or "").strip(),
+        "mandatory_requirements": mandatory,
+        "preferred_qualifications": [str(p).strip() for p in preferred if str(p).strip()] if isinstance(preferred, list) else [],
+        "min_years_experience": min_years if isinstance(min_years, (int, float)) else None,
+    }
+
+def render_rubric(rubric: dict) -> str:
+    """The rubric as prompt text. Deterministic, so every request for the job shares the same prefix."""
+    lines = ["<RUBRIC>"]
+    if rubric.get("role_title"):
+        lines.append(f"Role: {rubric['role_title']}")
+    if rubric.get("min_years_experience") is not None:
+        lines.append(f"Minimum relevant experience: {rubric['min_years_experience']:g} years")
+    lines.append("Mandatory requirements:")
+    lines.extend(f"{i}. {req}" for i, req in enumerate(rubric["mandatory_requirements"], start=1))
+    if rubric.get("preferred_qualifications"):
+        lines.append("Preferred qualifications:")
+        lines.extend(f"- {pref}" for pref in rubric["preferred_qualifications"])
+    lines.append("</RUBRIC>")
+    return "\n".join(lines)
+
+def _failure_result(summary, keys_tried):
+    return {"overall_score": 0, "key_strengths": [], "key_weaknesses": [], "summary": summary, "keys_tried": keys_tried,
+            "failed": True}
+
+def _validate_entry(entry):
+    """A packed result entry in analyze_resume's shape, or None if it is not usable."""
+    if not isinstance(entry, dict) or not isinstance(entry.get("summary"), str) or not entry["summary"].strip():
+        return None
+    try:
+        score = int(entry.get("overall_score"))
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= score <= 100:
+        return None
+    strengths, weaknesses = entry.get("key_strengths", []), entry.get("key_weaknesses", [])
+    if not isinstance(strengths, list) or not isinstance(weaknesses, list):
+        return None
+    return {"overall_score": score, "key_strengths": strengths, "key_weaknesses": weaknesses, "summary": entry["summary"]}
+
+def _parse_batch_entries(content, expected_ids):
+    """{candidate id: result} for every valid entry in a packed response; anything else is left out."""
+    try:
+        parsed = json.loads(content)
+    except (TypeError, ValueError):
+        return {}
+    entries = parsed.get("results") if isinstance(parsed, dict) else parsed
+    results = {}
+    for entry in entries if isinstance(entries, list) else []:
+        cand_id = str(entry.get("candidate_id")) if isinstance(entry, dict) else None
+        result = _validate_entry(entry)
+        if cand_id in expected_ids and result is not None and cand_id not in results:
+            results[cand_id] = result
+    return results
+
+def _parse_retry_after(response):
+    """Returns the Retry-After header in seconds, or None if it is missing or not a number."""
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def load_mistral_api_keys():
+    """Collects every MISTRAL_API_KEY_<n> secret, ordered by n."""
+    numbered_keys = []
+    for name in st.secrets.keys():
+        match = re.fullmatch(r"MISTRAL_API_KEY_(\d+)", name)
+        if match and st.secrets[name]:
+            numbered_keys.append((int(match.group(1)), st.secrets[name]))
+    return [key for _, key in sorted(numbered_keys)]
+
+@st.cache_resource
+def get_shared_key_scheduler(api_keys: tuple, requests_per_minute: float, max_in_flight_per_key: int) -> KeyScheduler:
+    """One scheduler per server process, so every session's requests count against the same per-key limits."""
+    return KeyScheduler(list(api_keys), requests_per_minute=requests_per_minute, max_in_flight_per_key=max_in_flight_per_key)
+
+class AIAnalyzer:
+    def __init__(self):
+        self.api_keys_list = load_mistral_api_keys()
+        if not self.api_keys_list:
+            raise ValueError("No Mistral API keys found in secrets.toml")
         
+        self.endpoint = st.secrets.get("MISTRAL_ENDPOINT", "https://api.mistral.ai/v1/chat/completions")
+        self.model = "mistral-medium-latest"
+        self.cache = AnalysisCache()
+        # Shared by every worker in every session, so each request goes to whichever key has capacity right now.
+        self.max_in_flight_per_key = int(st.secrets.get("MISTRAL_MAX_IN_FLIGHT_PER_KEY", DEFAULT_MAX_IN_FLIGHT_PER_KEY))
+        self.scheduler = get_shared_key_scheduler(
+            tuple(self.api_keys_list),
+            float(st.secrets.get("MISTRAL_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE)),
+            self.max_in_flight_per_key,
+        )
+        # Pool sized to the most requests that can be in flight at once. Only connection failures are
+        # retried at the transport level; 429s and other statuses go through the scheduler logic below.
+        self.http = PooledHttpClient(
+            pool_size=len(self.api_keys_list) * self.max_in_flight_per_key,
+            timeout=float(st.secrets.get("MISTRAL_TIMEOUT_S", 120)),
+            status_forcelist=None,
+            retry_methods=frozenset({"POST"}),
+            name="mistral",
+        )
+        # Packed mode limits (see analyze_batch); the pipeline only packs when asked to.
+        self.batch_max_resumes = int(st.secrets.get("MISTRAL_BATCH_MAX_RESUMES", DEFAULT_BATCH_MAX_RESUMES))
+        self.batch_token_budget = int(st.secrets.get("MISTRAL_BATCH_TOKEN_BUDGET", DEFAULT_BATCH_TOKEN_BUDGET))
+        # Resume text beyond this many estimated tokens is trimmed before prompting (0 disables trimming).
+        self.resume_token_budget = int(st.secrets.get("RESUME_TOKEN_BUDGET", DEFAULT_RESUME_TOKEN_BUDGET))
+        # JD hash -> (rubric or None, when it was compiled); one compilation per JD however many workers ask.
+        self._rubrics = {}
+        # One lock per JD hash, so a slow compilation only holds up the workers scoring that JD.
+        self._rubric_locks = {}
+        self._rubric_locks_lock = threading.Lock()
+
+    def _rubric_lock(self, jd_hash):
+        with self._rubric_locks_lock:
+            return self._rubric_locks.setdefault(jd_hash, threading.Lock())
+
+    def compile_jd(self, job_description):
+        """
+        Returns the scoring rubric for a JD: its mandatory requirements, preferred qualifications
+        and minimum experience, compiled by the model once and cached by JD hash (in memory and
+        in the analysis cache). Returns None if it could not be compiled; scoring then falls
+        back to the raw JD.
+
+        Call this before a run starts. Scoring only uses what the last call decided (see
+        scoring_criteria), so a run never switches between rubric and raw-JD scoring partway
+        through. A failed compilation is tried again by a run started RUBRIC_RETRY_AFTER_S later.
+        """
+        jd_hash = hash_text(job_description)
+        with self._rubric_lock(jd_hash):
+            known = self._rubrics.get(jd_hash)
+            if known and (known[0] is not None or time.monotonic() - known[1] < RUBRIC_RETRY_AFTER_S):
+                return known[0]
+            rubric = self.cache.get_rubric(job_description, self.model, RUBRIC_PROMPT_VERSION)
+            if rubric is None:
+                prompt = RUBRIC_PROMPT_TEMPLATE.format(job_description=job_description)
+                with tracing.span("compile JD rubric", category="llm"):
+                    status, content, _ = self._request([{"role": "user", "content": prompt}])
+                try:
+                    rubric = _validate_rubric(json.loads(content)) if status == "ok" else None
+                except (TypeError, ValueError):
+                    rubric = None
+                if rubric is not None:
+                    self.cache.put_rubric(job_description, self.model, RUBRIC_PROMPT_VERSION, rubric)
+                    logger.info(f"Compiled a rubric with {len(rubric['mandatory_requirements'])} mandatory requirements for JD {jd_hash[:12]}.")
+                else:
+                    logger.warning(f"Could not compile a rubric for JD {jd_hash[:12]} ({status}); scoring against the raw JD.")
+            self._rubrics[jd_hash] = (rubric, time.monotonic())
+            return rubric
+
+    def scoring_criteria(self, job_description) -> str:
+        """
+        What resumes are actually scored against: the rendered rubric, or the raw JD if there is none.
+        Uses the outcome of the last compile_jd call for this JD as is; it only compiles if none was made yet.
+        """
+        known = self._rubrics.get(hash_text(job_description))
+        rubric = known[0] if known else self.compile_jd(job_description)
+        return render_rubric(rubric) if rubric else f"<JOB_DESCRIPTION>\n{job_description}\n</JOB_DESCRIPTION>"
+
+    @staticmethod
+    def _scoring_messages(criteria, user_content):
+        """[system, user] messages; the system part depends only on the criteria, so it is a stable prefix."""
+        return [
+            {"role": "system", "content": SCORING_SYSTEM_TEMPLATE.format(criteria=criteria)},
+            {"role": "user", "content": user_content},
+        ]
+
+    def analyze_resume(self, resume_text, job_description, api_key=None, exclude_keys=()):
+        """
+        Analyzes a resume against the job description's rubric (see compile_jd).
+
+        By default every attempt asks the key scheduler for the key with the most spare capacity,
+        so a 429 on one key moves the retry to another. Passing `api_key` pins all attempts to that key;
+        `exclude_keys` steers attempts away from keys that already failed this resume (used by retries).
+        Failure results carry the masked keys they went through in 'keys_tried'.
+        """
+        # Verdicts are cached against the criteria the model saw, so rubric and raw-JD verdicts never mix.
+        criteria = self.scoring_criteria(job_description)
+        cached_result = self.cache.get(resume_text, criteria, self.model, PROMPT_VERSION)
+        if cached_result is not None:
+            metrics.inc("screening_llm_analyses_total", outcome="cached")
+            return cached_result
+
+        messages = self._scoring_messages(criteria, SINGLE_RESUME_TEMPLATE.format(resume_text=resume_text))
+        status, content, keys_tried = self._request(messages, api_key, exclude_keys)
+        result = None
+        if status == "ok":
+            # A bad reply fails only this resume; it may be the last one split out of a packed request.
+            try:
+                result = _validate_entry(json.loads(content))
+            except (TypeError, ValueError):
+                result = None
+            if result is None:
+                status, content = "malformed", "AI analysis failed: the model returned an unusable response."
+            else:
+                self.cache.put(resume_text, criteria, self.model, PROMPT_VERSION, result)
+        if result is None:
+            result = _failure_result(content, keys_tried)
+        metrics.inc("screening_llm_analyses_total", outcome=status)
+        return result
+
+    def analyze_batch(self, resumes, job_description, exclude_keys=()):
+        """
+        Analyzes several resumes with as few requests as possible. `resumes` is a list of
+        (candidate id, resume text); returns {candidate id: result} with the same result
+        shape as analyze_resume.
+
+        Cached resumes are answered locally; the rest are packed into requests of at most
+        `batch_max_resumes` resumes and `batch_token_budget` estimated tokens, so the analyst
+        prompt and the scoring criteria are sent once per pack instead of once per resume.
+        """
+        criteria = self.scoring_criteria(job_description)
+        results, pending = {}, []
+        for cand_id, resume_text in resumes:
+            cached_result = self.cache.get(resume_text, criteria, self.model, PROMPT_VERSION)
+            if cached_result is not None:
+                metrics.inc("screening_llm_analyses_total", outcome="cached")
+                results[cand_id] = cached_result
+            else:
+                pending.append((cand_id, resume_text))
+        for pack in pack_resumes(pending, self.batch_max_resumes, self.batch_token_budget):
+            results.update(self._analyze_pack(pack, job_description, exclude_keys))
+        return results
+
+    def _analyze_pack(self, pack, job_description, exclude_keys=()):
+        """One packed request. Entries that come back missing or malformed are split in half and retried."""
+        if len(pack) == 1:
+            cand_id, resume_text = pack[0]
+            return {cand_id: self.analyze_resume(resume_text, job_description, exclude_keys=exclude_keys)}
+
+        resumes_block = "\n".join(f'<RESUME candidate_id="{cand_id}">\n{resume_text}\n</RESUME>' for cand_id, resume_text in pack)
+        criteria = self.scoring_criteria(job_description)
+        messages = self._scoring_messages(criteria, BATCH_RESUMES_TEMPLATE.format(resumes=resumes_block, count=len(pack)))
+        with tracing.span("packed request", category="llm", resumes=len(pack)):
+            status, content, keys_tried = self._request(messages, exclude_keys=exclude_keys)
+
+        if status != "ok":
+            if status in ("client_error", "malformed"):
+                # Most likely the pack was too large for the model, or its reply was cut off; smaller packs may go through.
+                return self._split_and_retry(pack, job_description, exclude_keys)
+            metrics.inc("screening_llm_analyses_total", len(pack), outcome=status)
+            return {cand_id: _failure_result(content, keys_tried) for cand_id, _ in pack}
+
+        entries = _parse_batch_entries(content, {cand_id for cand_id, _ in pack})
+        results, malformed = {}, []
+        for cand_id, resume_text in pack:
+            result = entries.get(cand_id)
+            if result is None:
+                malformed.append((cand_id, resume_text))
+                continue
+            self.cache.put(resume_text, criteria, self.model, PROMPT_VERSION, result)
+            results[cand_id] = result
+        metrics.inc("screening_llm_analyses_total", len(results), outcome="ok")
+        metrics.inc("screening_llm_batch_entries_total", len(results), outcome="ok")
+        if malformed:
+            metrics.inc("screening_llm_batch_entries_total", len(malformed), outcome="malformed")
+            logger.warning(f"{len(malformed)} of {len(pack)} packed results were missing or malformed; retrying them.")
+            results.update(self._split_and_retry(malformed, job_description, exclude_keys))
+        return results
+
+    def _split_and_retry(self, pack, job_description, exclude_keys):
+        middle = (len(pack) + 1) // 2
+        results = {}
+        for half in (pack[:middle], pack[middle:]):
+            if half:
+                results.update(self._analyze_pack(half, job_description, exclude_keys))
+        return results
+
+    def _request(self, messages, api_key=None, exclude_keys=()):
+        """
+        Sends one chat completion, retrying 429s and network errors on the best available key.
+        Returns (status, content, keys_tried): status 'ok' with the message content, or
+        'client_error' / 'malformed' / 'failed' with a summary of what went wrong.
+        """
         payload = {
             "model": self.model,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
             "response_format": {"type": "json_object"},
             "temperature": 0.1,
         }
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
 
-        # NEW: Retry logic copied from Application 2. It will retry with the SAME key.
-        attempts = 3
+        attempts = 5
         initial_backoff = 2.0
+        keys_tried = []
         for attempt in range(attempts):
+            if api_key:
+                key = api_key
+            else:
+                # Time spent here is the rate limit at work: every key is out of tokens, cooling down or busy.
+                with metrics.timed("screening_llm_key_wait_seconds"), tracing.span("wait for key", category="llm"):
+                    key = self.scheduler.acquire(exclude=exclude_keys)
+            if metrics.mask_key(key) not in keys_tried:
+                keys_tried.append(metrics.mask_key(key))
+            headers = {
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            }
+            started = time.monotonic()
             try:
-                response = requests.post(self.endpoint, headers=headers, json=payload, timeout=120)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    content = data['choices'][0]['message']['content']
-                    return json.loads(content)
-                
-                elif response.status_code == 429: # Rate limit error
-                    wait_s = (initial_backoff * (2 ** attempt)) + uniform(0, 1)
-                    logger.warning(f"Rate limit hit on key ...{api_key[-4:]}. Attempt {attempt + 1}/{attempts}. Retrying in {wait_s:.2f}s...")
-                    time.sleep(wait_s)
-                    continue # Try again with the SAME key
-
-                else:
-                    logger.error(f"Mistral API Client Error ({response.status_code}): {response.text}")
-                    return {"overall_score": 0, "key_strengths": [], "key_weaknesses": [], "summary": f"API Client Error: {response.status_code} - {response.text}"}
-
+                with tracing.span(f"LLM attempt {attempt + 1}", category="llm", key=metrics.mask_key(key)) as trace_args:
+                    response = self.http.post(self.endpoint, headers=headers, json=payload)
+                    trace_args["status"] = response.status_code
             except requests.exceptions.RequestException as e:
+                latency_s = time.monotonic() - started
+                metrics.observe("screening_llm_request_seconds", latency_s, key=metrics.mask_key(key), status="network_error")
+                if not api_key:
+                    self.scheduler.report(key, latency_s=latency_s)
                 wait_s = (initial_backoff * (2 ** attempt)) + uniform(0, 1)
-                logger.warning(f"Request exception on key ...{api_key[-4:]}: {e}. Retrying in {wait_s:.2f}s.")
-                time.sleep(wait_s)
+                logger.warning(f"Request exception on key ...{key[-4:]}: {e}. Retrying in {wait_s:.2f}s.")
+                metrics.inc("screening_llm_backoff_seconds_total", wait_s)
+                with tracing.span("sleep", category="backoff", reason="network error", key=metrics.mask_key(key)):
+                    time.sleep(wait_s)
                 continue
 
-        return {"overall_score": 0, "key_strengths": [], "key_weaknesses": [], "summary": "AI analysis failed after multiple retries."}
\ No newline at end of file
+            latency_s = time.monotonic() - started
+            metrics.observe("screening_llm_request_seconds", latency_s, key=metrics.mask_key(key), status=response.status_code)
+            retry_after_s = _parse_retry_after(response) if response.status_code == 429 else None
+            if not api_key:
+                self.scheduler.report(key, response.status_code, latency_s, retry_after_s)
+
+            if response.status_code == 200:
+                try:
+                    return "ok", response.json()['choices'][0]['message']['content'], keys_tried
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    # A 200 without a usable completion (HTML from a proxy, truncated body, no choices).
+                    logger.error(f"Unusable Mistral response on key ...{key[-4:]}: {e!r}")
+                    return "malformed", "AI analysis failed: the API returned an unusable response.", keys_tried
+
+            elif response.status_code == 429: # Rate limit error
+                logger.warning(f"Rate limit hit on key ...{key[-4:]}. Attempt {attempt + 1}/{attempts}.")
+                metrics.inc("screening_llm_rate_limited_total", key=metrics.mask_key(key))
+                if api_key:
+                    # Pinned key: nothing to switch to, so wait out the limit on the same key.
+                    wait_s = retry_after_s or (initial_backoff * (2 ** attempt)) + uniform(0, 1)
+                    metrics.inc("screening_llm_backoff_seconds_total", wait_s)
+                    with tracing.span("sleep", category="backoff", reason="429", key=metrics.mask_key(key)):
+                        time.sleep(wait_s)
+                continue # The scheduler keeps the throttled key cooling down and picks another one
+
+            else:
+                logger.error(f"Mistral API Client Error ({response.status_code}): {response.text}")
+                return "client_error", f"API Client Error: {response.status_code} - {response.text}", keys_tried
+
+        return "failed", "AI analysis failed after multiple retries.", keys_tried
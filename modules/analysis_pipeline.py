@@ -0,0 +1,494 @@
+import os
+import math
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.file_processor import download_to_memory, extract_text_from_bytes, configure_download_pool
+from utils.file_saver import archive_file_async
+from utils.file_types import sniff_file_type
+from utils.ocr_engine import configure_nested_ocr
+from utils.text_compaction import compact_resume_text, describe_reduction, DEFAULT_RESUME_TOKEN_BUDGET
+from utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# --- Default concurrency per stage ---
+# Downloads are network-bound, extraction/OCR is CPU-bound and LLM calls are bound by the API keys,
+# so each stage gets its own pool sized for what actually limits it.
+DEFAULT_DOWNLOAD_WORKERS = 8
+DEFAULT_EXTRACT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Compaction is a few milliseconds of string work per resume; two threads keep up with any extraction pool.
+DEFAULT_COMPACT_WORKERS = 2
+# More workers than keys, so a request is always waiting when the key scheduler frees up capacity.
+DEFAULT_LLM_WORKERS_PER_KEY = 2
+# Max items waiting between two stages. Keeps a fast stage from racing far ahead of a slow one.
+STAGE_QUEUE_SIZE = 16
+# In packed mode, how long an AI worker waits for more extracted resumes to fill its pack.
+BATCH_FILL_WAIT_S = 0.5
+
+_STAGE_DONE = object()  # Sentinel that flows down the pipeline once a stage has drained
+
+
+def is_failed_result(result):
+    """True for result rows marked failed where they were built (see mark_failed): the analysis did not actually happen."""
+    return result.get('Analysis Status') == 'failed'
+
+
+def mark_failed(result, remarks):
+    """Records on a result row that its analysis did not happen, and why. The remarks are only for people to read."""
+    result['AI Remarks'] = remarks
+    result['Analysis Status'] = 'failed'
+    return result
+
+
+def candidate_id_of(record, field='candidate_unique_id'):
+    """
+    A candidate's id as a string (from a candidate record, or a result row with field='Candidate ID'),
+    or None when it has none: missing, empty, or NaN in a column only some candidates have.
+    """
+    value = record.get(field)
+    if value is None or (isinstance(value, float) and math.isnan(value)) or not str(value).strip():
+        return None
+    return str(value)
+
+
+def _candidate_ref(candidate_data):
+    """Tells candidates apart within this process: by id, or by the record itself when it has no id."""
+    return candidate_id_of(candidate_data) or ('record', id(candidate_data))
+
+
+def _new_work_item(candidate_data, exclude_keys=(), text=None):
+    return {
+        'candidate': candidate_data,
+        'data': None,
+        'extension': None,
+        'text': text,  # Already extracted text (e.g. from pre-ranking) skips download and extraction
+        'done': False,
+        'exclude_keys': exclude_keys,  # Mistral keys to avoid, e.g. the ones that failed this candidate before
+        'keys_tried': [],
+        'compaction': None,  # Size before/after compaction, see compact_stage
+        'result': {
+            'Candidate Name': candidate_data.get('name', 'N/A'),
+            'Candidate ID': candidate_data.get('candidate_unique_id') if candidate_id_of(candidate_data) else None,
+            'Score (%)': 0,
+            'Resume Link': 'N/A'
+        },
+    }
+
+
+def _trace_context(item):
+    """Span args that identify the candidate an item belongs to."""
+    return {'candidate': item['result']['Candidate Name'], 'candidate_id': item['result']['Candidate ID']}
+
+
+def _extract_in_worker(data, extension, trace_context=None):
+    """
+    Process-pool entry point for extraction. Returns (text, trace events, metrics delta): the
+    metrics the worker recorded (extract/parse timings, OCR pages) and, with `trace_context`,
+    its spans (parse, OCR pages), so the parent can merge both into its own.
+    """
+    baseline = metrics.registry.snapshot()
+    if trace_context is None:
+        text, events = extract_text_from_bytes(data, extension), []
+    else:
+        tracer = tracing.Tracer()
+        with tracing.activate(tracer, **trace_context):
+            text = extract_text_from_bytes(data, extension)
+        events = tracer.events
+    return text, events, metrics.registry.delta_since(baseline)
+
+
+def download_stage(item, resume_save_path=None):
+    """
+    Downloads the candidate's resume into memory. If `resume_save_path` is given, a copy is
+    archived there in the background; nothing downstream reads it back from disk.
+    """
+    candidate_data = item['candidate']
+    resume_url = candidate_data.get('darwinbox_resume_url')
+    if not resume_url:
+        item['result']['AI Remarks'] = 'Skipped: No resume URL found.'
+        item['done'] = True
+        return item
+    item['result']['Resume Link'] = resume_url
+    if item['text'] is not None:
+        return item
+    safe_name = "".join(c for c in candidate_data.get('name', 'candidate') if c.isalnum() or c in (' ', '_')).rstrip()
+    file_id = candidate_data.get('candidate_unique_id') or candidate_data.get('candidate_id') or 'no_id'
+    with tracing.span("download", category="download") as trace_args:
+        data, content_type = download_to_memory(resume_url)
+        trace_args['bytes'] = len(data) if data else 0
+    if data is None:
+        item['text'] = "Error: Could not download resume."
+        return item
+    # Route by what the bytes actually are; HTML error pages and other non-documents stop here.
+    extension, rejection_reason = sniff_file_type(data, content_type)
+    if rejection_reason:
+        item['text'] = f"Error: Resume link did not return a usable document ({rejection_reason})."
+        return item
+    item['data'] = data
+    item['extension'] = extension
+    if resume_save_path:
+        archive_file_async(data, os.path.join(resume_save_path, f"{safe_name}_{file_id}{extension}"))
+    return item
+
+
+def extract_stage(item, extract_fn=extract_text_from_bytes):
+    """Turns the downloaded bytes into text. `extract_fn` lets the pipeline run this in another process."""
+    if item['data'] is not None and item['text'] is None:
+        item['text'] = extract_fn(item['data'], item['extension'])
+    item['data'] = None  # The text is all later stages need; free the buffer early
+    return item
+
+
+def compact_stage(item, token_budget=DEFAULT_RESUME_TOKEN_BUDGET):
+    """Cuts whitespace, repeated headers/footers and OCR noise from the text and trims it to `token_budget` tokens."""
+    text_content = item['text']
+    if text_content and "Error:" not in text_content:
+        item['text'], item['compaction'] = compact_resume_text(text_content, token_budget)
+        metrics.inc("screening_resume_tokens_total", item['compaction']['tokens_before'], stage="extracted")
+        metrics.inc("screening_resume_tokens_total", item['compaction']['tokens_after'], stage="compacted")
+    return item
+
+
+def llm_stage(item, jd_text, ai_analyzer, api_key=None):
+    """Scores the extracted text against the JD and fills in the final result row."""
+    text_content = item['text'] or ""
+    if "Error:" in text_content:
+        ai_result = {'overall_score': 0, 'summary': text_content, 'failed': True}
+    else:
+        ai_result = ai_analyzer.analyze_resume(text_content, jd_text, api_key, exclude_keys=item.get('exclude_keys', ()))
+    return _apply_ai_result(item, ai_result)
+
+
+def llm_batch_stage(items, jd_text, ai_analyzer):
+    """Scores several items with packed requests (AIAnalyzer.analyze_batch). Items holding an error skip the AI."""
+    to_analyze, exclude_keys = {}, set()
+    for index, item in enumerate(items):
+        if "Error:" in (item['text'] or ""):
+            llm_stage(item, jd_text, ai_analyzer)
+            continue
+        # Packed results are matched back by candidate id, so it has to be unique within the pack.
+        pack_id = str(item['result']['Candidate ID'] or '')
+        if not pack_id or pack_id in to_analyze:
+            pack_id = f"resume-{index}"
+        to_analyze[pack_id] = item
+        exclude_keys.update(item.get('exclude_keys', ()))
+    if to_analyze:
+        ai_results = ai_analyzer.analyze_batch([(pack_id, item['text'] or "") for pack_id, item in to_analyze.items()],
+                                               jd_text, exclude_keys=tuple(exclude_keys))
+        for pack_id, item in to_analyze.items():
+            _apply_ai_result(item, ai_results[pack_id])
+    return items
+
+
+def _apply_ai_result(item, ai_result):
+    item['keys_tried'] = ai_result.get('keys_tried', [])
+    item['result']['Score (%)'] = ai_result.get('overall_score', 0)
+    item['result']['AI Remarks'] = ai_result.get('summary', 'No summary generated.')
+    if ai_result.get('failed'):
+        item['result']['Analysis Status'] = 'failed'
+    item['done'] = True
+    return item
+
+
+def analyze_single_resume(candidate_data, jd_text, ai_analyzer, resume_save_path, api_key=None):
+    """Runs every stage for one candidate in the calling thread."""
+    item = download_stage(_new_work_item(candidate_data), resume_save_path)
+    if not item['done']:
+        item = compact_stage(extract_stage(item), ai_analyzer.resume_token_budget)
+        item = llm_stage(item, jd_text, ai_analyzer, api_key)
+    return item['result']
+
+
+class AnalysisPipeline:
+    """
+    Streams candidates through download -> extract -> compact -> LLM stages.
+
+    Each stage has its own worker pool and hands work to the next stage through a
+    bounded queue, so downloads, OCR and Mistral calls for different candidates all
+    overlap instead of running back to back on the same worker.
+
+    When a shared `job_queue` is given, LLM calls are submitted to it under
+    `session_id` rather than made directly, so concurrent sessions share the keys fairly.
+
+    With `batch_size` > 1, each AI worker packs up to that many extracted resumes into one
+    Mistral request (see AIAnalyzer.analyze_batch), which saves requests per minute.
+
+    With a `journal` (modules.run_journal.AnalysisRunJournal), each result is journaled as
+    soon as it is ready, and `run_with_retry` gives failed candidates a second pass that
+    avoids the keys they failed on.
+
+    With a `tracer` (utils.tracing.Tracer), every stage, download, parse, OCR page, LLM attempt
+    and backoff sleep is recorded as a span, including those run in the extraction processes.
+    """
+
+    def __init__(self, ai_analyzer, jd_text, resume_save_path,
+                 download_workers=DEFAULT_DOWNLOAD_WORKERS,
+                 extract_workers=DEFAULT_EXTRACT_WORKERS,
+                 llm_workers_per_key=DEFAULT_LLM_WORKERS_PER_KEY,
+                 queue_size=STAGE_QUEUE_SIZE,
+                 job_queue=None, session_id=None, archive_resumes=True, llm_workers=None, tracer=None, journal=None,
+                 batch_size=1):
+        self.ai_analyzer = ai_analyzer
+        self.job_queue = job_queue
+        self.session_id = session_id
+        self.jd_text = jd_text
+        # Without archiving, resumes only ever exist in memory.
+        self.resume_save_path = resume_save_path if archive_resumes else None
+        self.download_workers = download_workers
+        self.extract_workers = extract_workers
+        self.llm_workers = llm_workers or len(ai_analyzer.api_keys_list) * llm_workers_per_key
+        self.queue_size = queue_size
+        self.tracer = tracer
+        self.journal = journal
+        self.batch_size = max(1, batch_size or 1)
+        self.resume_token_budget = ai_analyzer.resume_token_budget
+        # Compaction stats summed over every run() of this pipeline, for the "input reduced by X%" line.
+        self.compaction_totals = {'resumes': 0, 'tokens_before': 0, 'tokens_after': 0, 'trimmed': 0}
+        self._keys_tried = {}  # candidate id -> masked keys its last failed analysis went through
+        configure_download_pool(download_workers)  # One keep-alive connection per download worker
+
+    def _start_stage(self, name, fn, in_q, out_q, num_workers):
+        """Starts `num_workers` threads that apply `fn` to items from `in_q` and push them to `out_q`."""
+        remaining = [num_workers]
+        remaining_lock = threading.Lock()
+
+        def worker(worker_index):
+            while True:
+                item = in_q.get()
+                if item is _STAGE_DONE:
+                    in_q.put(_STAGE_DONE)  # Let sibling workers see it too
+                    break
+                if not item['done']:
+                    try:
+                        with metrics.timed("screening_pipeline_stage_seconds", stage=name), \
+                                tracing.activate(self.tracer, **_trace_context(item)), tracing.span(name, category="stage"):
+                            item = fn(item, worker_index)
+                    except Exception as e:
+                        logger.error(f"{name} stage failed for {item['result']['Candidate Name']}: {e}")
+                        mark_failed(item['result'], f"Error: {name} failed. Reason: {e}")
+                        item['done'] = True
+                out_q.put(item)
+            self._stage_worker_finished(remaining, remaining_lock, out_q)
+
+        for i in range(num_workers):
+            threading.Thread(target=worker, args=(i,), name=f"{name}-{i}", daemon=True).start()
+
+    def _start_batch_stage(self, name, fn, in_q, out_q, num_workers):
+        """
+        Like _start_stage, but each worker collects up to `batch_size` items (waiting at most
+        BATCH_FILL_WAIT_S for the pack to fill) and applies `fn` to the list of them.
+        """
+        remaining = [num_workers]
+        remaining_lock = threading.Lock()
+
+        def take_batch():
+            """Blocks for one item, then gathers what else arrives shortly. Returns (items, stage drained)."""
+            item = in_q.get()
+            if item is _STAGE_DONE:
+                in_q.put(_STAGE_DONE)
+                return [], True
+            batch, deadline = [item], time.monotonic() + BATCH_FILL_WAIT_S
+            while len(batch) < self.batch_size:
+                try:
+                    item = in_q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STAGE_DONE:
+                    in_q.put(_STAGE_DONE)
+                    return batch, True
+                batch.append(item)
+            return batch, False
+
+        def worker(worker_index):
+            drained = False
+            while not drained:
+                batch, drained = take_batch()
+                todo = [item for item in batch if not item['done']]
+                if todo:
+                    started = time.monotonic()
+                    try:
+                        with tracing.activate(self.tracer, candidates=len(todo)), tracing.span(name, category="stage"):
+                            fn(todo, worker_index)
+                    except Exception as e:
+                        logger.error(f"{name} stage failed for a pack of {len(todo)}: {e}")
+                        for item in todo:
+                            mark_failed(item['result'], f"Error: {name} failed. Reason: {e}")
+                            item['done'] = True
+                    for _ in todo:
+                        metrics.observe("screening_pipeline_stage_seconds", time.monotonic() - started, stage=name)
+                for item in batch:
+                    out_q.put(item)
+            self._stage_worker_finished(remaining, remaining_lock, out_q)
+
+        for i in range(num_workers):
+            threading.Thread(target=worker, args=(i,), name=f"{name}-{i}", daemon=True).start()
+
+    @staticmethod
+    def _stage_worker_finished(remaining, remaining_lock, out_q):
+        """The last worker of a stage to finish tells the next stage nothing more is coming."""
+        with remaining_lock:
+            remaining[0] -= 1
+            is_last = remaining[0] == 0
+        if is_last:
+            out_q.put(_STAGE_DONE)
+
+    def _fresh_key_exclusions(self, candidates):
+        """{candidate ref: keys to avoid}, from this run's failures or, after a restart, the journal."""
+        journaled = self.journal.latest() if self.journal else {}
+        exclusions = {}
+        for cand in candidates:
+            ref = _candidate_ref(cand)
+            masked = self._keys_tried.get(ref) or journaled.get(candidate_id_of(cand), {}).get('keys_tried', [])
+            exclusions[ref] = tuple(k for k in self.ai_analyzer.api_keys_list if metrics.mask_key(k) in masked)
+        return exclusions
+
+    def run_with_retry(self, candidates, retry_candidates=(), texts=None):
+        """
+        Runs `candidates` through the pipeline, then gives every failure (plus `retry_candidates`,
+        e.g. failures journaled by an earlier run) one retry pass on fresh keys.
+        Yields (result, pass name, row key) with pass name 'initial' or 'retry'. The row key is the
+        candidate id, or a stand-in for candidates without one, so a retry result can replace its failure.
+        """
+        to_retry = list(retry_candidates)
+        for item in self._run_items(candidates, texts=texts):
+            yield item['result'], "initial", _candidate_ref(item['candidate'])
+            if is_failed_result(item['result']):
+                to_retry.append(item['candidate'])
+        if to_retry:
+            logger.info(f"Retrying {len(to_retry)} failed candidates with fresh keys.")
+            for item in self._run_items(to_retry, run_pass="retry", texts=texts):
+                yield item['result'], "retry", _candidate_ref(item['candidate'])
+
+    def run(self, candidates, run_pass="initial", texts=None):
+        """
+        Yields each candidate's result dict as soon as it has gone through every stage.
+        `texts` ({candidate id: resume text}, e.g. from `extract_texts`) skips download and extraction for those candidates.
+        """
+        for item in self._run_items(candidates, run_pass, texts):
+            yield item['result']
+
+    def _run_items(self, candidates, run_pass="initial", texts=None):
+        """run(), but yields the finished work items, so callers can tell which candidate each result is for."""
+        exclusions = self._fresh_key_exclusions(candidates) if run_pass == "retry" else {}
+        totals = self.compaction_totals
+        for item in self._stream(candidates, exclusions, texts or {}):
+            if item['compaction']:
+                totals['resumes'] += 1
+                totals['tokens_before'] += item['compaction']['tokens_before']
+                totals['tokens_after'] += item['compaction']['tokens_after']
+                totals['trimmed'] += item['compaction']['trimmed']
+            if item['keys_tried']:
+                self._keys_tried[_candidate_ref(item['candidate'])] = item['keys_tried']
+            if self.journal:
+                self.journal.record(item['result'], item['keys_tried'], run_pass)
+            yield item
+        if totals['resumes']:
+            logger.info(describe_reduction(totals))
+
+    def extract_texts(self, candidates):
+        """
+        Runs only the download and extraction stages. Yields (candidate, text, result) per candidate;
+        text is None when there is no usable resume, and result then says why.
+        """
+        for item in self._stream(candidates, analyze=False):
+            text = item['text']
+            if text is not None and text.startswith("Error:"):
+                mark_failed(item['result'], text)
+                text = None
+            yield item['candidate'], text, item['result']
+
+    def _stream(self, candidates, exclusions=None, texts=None, analyze=True):
+        """Feeds `candidates` through the stages and yields work items as they finish."""
+        exclusions, texts = exclusions or {}, texts or {}
+        download_q = queue.Queue(maxsize=self.queue_size)
+        extract_q = queue.Queue(maxsize=self.queue_size)
+        compact_q = queue.Queue(maxsize=self.queue_size)
+        # In packed mode every AI worker needs a full pack waiting, not just one item.
+        llm_q = queue.Queue(maxsize=max(self.queue_size, self.batch_size * self.llm_workers if self.batch_size > 1 else 0))
+        results_q = queue.Queue()
+
+        # "spawn" avoids forking a process that already has Streamlit and stage threads running.
+        process_pool = ProcessPoolExecutor(max_workers=self.extract_workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=configure_nested_ocr, initargs=(self.extract_workers,))
+        # Set when the caller stops reading (e.g. a prefetch is stopped); queued items are then dropped quietly.
+        cancelled = threading.Event()
+
+        def extract_in_pool(item, _):
+            if cancelled.is_set():
+                item['data'] = None
+                return item
+            trace_context = _trace_context(item) if self.tracer else None
+
+            def extract_fn(data, ext):
+                text, events, metrics_delta = process_pool.submit(_extract_in_worker, data, ext, trace_context).result()
+                metrics.registry.merge(metrics_delta)
+                if self.tracer:
+                    self.tracer.extend(events, process_name="Extraction worker")
+                return text
+            try:
+                return extract_stage(item, extract_fn)
+            except Exception:
+                if cancelled.is_set():  # The pool was shut down under this item
+                    return item
+                raise
+
+        def traced_llm_stage(item):
+            # Job queue threads are not stage threads, so the tracer has to be activated again here.
+            with tracing.activate(self.tracer, **_trace_context(item)):
+                return llm_stage(item, self.jd_text, self.ai_analyzer)
+
+        def traced_llm_batch_stage(items):
+            with tracing.activate(self.tracer, candidates=len(items)):
+                return llm_batch_stage(items, self.jd_text, self.ai_analyzer)
+
+        def analyze_batch(items, _):
+            if self.job_queue is not None:
+                return self.job_queue.submit(self.session_id, traced_llm_batch_stage, items).result()
+            return llm_batch_stage(items, self.jd_text, self.ai_analyzer)
+
+        def analyze_item(item, _):
+            # No key is pinned here; AIAnalyzer's key scheduler picks one per attempt.
+            if self.job_queue is not None:
+                return self.job_queue.submit(self.session_id, traced_llm_stage, item).result()
+            return llm_stage(item, self.jd_text, self.ai_analyzer)
+
+        self._start_stage("Download", lambda item, _: download_stage(item, self.resume_save_path), download_q, extract_q, self.download_workers)
+        if analyze:
+            self._start_stage("Extraction", extract_in_pool, extract_q, compact_q, self.extract_workers)
+            self._start_stage("Compaction", lambda item, _: compact_stage(item, self.resume_token_budget),
+                              compact_q, llm_q, DEFAULT_COMPACT_WORKERS)
+            if self.batch_size > 1:
+                self._start_batch_stage("AI analysis", analyze_batch, llm_q, results_q, self.llm_workers)
+            else:
+                self._start_stage("AI analysis", analyze_item, llm_q, results_q, self.llm_workers)
+        else:
+            self._start_stage("Extraction", extract_in_pool, extract_q, results_q, self.extract_workers)
+
+        def feed():
+            for candidate_data in candidates:
+                if cancelled.is_set():
+                    break
+                # Candidates without an id can't be matched to a handed-in text; they are downloaded as usual.
+                cand_id = candidate_id_of(candidate_data)
+                text = texts.get(cand_id) if cand_id is not None else None
+                download_q.put(_new_work_item(candidate_data, exclusions.get(_candidate_ref(candidate_data), ()), text))
+            download_q.put(_STAGE_DONE)
+
+        threading.Thread(target=feed, name="pipeline-feeder", daemon=True).start()
+
+        try:
+            while True:
+                item = results_q.get()
+                if item is _STAGE_DONE:
+                    break
+                yield item
+        finally:
+            cancelled.set()
+            process_pool.shutdown(wait=False, cancel_futures=True)
+            if analyze and self.job_queue is not None:
+                self.job_queue.cancel(self.session_id)  # AI calls this run still had waiting in the shared queue
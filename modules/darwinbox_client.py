@@ -1,15 +1,43 @@
 import streamlit as st
 import requests
+import urllib3
+import time
 import logging
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.http_client import PooledHttpClient
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
+CANDIDATE_DATE_FORMAT = "%d-%m-%Y %H:%M:%S"
+CANDIDATE_WINDOW_RETRIES = 2
+# Incremental syncs re-request a little before the watermark to catch late-indexed candidates.
+SYNC_OVERLAP = timedelta(hours=1)
+# Server errors that mean a shortlist/reject was not applied. A 504 is left out: the gateway gave up
+# waiting, but Darwinbox may still have applied the update.
+RETRYABLE_UPDATE_STATUS_CODES = (500, 502, 503)
+
+def _never_connected(error) -> bool:
+    """
+    True when a request failed before any connection was made, so Darwinbox never saw it. A dropped
+    connection ("Connection aborted") is also a ConnectionError, but it can happen after the body was sent.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.exceptions.ConnectionError) or isinstance(error, requests.exceptions.ProxyError):
+        return False
+    cause = error.args[0] if error.args else None
+    cause = getattr(cause, 'reason', cause)  # urllib3's MaxRetryError wraps the error that stopped it
+    # Also covers NameResolutionError, a subclass.
+    return isinstance(cause, urllib3.exceptions.NewConnectionError)
+
 class DarwinboxClient:
     def __init__(self):
         # Common credentials
         self.subdomain = st.secrets["DARWINBOX_SUBDOMAIN"]
-        self.base_url = f"https://{self.subdomain}.darwinbox.in"
+        # DARWINBOX_BASE_URL overrides the tenant URL (e.g. a proxy or the benchmark stub server).
+        self.base_url = st.secrets.get("DARWINBOX_BASE_URL") or f"https://{self.subdomain}.darwinbox.in"
 
         # --- Specific credentials for GET JOBS ---
         self.username_get_jobs = st.secrets["DARWINBOX_USERNAME_GET_JOBS"]
@@ -29,12 +57,46 @@ class DarwinboxClient:
         self.api_key_shortlist = st.secrets["DARWINBOX_API_KEY_SHORTLIST"]
         self.api_key_reject = st.secrets["DARWINBOX_API_KEY_REJECT"]
 
+        # --- Candidate fetch settings ---
+        self.candidate_lookback_days = int(st.secrets.get("DARWINBOX_CANDIDATE_LOOKBACK_DAYS", 180))
+        # Size of each date window for sharded fetches; 0 fetches the whole lookback period in one request.
+        self.candidate_window_days = int(st.secrets.get("DARWINBOX_CANDIDATE_WINDOW_DAYS", 30))
+        self.candidate_fetch_workers = int(st.secrets.get("DARWINBOX_CANDIDATE_FETCH_WORKERS", 4))
+        self.last_fetch_ok = True
+
+        # --- HTTP transport: one keep-alive pool shared by every call this client makes ---
+        self.timeout = float(st.secrets.get("DARWINBOX_TIMEOUT_S", 20))
+        self.bulk_timeout = float(st.secrets.get("DARWINBOX_BULK_TIMEOUT_S", 60))
+        self.http = PooledHttpClient(
+            pool_size=int(st.secrets.get("DARWINBOX_POOL_SIZE", 8)),
+            timeout=self.timeout,
+            # Darwinbox uses POST for reads too, and replaying a read after a gateway error is harmless.
+            retry_methods=frozenset({"GET", "POST"}),
+            name="darwinbox",
+        )
+        # Shortlist/reject change the candidate. A 502/504 can come back after Darwinbox already applied
+        # the decision, so these are only retried when the connection itself failed (nothing was sent).
+        self.update_http = PooledHttpClient(
+            pool_size=2,
+            timeout=self.timeout,
+            status_forcelist=None,
+            retry_methods=frozenset({"POST"}),
+            name="darwinbox-updates",
+        )
+
+    def _post(self, endpoint, auth, payload, http=None, **kwargs):
+        """POSTs to JobsApiv3/<endpoint> (through `http`, default self.http), recording its latency by endpoint and HTTP status."""
+        http = http or self.http
+        with metrics.timed("screening_darwinbox_request_seconds", endpoint=endpoint, outcome="network_error") as labels:
+            response = http.post(f"{self.base_url}/JobsApiv3/{endpoint}", auth=auth, json=payload, **kwargs)
+            labels["outcome"] = str(response.status_code)
+        return response
+
     def get_jobs(self):
-        url = f"{self.base_url}/JobsApiv3/Joblist"
         payload = {"api_key": self.api_key_get_jobs}
         
         try:
-            response = requests.post(url, auth=(self.username_get_jobs, self.password_get_jobs), json=payload, timeout=20)
+            response = self._post("Joblist", (self.username_get_jobs, self.password_get_jobs), payload)
             response.raise_for_status()
             data = response.json()
 
@@ -47,49 +109,138 @@ class DarwinboxClient:
             st.error(f"Connection Error (get_jobs): Could not connect. Details: {e}")
             return []
 
-    def get_candidates_for_job(self, job_id):
-        url = f"{self.base_url}/JobsApiv3/BulkCandidatesData"
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=180) 
-        date_format = "%d-%m-%Y %H:%M:%S"
+    def _fetch_candidates_window(self, job_id, start_date, end_date):
+        """Fetches raw candidates created in [start_date, end_date]. Raises on network or API errors."""
         payload = {
             "api_key": self.api_key_get_candidates,
             "job_id": job_id,
-            "created_from": start_date.strftime(date_format),
-            "created_to": end_date.strftime(date_format)
+            "created_from": start_date.strftime(CANDIDATE_DATE_FORMAT),
+            "created_to": end_date.strftime(CANDIDATE_DATE_FORMAT)
         }
-        try:
-            response = requests.post(url, auth=(self.username_get_candidates, self.password_get_candidates), json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("status") == 1:
-                candidates_raw = data.get("data", [])
-                processed_candidates = [] # Create a new list for valid candidates
+        response = self._post("BulkCandidatesData", (self.username_get_candidates, self.password_get_candidates), payload, timeout=self.bulk_timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("status") != 1:
+            raise RuntimeError(f"Darwinbox API Error: {data.get('message')}")
+        return data.get("data", [])
 
-                for cand in candidates_raw:
-                    if not isinstance(cand, dict):
-                        continue
+    @staticmethod
+    def _process_candidates(candidates_raw):
+        processed_candidates = [] # Create a new list for valid candidates
+        for cand in candidates_raw:
+            if not isinstance(cand, dict):
+                continue
 
-                    cand['name'] = f"{cand.get('firstname', '')} {cand.get('lastname', '')}".strip()
-                    resume_url = ""
-                    app_data = cand.get('application_data', {})
-                    if 'Resume' in app_data and isinstance(app_data['Resume'], dict):
-                        resume_url = app_data['Resume'].get('Resume', '')
-                    cand['darwinbox_resume_url'] = resume_url
-                    
-                    processed_candidates.append(cand)
-                
-                return processed_candidates
-            else:
-                st.error(f"Darwinbox API Error (get_candidates_for_job): {data.get('message')}")
+            cand['name'] = f"{cand.get('firstname', '')} {cand.get('lastname', '')}".strip()
+            resume_url = ""
+            app_data = cand.get('application_data', {})
+            if 'Resume' in app_data and isinstance(app_data['Resume'], dict):
+                resume_url = app_data['Resume'].get('Resume', '')
+            cand['darwinbox_resume_url'] = resume_url
+            
+            processed_candidates.append(cand)
+        return processed_candidates
+
+    @staticmethod
+    def _split_date_range(start_date, end_date, window_days):
+        windows = []
+        window_start = start_date
+        while window_start < end_date:
+            window_end = min(end_date, window_start + timedelta(days=window_days))
+            # created_to is inclusive, so stop each window a second before the next one starts.
+            windows.append((window_start, window_end if window_end == end_date else window_end - timedelta(seconds=1)))
+            window_start = window_end
+        return windows
+
+    def get_candidates_for_job(self, job_id, lookback_days=None, window_days=None, max_workers=None, since=None):
+        """
+        Fetches every candidate for `job_id` created in the last `lookback_days`, or only those
+        created since the `since` watermark of an earlier sync. Darwinbox filters this endpoint
+        on creation date, so that is what the watermark tracks.
+
+        With `window_days` > 0 the range is split into windows that are fetched concurrently
+        (at most `max_workers` at a time); failed windows are retried on their own and the
+        results are merged and de-duplicated on candidate id. `window_days=0` makes one request.
+        `self.last_fetch_ok` is False afterwards if any part of the range could not be fetched.
+        """
+        lookback_days = self.candidate_lookback_days if lookback_days is None else lookback_days
+        window_days = self.candidate_window_days if window_days is None else window_days
+        max_workers = max_workers or self.candidate_fetch_workers
+        end_date = datetime.now()
+        start_date = since - SYNC_OVERLAP if since else end_date - timedelta(days=lookback_days)
+        self.last_fetch_ok = False
+
+        if not window_days or end_date - start_date <= timedelta(days=window_days):
+            try:
+                candidates = self._process_candidates(self._fetch_candidates_window(job_id, start_date, end_date))
+                self.last_fetch_ok = True
+                return candidates
+            except requests.exceptions.RequestException as e:
+                st.error(f"Connection Error (get_candidates_for_job): Could not connect. Details: {e}")
                 return []
-        # --- FIX: ADDED THE MISSING EXCEPT BLOCK ---
+            except RuntimeError as e:
+                st.error(f"{e} (get_candidates_for_job)")
+                return []
+
+        pending_windows = self._split_date_range(start_date, end_date, window_days)
+        total_windows = len(pending_windows)
+        candidates_by_id = {}
+        failures = {}
+        for attempt in range(CANDIDATE_WINDOW_RETRIES + 1):
+            if attempt:
+                time.sleep(2 ** attempt)
+                logger.warning(f"Retrying {len(pending_windows)} failed candidate windows for job {job_id} (attempt {attempt + 1}).")
+            failed_windows = []
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(self._fetch_candidates_window, job_id, start, end): (start, end) for start, end in pending_windows}
+                for future in as_completed(futures):
+                    window = futures[future]
+                    try:
+                        window_candidates = self._process_candidates(future.result())
+                    except (requests.exceptions.RequestException, RuntimeError) as e:
+                        failed_windows.append(window)
+                        failures[window] = str(e)
+                        continue
+                    failures.pop(window, None)
+                    for cand in window_candidates:
+                        cand_id = cand.get('unique_id') or cand.get('candidate_id') or cand.get('id')
+                        # Candidates without any id can't be matched across windows, so keep them all.
+                        candidates_by_id[cand_id if cand_id else f"_no_id_{len(candidates_by_id)}"] = cand
+            pending_windows = failed_windows
+            if not pending_windows:
+                break
+
+        if pending_windows:
+            failed_ranges = ", ".join(f"{start:%d-%m-%Y} to {end:%d-%m-%Y}" for start, end in pending_windows)
+            st.warning(f"Could not fetch candidates for {len(pending_windows)}/{total_windows} date windows ({failed_ranges}). "
+                       f"Last error: {failures[pending_windows[-1]]}")
+        self.last_fetch_ok = not pending_windows
+        logger.info(f"Fetched {len(candidates_by_id)} unique candidates for job {job_id} across {total_windows} windows.")
+        return list(candidates_by_id.values())
+
+    def _update_candidate(self, endpoint, payload, success_message, error_message):
+        """
+        POSTs a shortlist/reject update. Returns (success, message, retryable); `retryable` is only
+        True when the update certainly didn't take effect, so sending it again can't apply it twice.
+        """
+        try:
+            response = self._post(endpoint, (self.username_update_actions, self.password_update_actions), payload,
+                                  http=self.update_http)
         except requests.exceptions.RequestException as e:
-            st.error(f"Connection Error (get_candidates_for_job): Could not connect. Details: {e}")
-            return []
+            # Anything past connecting (a read timeout, a dropped connection) may have been applied already.
+            return False, f"Network Error: {str(e)}", _never_connected(e)
+        if response.status_code >= 400:
+            return (False, f"HTTP Error: {response.status_code} {response.reason}",
+                    response.status_code in RETRYABLE_UPDATE_STATUS_CODES)
+        try:
+            data = response.json()
+        except ValueError:
+            return False, "Darwinbox returned a response that is not JSON.", False
+        if data.get("status") == 1:
+            return True, success_message, False
+        return False, data.get('message', error_message), False
 
     def shortlist_candidate(self, candidate_id: str, job_id: str):
-        url = f"{self.base_url}/JobsApiv3/candidatetag"
         payload = {
             "api_key": self.api_key_shortlist, # Use the specific key for shortlisting
             "job_id": job_id,
@@ -97,32 +248,14 @@ class DarwinboxClient:
             "status_tag": "Shortlisted",
             "remarks": "Shortlisted via AI Screening Tool"
         }
-        try:
-            response = requests.post(url, auth=(self.username_update_actions, self.password_update_actions), json=payload, timeout=20)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("status") == 1:
-                return True, "Successfully shortlisted."
-            else:
-                return False, data.get('message', 'API returned an error for shortlisting.')
-        except requests.exceptions.RequestException as e:
-            return False, f"Network Error: {str(e)}"
+        return self._update_candidate("candidatetag", payload, "Successfully shortlisted.",
+                                      'API returned an error for shortlisting.')
 
     def reject_candidate(self, candidate_id: str, job_id: str, reason_tag: str):
-        url = f"{self.base_url}/JobsApiv3/RejectCandidate"
         payload = {
             "api_key": self.api_key_reject, # Use the specific key for rejecting
             "job_id": job_id,
             "candidate_id": candidate_id,
             "rejection_reason": reason_tag
         }
-        try:
-            response = requests.post(url, auth=(self.username_update_actions, self.password_update_actions), json=payload, timeout=20)
-            response.raise_for_status()
-            data = response.json()
-            if data.get("status") == 1:
-                return True, "Successfully rejected."
-            else:
-                return False, data.get('message', 'Failed to reject from API.')
-        except requests.exceptions.RequestException as e:
-            return False, f"Network Error: {str(e)}"
+        return self._update_candidate("RejectCandidate", payload, "Successfully rejected.", 'Failed to reject from API.')
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import logging
+import threading
+from random import uniform
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.file_saver import BASE_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+DECISION_JOURNAL_DIR = os.path.join(BASE_OUTPUT_DIR, "decision_journal")
+DEFAULT_SUBMIT_WORKERS = 8
+SUBMIT_ATTEMPTS = 3
+INITIAL_BACKOFF_S = 1.0
+DEFAULT_REJECTION_REASON = "Rejected based on screening"
+
+
+class DecisionJournal:
+    """
+    Append-only JSONL log of every decision submitted for one job.
+
+    Each line is one attempt's outcome; replaying the file tells us which
+    candidates Darwinbox has already confirmed, even after a refresh or crash.
+    """
+
+    def __init__(self, job_id):
+        os.makedirs(DECISION_JOURNAL_DIR, exist_ok=True)
+        self.path = os.path.join(DECISION_JOURNAL_DIR, f"{job_id}.jsonl")
+        self._lock = threading.Lock()
+
+    def confirmed(self) -> dict:
+        """{candidate id: decision} for every submission Darwinbox accepted."""
+        confirmed = {}
+        if not os.path.exists(self.path):
+            return confirmed
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn last line from a crash mid-write
+                if entry.get('success'):
+                    confirmed[str(entry['candidate_id'])] = entry['decision']
+        return confirmed
+
+    def record(self, candidate_id, decision, success, message, attempt):
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'candidate_id': str(candidate_id),
+            'decision': decision,
+            'success': success,
+            'message': message,
+            'attempt': attempt,
+        }
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+
+
+class DecisionSubmitter:
+    """
+    Submits Selected/Rejected decisions to Darwinbox concurrently and idempotently.
+
+    Candidates the journal already shows as confirmed with the same decision are
+    skipped, failures the client marks as retryable are retried with exponential backoff, and every attempt
+    is journaled as it happens so an interrupted run can simply be started again.
+    """
+
+    def __init__(self, db_client, job_id, max_workers=DEFAULT_SUBMIT_WORKERS, attempts=SUBMIT_ATTEMPTS):
+        self.db_client = db_client
+        self.job_id = job_id
+        self.max_workers = max_workers
+        self.attempts = attempts
+        self.journal = DecisionJournal(job_id)
+
+    def _submit_once(self, decision):
+        if decision['decision'] == 'Selected':
+            return self.db_client.shortlist_candidate(candidate_id=decision['candidate_id'], job_id=self.job_id)
+        return self.db_client.reject_candidate(candidate_id=decision['candidate_id'], job_id=self.job_id,
+                                               reason_tag=decision.get('reason') or DEFAULT_REJECTION_REASON)
+
+    def _submit_with_retry(self, decision):
+        message = ""
+        for attempt in range(1, self.attempts + 1):
+            success, message, retryable = self._submit_once(decision)
+            self.journal.record(decision['candidate_id'], decision['decision'], success, message, attempt)
+            if success:
+                return dict(decision, status='submitted', message=message)
+            # Only failures where the update certainly wasn't applied (no connection, 500/502/503) are
+            # retried; a 4xx won't change, and a timeout may already have gone through.
+            if not retryable or attempt == self.attempts:
+                break
+            time.sleep(INITIAL_BACKOFF_S * (2 ** (attempt - 1)) + uniform(0, 0.5))
+        return dict(decision, status='failed', message=message)
+
+    def submit_all(self, decisions):
+        """
+        Submits `decisions` (dicts with candidate_id, candidate_name, decision and optional reason)
+        and yields one outcome dict per decision as it finishes, with status submitted/skipped/failed.
+        """
+        confirmed = self.journal.confirmed()
+        to_submit = []
+        for decision in decisions:
+            if confirmed.get(str(decision['candidate_id'])) == decision['decision']:
+                yield dict(decision, status='skipped', message="Already confirmed in an earlier submission.")
+            else:
+                to_submit.append(decision)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._submit_with_retry, d): d for d in to_submit}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error(f"Unexpected error submitting decision for {futures[future]['candidate_id']}: {e}")
+                    yield dict(futures[future], status='failed', message=str(e))
@@ -0,0 +1,119 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisJobQueue:
+    """
+    Process-wide queue of AI analysis calls, shared by every Streamlit session.
+
+    Each session gets its own FIFO of pending calls. Worker threads serve the
+    sessions round-robin, one call at a time, so two recruiters screening at once
+    each get an equal share of the Mistral keys instead of whoever submitted
+    first hogging them. Per-key concurrency is still enforced by the shared
+    KeyScheduler the calls go through.
+    """
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self._cond = threading.Condition()
+        self._pending = {}          # session_id -> deque of (future, fn, args, kwargs)
+        self._rotation = deque()    # Sessions with pending work, in the order they'll be served
+        self._progress = {}         # session_id -> counters for that session's calls
+        for i in range(num_workers):
+            threading.Thread(target=self._worker, name=f"analysis-queue-{i}", daemon=True).start()
+
+    def submit(self, session_id, fn, *args, **kwargs) -> Future:
+        """Queues `fn(*args, **kwargs)` on behalf of `session_id` and returns a Future for its result."""
+        future = Future()
+        with self._cond:
+            if session_id not in self._pending:
+                self._pending[session_id] = deque()
+            if not self._pending[session_id]:
+                self._rotation.append(session_id)
+            self._pending[session_id].append((future, fn, args, kwargs))
+            progress = self._progress.setdefault(
+                session_id, {'submitted': 0, 'running': 0, 'completed': 0, 'failed': 0, 'last_update': None})
+            progress['submitted'] += 1
+            progress['last_update'] = time.time()
+            self._cond.notify()
+        return future
+
+    def _next_task(self):
+        # Caller holds self._cond.
+        session_id = self._rotation.popleft()
+        session_queue = self._pending[session_id]
+        task = session_queue.popleft()
+        if session_queue:
+            self._rotation.append(session_id)  # Back of the line until everyone else has had a turn
+        else:
+            del self._pending[session_id]
+        self._progress[session_id]['running'] += 1
+        return session_id, task
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._rotation:
+                    self._cond.wait()
+                session_id, (future, fn, args, kwargs) = self._next_task()
+            failed = False
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Queued analysis call failed for session {session_id[:8]}: {e}")
+                    future.set_exception(e)
+            with self._cond:
+                progress = self._progress.get(session_id)
+                if progress is not None:
+                    progress['running'] -= 1
+                    progress['failed' if failed else 'completed'] += 1
+                    progress['last_update'] = time.time()
+                self._forget_if_idle(session_id)
+
+    def _forget_if_idle(self, session_id):
+        # Caller holds self._cond. The queue lives as long as the server, so idle sessions must not pile up here.
+        progress = self._progress.get(session_id)
+        if progress is not None and not progress['running'] and session_id not in self._pending:
+            del self._progress[session_id]
+
+    def cancel(self, session_id) -> int:
+        """Drops every call `session_id` still has waiting (their futures are cancelled). Returns how many."""
+        with self._cond:
+            session_queue = self._pending.pop(session_id, ())
+            if session_id in self._rotation:
+                self._rotation.remove(session_id)
+            for future, _, _, _ in session_queue:
+                future.cancel()
+            self._forget_if_idle(session_id)
+        if session_queue:
+            logger.info(f"Cancelled {len(session_queue)} queued analysis calls for session {session_id[:8]}.")
+        return len(session_queue)
+
+    def progress(self, session_id) -> dict:
+        """
+        Counters for one session's calls, plus how much work other sessions have queued.
+        A session's counters start over once it has nothing queued or running.
+        """
+        with self._cond:
+            progress = dict(self._progress.get(
+                session_id, {'submitted': 0, 'running': 0, 'completed': 0, 'failed': 0, 'last_update': None}))
+            progress['queued'] = len(self._pending.get(session_id, ()))
+            progress['active_sessions'] = len(self._rotation)
+            progress['queued_total'] = sum(len(q) for q in self._pending.values())
+            return progress
+
+
+@st.cache_resource
+def get_analysis_job_queue(num_workers: int) -> AnalysisJobQueue:
+    """The single job queue for this server process; every session that asks gets the same instance."""
+    logger.info(f"Starting shared analysis job queue with {num_workers} workers.")
+    return AnalysisJobQueue(num_workers)
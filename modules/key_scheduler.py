@@ -0,0 +1,155 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_BURST = 3
+# Upper bound on concurrent requests per key, however many workers or sessions are asking.
+DEFAULT_MAX_IN_FLIGHT_PER_KEY = 2
+# The learned rate never drops below / rises above these multiples of the configured rate.
+MIN_RATE_FACTOR = 0.1
+MAX_RATE_FACTOR = 2.0
+# After a 429 without a Retry-After header, cool the key down for BASE * 2^(consecutive 429s - 1) seconds.
+BASE_COOLDOWN_S = 2.0
+MAX_COOLDOWN_S = 60.0
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class KeyScheduler:
+    """
+    Routes each Mistral request to whichever API key has capacity right now.
+
+    Every key has a token bucket whose refill rate adapts to what the key has
+    actually been allowed to do: a 429 halves the rate and puts the key in a
+    cooldown (honouring Retry-After when the API sends it), and each success
+    nudges the rate back up. `acquire()` blocks until some key has a token and a
+    free concurrency slot, and prefers the fullest, fastest one; callers must
+    `report()` the outcome.
+    """
+
+    def __init__(self, api_keys, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=DEFAULT_BURST,
+                 max_in_flight_per_key=DEFAULT_MAX_IN_FLIGHT_PER_KEY):
+        if not api_keys:
+            raise ValueError("KeyScheduler needs at least one API key.")
+        self.base_rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_in_flight_per_key = max_in_flight_per_key
+        self._cond = threading.Condition()
+        now = time.monotonic()
+        self._keys = {
+            key: {
+                'tokens': float(burst),
+                'rate': self.base_rate,
+                'last_refill': now,
+                'cooldown_until': 0.0,
+                'consecutive_429': 0,
+                'in_flight': 0,
+                'latency_ewma': None,
+                'requests': 0,
+                'rate_limited': 0,
+                'errors': 0,
+            }
+            for key in api_keys
+        }
+
+    @property
+    def api_keys(self):
+        return list(self._keys)
+
+    def _refill(self, state, now):
+        elapsed = now - state['last_refill']
+        state['tokens'] = min(float(self.burst), state['tokens'] + elapsed * state['rate'])
+        state['last_refill'] = now
+
+    def _seconds_until_ready(self, state, now):
+        if state['cooldown_until'] > now:
+            return state['cooldown_until'] - now
+        return max(0.0, (1.0 - state['tokens']) / state['rate'])
+
+    def acquire(self, timeout=None, exclude=()):
+        """
+        Blocks until a key has capacity and returns it, or returns None on timeout.
+
+        Keys in `exclude` are only used if every key is excluded.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                candidates = [k for k in self._keys if k not in exclude] or list(self._keys)
+                best_key, best_rank, wait_s = None, None, None
+                for key in candidates:
+                    state = self._keys[key]
+                    self._refill(state, now)
+                    if state['in_flight'] >= self.max_in_flight_per_key:
+                        continue  # Woken up by report() when a slot frees
+                    ready_in = self._seconds_until_ready(state, now)
+                    if ready_in > 0:
+                        wait_s = ready_in if wait_s is None else min(wait_s, ready_in)
+                        continue
+                    # Prefer the key with the most spare tokens, then the one answering fastest.
+                    rank = (-state['tokens'], state['latency_ewma'] or 0.0)
+                    if best_rank is None or rank < best_rank:
+                        best_key, best_rank = key, rank
+                if best_key is not None:
+                    state = self._keys[best_key]
+                    state['tokens'] -= 1.0
+                    state['in_flight'] += 1
+                    state['requests'] += 1
+                    return best_key
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None
+                    wait_s = remaining if wait_s is None else min(wait_s, remaining)
+                self._cond.wait(wait_s)
+
+    def report(self, api_key, status_code=None, latency_s=None, retry_after_s=None):
+        """Records the outcome of a request made with a key returned by `acquire()`."""
+        with self._cond:
+            state = self._keys.get(api_key)
+            if state is None:
+                return
+            state['in_flight'] = max(0, state['in_flight'] - 1)
+            now = time.monotonic()
+            if status_code == 429:
+                state['rate_limited'] += 1
+                state['consecutive_429'] += 1
+                state['rate'] = max(self.base_rate * MIN_RATE_FACTOR, state['rate'] / 2)
+                state['tokens'] = 0.0
+                cooldown = retry_after_s if retry_after_s is not None else min(
+                    MAX_COOLDOWN_S, BASE_COOLDOWN_S * (2 ** (state['consecutive_429'] - 1)))
+                state['cooldown_until'] = max(state['cooldown_until'], now + cooldown)
+                logger.warning(f"Key ...{api_key[-4:]} rate limited; cooling down {cooldown:.1f}s, "
+                               f"rate now {state['rate'] * 60:.1f}/min.")
+            elif status_code == 200:
+                state['consecutive_429'] = 0
+                # Additive increase: recover about one request/minute per success.
+                state['rate'] = min(self.base_rate * MAX_RATE_FACTOR, state['rate'] + 1 / 60.0)
+            else:
+                state['errors'] += 1
+            if latency_s is not None:
+                prev = state['latency_ewma']
+                state['latency_ewma'] = latency_s if prev is None else (
+                    LATENCY_EWMA_ALPHA * latency_s + (1 - LATENCY_EWMA_ALPHA) * prev)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Per-key snapshot, with keys masked to their last 4 characters."""
+        now = time.monotonic()
+        with self._cond:
+            return [
+                {
+                    'key': f"...{key[-4:]}",
+                    'rate_per_min': round(state['rate'] * 60, 1),
+                    'in_flight': state['in_flight'],
+                    'cooling_down_s': round(max(0.0, state['cooldown_until'] - now), 1),
+                    'latency_s': round(state['latency_ewma'], 2) if state['latency_ewma'] is not None else None,
+                    'requests': state['requests'],
+                    'rate_limited': state['rate_limited'],
+                    'errors': state['errors'],
+                }
+                for key, state in self._keys.items()
+            ]
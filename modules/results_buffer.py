@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from modules.analysis_pipeline import is_failed_result, candidate_id_of
+
+# Step 4 redraws the live table at most this often, however fast results arrive.
+RESULTS_REFRESH_S = 1.0
+# While a run streams in, only the best rows are drawn; the full table is shown when it finishes.
+LIVE_TOP_K = 50
+
+
+class ResultsBuffer:
+    """
+    Columnar, append-only store for result rows as they stream out of the pipeline.
+
+    Adding a row appends one value per column (no DataFrame is built), and counts are kept
+    up to date as rows arrive, so the per-result cost stays constant however many rows
+    there are. A row for a candidate already in the buffer (e.g. a retry result) replaces
+    the old row in place. DataFrames are only built on demand, for the live top-K view.
+    """
+
+    def __init__(self, key_column='Candidate ID', score_column='Score (%)'):
+        self.key_column = key_column
+        self.score_column = score_column
+        self.columns = {}
+        self.failed = []
+        self.failed_count = 0
+        self._positions = {}
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def add(self, result: dict, row_key=None):
+        """
+        Adds a row, or replaces the row with the same candidate id. Rows without an id are matched
+        on `row_key` instead (see AnalysisPipeline.run_with_retry), and never on each other.
+        """
+        key = candidate_id_of(result, self.key_column) or row_key
+        if key is None:
+            key = ('row', self._length)
+        position = self._positions.get(key)
+        if position is None:
+            position = self._positions[key] = self._length
+            self._length += 1
+            for values in self.columns.values():
+                values.append(None)
+            self.failed.append(False)
+        for column, value in result.items():
+            if column not in self.columns:
+                self.columns[column] = [None] * self._length  # Backfill rows that came before this column
+            self.columns[column][position] = value
+        # Clear columns the new version of the row doesn't have.
+        for column, values in self.columns.items():
+            if column not in result:
+                values[position] = None
+        failed = is_failed_result(result)
+        self.failed_count += int(failed) - int(self.failed[position])
+        self.failed[position] = failed
+
+    def extend(self, results):
+        for result in results:
+            self.add(result)
+
+    def _scores(self) -> np.ndarray:
+        scores = self.columns.get(self.score_column, [None] * self._length)
+        return pd.to_numeric(pd.Series(scores, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+    def summary(self) -> dict:
+        """Count, failures and score statistics over the successful rows, computed on whole columns."""
+        scores = self._scores()
+        scores = scores[~np.asarray(self.failed, dtype=bool)]
+        scores = scores[~np.isnan(scores)]
+        return {
+            'rows': self._length,
+            'failed': self.failed_count,
+            'mean_score': float(scores.mean()) if len(scores) else None,
+            'median_score': float(np.median(scores)) if len(scores) else None,
+            'scored_70_plus': int((scores >= 70).sum()),
+        }
+
+    def _frame(self, positions) -> pd.DataFrame:
+        return pd.DataFrame({column: [values[p] for p in positions] for column, values in self.columns.items()})
+
+    def top_k(self, k=LIVE_TOP_K) -> pd.DataFrame:
+        """The k highest-scoring rows, best first, without sorting the rest."""
+        scores = np.nan_to_num(self._scores(), nan=-1.0)
+        if len(scores) > k:
+            positions = np.argpartition(-scores, k - 1)[:k]
+        else:
+            positions = np.arange(len(scores))
+        positions = positions[np.argsort(-scores[positions], kind='stable')]
+        return self._frame(positions.tolist())
+
+    def rows(self) -> list:
+        """Every row as a dict, in arrival order."""
+        return [{column: values[p] for column, values in self.columns.items()} for p in range(self._length)]
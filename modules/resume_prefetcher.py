@@ -0,0 +1,88 @@
+import time
+import logging
+import threading
+
+from modules.analysis_pipeline import candidate_id_of
+
+logger = logging.getLogger(__name__)
+
+# How often the Step 3 progress line redraws while a prefetch is running.
+PREFETCH_REFRESH_S = 1.0
+
+
+class ResumePrefetcher:
+    """
+    Downloads and extracts resumes in a background thread, ahead of the AI analysis.
+
+    None of that work depends on the JD, so it can start as soon as the candidate list is
+    final and run while the recruiter is still writing the JD. Texts are kept in memory by
+    candidate id and handed to `AnalysisPipeline.run(texts=...)`, which then skips download
+    and extraction for them. Candidates whose resume could not be used are left out, so the
+    analysis run downloads them again and records the real reason. So are candidates without
+    an id, since their text could not be matched back to them.
+    """
+
+    def __init__(self, pipeline, candidates):
+        self.pipeline = pipeline
+        self.candidates = list(candidates)
+        self.total = len(self.candidates)
+        self.done = 0
+        self.unusable = 0
+        self.started_at = None
+        self.finished_at = None
+        self._texts = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="resume-prefetcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        stream = self.pipeline.extract_texts(self.candidates)
+        try:
+            for candidate_data, text, _ in stream:
+                cand_id = candidate_id_of(candidate_data)
+                with self._lock:
+                    self.done += 1
+                    if text is None:
+                        self.unusable += 1
+                    elif cand_id is not None:
+                        self._texts[cand_id] = text
+                if self._stop.is_set():
+                    break
+        except Exception as e:
+            logger.error(f"Resume prefetch failed after {self.done}/{self.total} resumes: {e}")
+        finally:
+            stream.close()  # Shuts the extraction process pool down if we stopped early
+            self.finished_at = time.monotonic()
+        logger.info(f"Prefetched {len(self._texts)}/{self.total} resumes ({self.unusable} unusable).")
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """Stops after the resume in hand. Texts prefetched so far stay available."""
+        self._stop.set()
+
+    def texts(self) -> dict:
+        """{candidate id: extracted text} for every resume prefetched so far."""
+        with self._lock:
+            return dict(self._texts)
+
+    def progress(self) -> dict:
+        with self._lock:
+            done, ready = self.done, len(self._texts)
+        end = self.finished_at or time.monotonic()
+        return {
+            'done': done,
+            'total': self.total,
+            'ready': ready,
+            'unusable': self.unusable,
+            'running': self.running,
+            'elapsed_s': end - self.started_at if self.started_at else 0.0,
+        }
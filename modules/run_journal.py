@@ -0,0 +1,87 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+from modules.analysis_pipeline import is_failed_result, candidate_id_of
+from utils.file_saver import BASE_OUTPUT_DIR, get_timestamp_str
+
+logger = logging.getLogger(__name__)
+
+RUN_JOURNAL_DIR = os.path.join(BASE_OUTPUT_DIR, "analysis_journal")
+
+
+class AnalysisRunJournal:
+    """
+    Append-only JSONL log of every analysis result for one job and JD.
+
+    Results are written the moment they come out of the pipeline, so a rerun, refresh
+    or crash mid-run loses nothing: starting the same job + JD again reuses every
+    finished result, analyzes the candidates that never got one, and retries the failed
+    ones. Each line also records which (masked) Mistral keys a failure went through,
+    so the retry pass can prefer other keys. Candidates without an id can't be matched
+    on restart, so they are not journaled and are always analyzed again.
+    """
+
+    def __init__(self, job_id, jd_hash):
+        os.makedirs(RUN_JOURNAL_DIR, exist_ok=True)
+        self.path = os.path.join(RUN_JOURNAL_DIR, f"{job_id}_{jd_hash[:16]}.jsonl")
+        self._lock = threading.Lock()
+
+    def latest(self) -> dict:
+        """{candidate id: last journal entry} for every candidate with at least one result."""
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn last line from a crash mid-write
+                if entry.get('candidate_id') not in (None, '', 'None', 'nan'):  # Older versions journaled NaN ids as 'nan'
+                    entries[str(entry['candidate_id'])] = entry
+        return entries
+
+    def record(self, result: dict, keys_tried=(), run_pass="initial"):
+        candidate_id = candidate_id_of(result, 'Candidate ID')
+        if candidate_id is None:
+            return  # Nothing to match it to on restart
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'candidate_id': candidate_id,
+            'pass': run_pass,
+            'failed': is_failed_result(result),
+            'keys_tried': list(keys_tried or []),
+            'result': result,
+        }
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+                f.flush()
+
+    def plan(self, candidates: list):
+        """
+        Splits candidate rows into (finished result rows, never analyzed, failed last time).
+        Finished results are reused as-is; the other two lists still need work.
+        """
+        latest = self.latest()
+        finished, missing, failed = [], [], []
+        for cand in candidates:
+            candidate_id = candidate_id_of(cand)
+            entry = latest.get(candidate_id) if candidate_id is not None else None
+            if entry is None:
+                missing.append(cand)
+            elif entry['failed']:
+                failed.append(cand)
+            else:
+                finished.append(entry['result'])
+        return finished, missing, failed
+
+    def archive(self):
+        """Moves the journal aside so the next run for this job + JD starts from scratch."""
+        if os.path.exists(self.path):
+            archived_path = f"{self.path}.{get_timestamp_str()}"
+            os.replace(self.path, archived_path)
+            logger.info(f"Archived analysis journal to {archived_path}")
@@ -0,0 +1,36 @@
+from modules.analysis_pipeline import _new_work_item, is_failed_result, llm_stage, mark_failed
+from modules.ai_analyzer import _failure_result
+
+
+class StubAnalyzer:
+    def __init__(self, ai_result):
+        self.ai_result = ai_result
+
+    def analyze_resume(self, resume_text, job_description, api_key=None, exclude_keys=()):
+        return self.ai_result
+
+
+def analyzed(ai_result, text="Python developer"):
+    item = _new_work_item({'name': 'Jane', 'candidate_unique_id': 'c1'}, text=text)
+    return llm_stage(item, "jd", StubAnalyzer(ai_result))['result']
+
+
+def test_a_summary_that_says_failed_is_still_a_real_result():
+    result = analyzed({'overall_score': 35, 'summary': "Candidate failed to demonstrate Kubernetes experience."})
+    assert result['Score (%)'] == 35
+    assert not is_failed_result(result)
+
+
+def test_failed_ai_calls_are_marked_failed_whatever_the_wording():
+    result = analyzed(_failure_result("API Client Error: 400 - context too long", ["...key1"]))
+    assert is_failed_result(result)
+    assert result['AI Remarks'].startswith("API Client Error")
+
+
+def test_resumes_that_never_reached_the_ai_are_marked_failed():
+    assert is_failed_result(analyzed(None, text="Error: Could not download resume."))
+    assert is_failed_result(mark_failed({'Candidate ID': 'c1'}, "Error: Extraction failed."))
+
+
+def test_rows_without_the_marker_are_not_failed():
+    assert not is_failed_result({'AI Remarks': 'Error: looks bad but was never marked'})
@@ -0,0 +1,157 @@
+import json
+import threading
+
+import pytest
+
+from modules.ai_analyzer import AIAnalyzer, pack_resumes, _parse_batch_entries
+
+
+def entry(cand_id, score=70, summary="Solid match."):
+    return {"candidate_id": cand_id, "overall_score": score, "key_strengths": [], "key_weaknesses": [], "summary": summary}
+
+
+class NoCache:
+    def get(self, *args):
+        return None
+
+    def put(self, *args):
+        pass
+
+
+class ScriptedAnalyzer(AIAnalyzer):
+    """AIAnalyzer with no secrets or network: `reply(user_content)` stands in for the Mistral API."""
+
+    def __init__(self, reply):
+        self.cache = NoCache()
+        self.model = "test-model"
+        self.batch_max_resumes = 10
+        self.batch_token_budget = 10 ** 6
+        self._rubrics = {}
+        self.reply = reply
+        self.requests = []
+
+    def scoring_criteria(self, job_description):
+        return "<JOB_DESCRIPTION>\njd\n</JOB_DESCRIPTION>"
+
+    def _request(self, messages, api_key=None, exclude_keys=()):
+        user_content = messages[-1]["content"]
+        self.requests.append(user_content)
+        return "ok", self.reply(user_content), ["...key1"]
+
+
+def test_pack_resumes_respects_both_limits_and_keeps_order():
+    resumes = [(str(i), "x" * 400) for i in range(5)]  # ~101 tokens each
+    assert [[c for c, _ in pack] for pack in pack_resumes(resumes, 2, 10 ** 6)] == [["0", "1"], ["2", "3"], ["4"]]
+    assert [[c for c, _ in pack] for pack in pack_resumes(resumes, 10, 250)] == [["0", "1"], ["2", "3"], ["4"]]
+
+
+def test_pack_resumes_gives_an_oversized_resume_its_own_pack():
+    packs = pack_resumes([("a", "x" * 40), ("big", "x" * 4000), ("b", "x" * 40)], 10, 100)
+    assert [[c for c, _ in pack] for pack in packs] == [["a"], ["big"], ["b"]]
+
+
+def test_parse_batch_entries_keeps_only_valid_expected_entries():
+    content = json.dumps({"results": [
+        entry("a"),
+        entry("a", score=10),           # Duplicate: the first one wins
+        entry("zzz"),                   # Not in this pack
+        entry("b", score=150),          # Score out of range
+        entry("c", summary=" "),        # No summary
+        {"candidate_id": "d", "overall_score": "high", "summary": "x"},
+        "not an entry",
+    ]})
+    parsed = _parse_batch_entries(content, {"a", "b", "c", "d", "e"})
+    assert list(parsed) == ["a"]
+    assert parsed["a"]["overall_score"] == 70
+
+
+def test_parse_batch_entries_accepts_a_bare_list_and_survives_garbage():
+    assert list(_parse_batch_entries(json.dumps([entry("a")]), {"a"})) == ["a"]
+    assert _parse_batch_entries("<html>proxy error</html>", {"a"}) == {}
+    assert _parse_batch_entries(None, {"a"}) == {}
+    assert _parse_batch_entries(json.dumps({"results": "nope"}), {"a"}) == {}
+
+
+def test_missing_entries_are_split_and_retried_until_answered():
+    def reply(user_content):
+        if "candidate_id=" in user_content:
+            # Packed request: only ever answers for resume "a".
+            return json.dumps({"results": [entry("a")]})
+        return json.dumps(entry(None, score=55))
+
+    analyzer = ScriptedAnalyzer(reply)
+    results = analyzer.analyze_batch([(c, f"resume {c}") for c in "abcd"], "jd")
+    assert results["a"]["overall_score"] == 70
+    assert {c: results[c]["overall_score"] for c in "bcd"} == {"b": 55, "c": 55, "d": 55}
+
+
+def test_malformed_single_reply_after_a_split_fails_only_that_resume():
+    def reply(user_content):
+        if "candidate_id=" in user_content:
+            return "not json"
+        if "resume b" in user_content:
+            return "{still not json"
+        return json.dumps(entry(None, score=60))
+
+    analyzer = ScriptedAnalyzer(reply)
+    results = analyzer.analyze_batch([(c, f"resume {c}") for c in "abc"], "jd")
+    assert results["a"]["overall_score"] == 60
+    assert results["c"]["overall_score"] == 60
+    assert results["b"]["overall_score"] == 0
+    assert results["b"]["keys_tried"] == ["...key1"]
+
+
+class FakeResponse:
+    status_code = 200
+    text = "<html>gateway</html>"
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+
+class FakeHttp:
+    def __init__(self, body):
+        self.body = body
+
+    def post(self, *args, **kwargs):
+        return FakeResponse(self.body)
+
+
+class RubricCache(NoCache):
+    def get_rubric(self, *args):
+        return None
+
+    def put_rubric(self, *args):
+        pass
+
+
+def analyzer_answering(body):
+    """A real AIAnalyzer (no secrets) whose HTTP client answers every request with 200 and `body`."""
+    analyzer = AIAnalyzer.__new__(AIAnalyzer)
+    analyzer.model = "test-model"
+    analyzer.endpoint = "http://mistral.invalid"
+    analyzer.http = FakeHttp(body)
+    analyzer.cache = RubricCache()
+    analyzer._rubrics = {}
+    analyzer._rubric_locks = {}
+    analyzer._rubric_locks_lock = threading.Lock()
+    return analyzer
+
+
+@pytest.mark.parametrize("body", [ValueError("not json"), {}, {"choices": []}, {"choices": [None]}])
+def test_unusable_200_response_is_reported_as_malformed(body):
+    status, content, keys_tried = analyzer_answering(body)._request([{"role": "user", "content": "hi"}], api_key="key-abcd")
+    assert status == "malformed"
+    assert "failed" in content
+    assert len(keys_tried) == 1
+
+
+def test_rubric_with_null_content_falls_back_to_the_raw_jd():
+    analyzer = analyzer_answering({"choices": [{"message": {"content": None}}]})
+    analyzer.scheduler = type("Scheduler", (), {"acquire": lambda self, exclude=(): "key-abcd", "report": lambda self, *a: None})()
+    assert analyzer.compile_jd("Senior Python developer") is None
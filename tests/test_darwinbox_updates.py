@@ -0,0 +1,47 @@
+import socket
+import threading
+
+import requests
+
+from modules.darwinbox_client import DarwinboxClient
+
+
+def client_posting_to(url):
+    """A DarwinboxClient without secrets whose update POSTs go straight to `url`."""
+    client = DarwinboxClient.__new__(DarwinboxClient)
+    client.username_update_actions, client.password_update_actions = "user", "pass"
+    client.update_http = None
+    client._post = lambda endpoint, auth, payload, http=None: requests.post(url, json=payload, timeout=5)
+    return client
+
+
+def update(client):
+    return client._update_candidate("Shortlist", {"candidate_id": "c1"}, "Shortlisted.", "Could not shortlist.")
+
+
+def test_refused_connection_is_retryable():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]  # Closed again before the request, so nothing is listening
+    success, message, retryable = update(client_posting_to(f"http://127.0.0.1:{port}/"))
+    assert not success and message.startswith("Network Error")
+    assert retryable
+
+
+def test_connection_dropped_after_the_request_was_sent_is_not_retryable():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def read_then_hang_up():
+        conn, _ = server.accept()
+        conn.recv(65536)  # The whole request arrives...
+        conn.close()      # ...and the connection drops before any response
+
+    threading.Thread(target=read_then_hang_up, daemon=True).start()
+    try:
+        success, message, retryable = update(client_posting_to(f"http://127.0.0.1:{server.getsockname()[1]}/"))
+    finally:
+        server.close()
+    assert not success and "aborted" in message.lower()
+    assert not retryable
@@ -0,0 +1,14 @@
+from utils.file_types import sniff_file_type
+
+
+def test_text_resume_mentioning_html_is_kept():
+    resume = b"Jane Doe\nFrontend developer\nSkills: <html>, CSS, JavaScript\n"
+    assert sniff_file_type(resume, "application/octet-stream") == (".txt", None)
+
+
+def test_html_pages_are_rejected_by_their_start_or_content_type():
+    for body in (b"<!DOCTYPE html><html><body>Login</body></html>", b"\n  <html><body>Expired</body></html>",
+                 b"\xef\xbb\xbf<html><body>Expired</body></html>"):
+        extension, reason = sniff_file_type(body)
+        assert extension is None and reason.startswith("HTML page")
+    assert sniff_file_type(b"Session expired", "text/html; charset=utf-8")[0] is None
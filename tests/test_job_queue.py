@@ -0,0 +1,38 @@
+import threading
+
+from modules.job_queue import AnalysisJobQueue
+
+
+def test_session_progress_is_dropped_once_its_last_call_finishes():
+    job_queue = AnalysisJobQueue(num_workers=2)
+    futures = [job_queue.submit("session-a", lambda x: x * 2, i) for i in range(5)]
+    assert [f.result(timeout=5) for f in futures] == [0, 2, 4, 6, 8]
+    for _ in range(100):
+        if not job_queue._progress:
+            break
+        threading.Event().wait(0.01)  # The worker updates counters just after setting the result
+    assert job_queue._progress == {}
+    assert job_queue.progress("session-a")['submitted'] == 0
+
+
+def test_cancel_drops_a_sessions_waiting_calls_and_its_progress():
+    job_queue = AnalysisJobQueue(num_workers=1)
+    release = threading.Event()
+    running = job_queue.submit("session-a", release.wait, 5)
+    for _ in range(100):
+        if job_queue.progress("session-a")['running']:
+            break
+        threading.Event().wait(0.01)
+    waiting = [job_queue.submit("session-a", lambda: "never") for _ in range(3)]
+    other = job_queue.submit("session-b", lambda: "ok")
+
+    assert job_queue.cancel("session-a") == 3
+    assert all(f.cancelled() for f in waiting)
+    release.set()
+    assert running.result(timeout=5) is True
+    assert other.result(timeout=5) == "ok"
+    for _ in range(100):
+        if not job_queue._progress:
+            break
+        threading.Event().wait(0.01)
+    assert job_queue._progress == {}
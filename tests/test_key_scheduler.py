@@ -0,0 +1,83 @@
+import pytest
+
+from modules import key_scheduler
+from modules.key_scheduler import KeyScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(key_scheduler.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_empties_after_burst_and_refills_at_the_configured_rate(clock):
+    scheduler = KeyScheduler(["key-aaaa"], requests_per_minute=60, burst=2, max_in_flight_per_key=10)
+    assert scheduler.acquire(timeout=0) == "key-aaaa"
+    assert scheduler.acquire(timeout=0) == "key-aaaa"
+    assert scheduler.acquire(timeout=0) is None
+
+    clock.now += 1.0  # 60/min refills one token per second
+    assert scheduler.acquire(timeout=0) == "key-aaaa"
+    assert scheduler.acquire(timeout=0) is None
+
+
+def test_in_flight_limit_holds_a_key_until_report(clock):
+    scheduler = KeyScheduler(["key-aaaa"], burst=5, max_in_flight_per_key=1)
+    assert scheduler.acquire(timeout=0) == "key-aaaa"
+    assert scheduler.acquire(timeout=0) is None
+    scheduler.report("key-aaaa", 200, latency_s=0.5)
+    assert scheduler.acquire(timeout=0) == "key-aaaa"
+
+
+def test_429_cools_the_key_down_and_rotates_to_the_other_key(clock):
+    scheduler = KeyScheduler(["key-aaaa", "key-bbbb"], requests_per_minute=60, burst=3, max_in_flight_per_key=10)
+    first = scheduler.acquire(timeout=0)
+    other = "key-bbbb" if first == "key-aaaa" else "key-aaaa"
+    scheduler.report(first, 429, retry_after_s=10)
+
+    for _ in range(3):
+        assert scheduler.acquire(timeout=0) == other
+    assert scheduler.acquire(timeout=0) is None  # The other key is out of tokens, the first still cooling down
+
+    stats = {s['key']: s for s in scheduler.stats()}
+    assert stats[f"...{first[-4:]}"]['rate_limited'] == 1
+    assert stats[f"...{first[-4:]}"]['rate_per_min'] == 30.0  # Halved by the 429
+    assert stats[f"...{first[-4:]}"]['cooling_down_s'] == 10.0
+
+    clock.now += 10.0
+    assert first in {scheduler.acquire(timeout=0), scheduler.acquire(timeout=0)}
+
+
+def test_429_without_retry_after_backs_off_exponentially(clock):
+    scheduler = KeyScheduler(["key-aaaa"], burst=3, max_in_flight_per_key=10)
+    cooldowns = []
+    for _ in range(3):
+        clock.now += 100.0
+        scheduler.report(scheduler.acquire(timeout=0), 429)
+        cooldowns.append(scheduler.stats()[0]['cooling_down_s'])
+    assert cooldowns == [key_scheduler.BASE_COOLDOWN_S, 2 * key_scheduler.BASE_COOLDOWN_S, 4 * key_scheduler.BASE_COOLDOWN_S]
+
+
+def test_excluded_keys_are_skipped_while_another_key_can_serve(clock):
+    scheduler = KeyScheduler(["key-aaaa", "key-bbbb"], burst=3, max_in_flight_per_key=10)
+    for _ in range(3):
+        assert scheduler.acquire(timeout=0, exclude=("key-aaaa",)) == "key-bbbb"
+
+
+def test_excluding_every_key_falls_back_to_all_keys(clock):
+    scheduler = KeyScheduler(["key-aaaa", "key-bbbb"], burst=3, max_in_flight_per_key=10)
+    assert scheduler.acquire(timeout=0, exclude=("key-aaaa", "key-bbbb")) in ("key-aaaa", "key-bbbb")
+
+
+def test_needs_at_least_one_key():
+    with pytest.raises(ValueError):
+        KeyScheduler([])
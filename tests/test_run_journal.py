@@ -0,0 +1,49 @@
+import pytest
+
+from modules import run_journal
+from modules.analysis_pipeline import AnalysisPipeline
+from modules.run_journal import AnalysisRunJournal
+
+
+class ScriptedAnalyzer:
+    """Stands in for AIAnalyzer: scores every resume with the same verdict and counts the calls."""
+
+    api_keys_list = ["key-1"]
+    resume_token_budget = 0
+
+    def __init__(self, summary):
+        self.summary = summary
+        self.calls = 0
+
+    def analyze_resume(self, resume_text, job_description, api_key=None, exclude_keys=()):
+        self.calls += 1
+        return {'overall_score': 40, 'summary': self.summary}
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_journal, "RUN_JOURNAL_DIR", str(tmp_path))
+    return AnalysisRunJournal("job-1", "a" * 64)
+
+
+def test_summary_saying_failed_is_journaled_as_done_and_not_retried(journal):
+    analyzer = ScriptedAnalyzer("Candidate failed to meet the minimum experience requirement.")
+    pipeline = AnalysisPipeline(analyzer, "jd", None, archive_resumes=False, extract_workers=1, llm_workers=1,
+                                journal=journal)
+    candidate = {'name': 'Jane', 'candidate_unique_id': 'c1', 'darwinbox_resume_url': 'https://example.invalid/c1.pdf'}
+
+    passes = [run_pass for _, run_pass, _ in pipeline.run_with_retry([candidate], texts={'c1': "Python developer"})]
+
+    assert passes == ["initial"]
+    assert analyzer.calls == 1
+    assert journal.latest()['c1']['failed'] is False
+    finished, missing, failed = journal.plan([candidate])
+    assert [r['Score (%)'] for r in finished] == [40]
+    assert missing == [] and failed == []
+
+
+def test_failed_results_go_back_to_plan_as_failures(journal):
+    journal.record({'Candidate ID': 'c1', 'AI Remarks': 'AI analysis failed after multiple retries.',
+                    'Analysis Status': 'failed'}, keys_tried=['...key1'])
+    candidate = {'candidate_unique_id': 'c1'}
+    assert journal.plan([candidate]) == ([], [], [candidate])
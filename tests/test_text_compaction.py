@@ -0,0 +1,55 @@
+from utils.text_compaction import clean_lines, compact_resume_text
+
+
+THREE_JOB_RESUME = """Jane Doe
+Experience
+Software Engineer, Acme
+2016 - 2019
+Senior Software Engineer, Globex
+2019 - 2022
+Staff Engineer, Initech
+2022 - 2024
+Skills
+Python, Go
+C++ | C#
+"""
+
+
+def test_date_ranges_that_differ_only_in_digits_are_kept():
+    lines = clean_lines(THREE_JOB_RESUME)
+    assert "2016 - 2019" in lines
+    assert "2019 - 2022" in lines
+    assert "2022 - 2024" in lines
+
+
+def test_symbol_heavy_skills_line_is_kept():
+    text, _ = compact_resume_text(THREE_JOB_RESUME)
+    assert "C++ | C#" in text.split("\n")
+
+
+def test_page_headers_are_still_deduplicated():
+    pages = "\f".join(f"Jane Doe - Page {n} of 3\nExperience\nWorked on thing {n}\n{n}" for n in (1, 2, 3))
+    lines = clean_lines(pages)
+    assert lines.count("Jane Doe - Page 1 of 3") == 1
+    assert not any(line.startswith("Jane Doe - Page 2") for line in lines)
+    assert "Worked on thing 3" in lines
+    assert "2" not in lines  # bare page number at the foot of a page
+    assert lines.count("Experience") == 3
+
+
+def test_lines_repeated_inside_pages_are_kept():
+    jobs = "\n".join(f"Software Engineer\nBangalore, India\nBuilt system {n}" for n in (1, 2, 3))
+    lines = clean_lines(f"Jane Doe\nExperience\n{jobs}\nSkills\nPython")
+    assert lines.count("Software Engineer") == 3
+    assert lines.count("Bangalore, India") == 3
+
+
+def test_bare_number_inside_a_page_is_kept():
+    text = "Jane Doe\nSummary\nBackend developer\nYears of experience\n5\nCurrent CTC\n12\nSkills\nPython\nGo"
+    lines = clean_lines(text)
+    assert lines[lines.index("Years of experience") + 1] == "5"
+
+
+def test_symbol_debris_before_the_first_heading_is_dropped():
+    lines = clean_lines("Jane Doe\n~~~ | ~~~ | -- a\nExperience\nAcme")
+    assert lines == ["Jane Doe", "Experience", "Acme"]
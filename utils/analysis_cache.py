@@ -0,0 +1,123 @@
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from utils.file_saver import BASE_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_PATH = os.path.join(BASE_OUTPUT_DIR, "cache", "analysis_results.sqlite3")
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Durable store of AI verdicts, keyed on everything that can change the answer:
+    the resume text, the job description, the model and the prompt template version.
+
+    A single connection is shared between worker threads and guarded by a lock;
+    the hit/miss counters are per-process and reset when the app restarts.
+    """
+
+    def __init__(self, db_path: str = ANALYSIS_CACHE_PATH):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS analysis_results (
+                    resume_hash TEXT NOT NULL,
+                    jd_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    result_json TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (resume_hash, jd_hash, model, prompt_version)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jd_rubrics (
+                    jd_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    rubric_json TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (jd_hash, model, prompt_version)
+                )
+                """
+            )
+            self._conn.commit()
+
+    def get(self, resume_text: str, job_description: str, model: str, prompt_version: str):
+        """Returns the cached result dict, or None if these inputs haven't been analyzed before."""
+        key = (hash_text(resume_text), hash_text(job_description), model, prompt_version)
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT result_json FROM analysis_results "
+                    "WHERE resume_hash = ? AND jd_hash = ? AND model = ? AND prompt_version = ?",
+                    key,
+                ).fetchone()
+                if row:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        except sqlite3.Error as e:
+            logger.warning(f"Analysis cache lookup failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def put(self, resume_text: str, job_description: str, model: str, prompt_version: str, result: dict):
+        key = (hash_text(resume_text), hash_text(job_description), model, prompt_version)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO analysis_results VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (json.dumps(result), datetime.now().isoformat(timespec="seconds")),
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store analysis result in cache: {e}")
+
+    def get_rubric(self, job_description: str, model: str, prompt_version: str):
+        """Returns the rubric compiled earlier for this JD, or None."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT rubric_json FROM jd_rubrics WHERE jd_hash = ? AND model = ? AND prompt_version = ?",
+                    (hash_text(job_description), model, prompt_version),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Rubric cache lookup failed: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def put_rubric(self, job_description: str, model: str, prompt_version: str, rubric: dict):
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO jd_rubrics VALUES (?, ?, ?, ?, ?)",
+                    (hash_text(job_description), model, prompt_version, json.dumps(rubric),
+                     datetime.now().isoformat(timespec="seconds")),
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store rubric in cache: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
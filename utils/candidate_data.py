@@ -0,0 +1,69 @@
+import pandas as pd
+
+from utils.candidate_store import candidate_key
+
+# application_data section -> {output column: field name in that section}. Sections can be a dict
+# (Biographical) or a list of dicts (Work Experience, Education); list values are joined with ", ".
+CANDIDATE_FIELD_MAP = {
+    'Biographical': {
+        'experience_level': 'Are you a Fresher or Experienced?',
+        'total_experience': 'Total Work Experience (in months)?',
+        'notice_period': 'Notice period',
+        'highest_qualification': 'Highest Educational Qualification',
+    },
+    'Work Experience': {
+        'work_experience_titles': 'Job Title',
+    },
+    'Education': {
+        'education_degrees': 'Education Degree',
+    },
+}
+
+def _section_values(section, fields):
+    """Values of `fields` in one application_data section; list sections join every entry's value."""
+    if isinstance(section, dict):
+        return [None if section.get(f) is None else str(section.get(f)) for f in fields]
+    if isinstance(section, list):
+        joined = []
+        for f in fields:
+            values = [str(entry[f]) for entry in section if isinstance(entry, dict) and entry.get(f)]
+            joined.append(', '.join(values) if values else None)
+        return joined
+    return [None] * len(fields)
+
+def flatten_candidate_data(df, field_map=None):
+    """
+    Pulls the fields in `field_map` (default CANDIDATE_FIELD_MAP) out of the nested
+    `application_data` column into flat columns, then drops the nested payload; the raw
+    records stay in the candidate store and the saved JSON, not in session state.
+
+    All columns are filled in one pass over the records and attached to the frame at once,
+    rather than one .apply per column plus a str() copy of every payload. pd.json_normalize
+    was tried and is not used: it deep-copies every record (about 8x slower on 20k candidates)
+    and widens ints to floats wherever a value is missing, so 24 months came back as "24.0".
+    """
+    if 'application_data' not in df.columns: return df
+    field_map = field_map or CANDIDATE_FIELD_MAP
+    sections = [(section, list(columns), list(columns.values())) for section, columns in field_map.items()]
+    output_columns = [column for _, columns, _ in sections for column in columns]
+
+    rows = []
+    for app in df.pop('application_data'):
+        app = app if isinstance(app, dict) else {}
+        row = []
+        for section, _, fields in sections:
+            row.extend(_section_values(app.get(section), fields))
+        rows.append(row)
+    flat = pd.DataFrame(rows, index=df.index, columns=output_columns, dtype=object)
+    return pd.concat([df.drop(columns=[c for c in output_columns if c in df.columns]), flat], axis=1)
+
+def candidates_to_dataframe(candidates_list, new_keys=None):
+    """Builds the candidates table shown in Step 2 from raw Darwinbox records."""
+    df = pd.DataFrame(candidates_list)
+    if df.empty:
+        return df
+    if new_keys is not None:
+        df['is_new'] = [candidate_key(c) in new_keys for c in candidates_list]
+    if 'unique_id' in df.columns:
+        df.rename(columns={'unique_id': 'candidate_unique_id'}, inplace=True)
+    return flatten_candidate_data(df)
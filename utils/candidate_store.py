@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+from utils.file_saver import BASE_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_STORE_PATH = os.path.join(BASE_OUTPUT_DIR, "cache", "candidates.sqlite3")
+
+
+def candidate_key(candidate: dict):
+    """
+    Stable id for a raw Darwinbox candidate record. Records without any id are keyed on a
+    hash of their contents, so they are still stored and recognised on the next sync.
+    """
+    cand_id = candidate.get('unique_id') or candidate.get('candidate_unique_id') or candidate.get('candidate_id') or candidate.get('id')
+    if cand_id:
+        return str(cand_id)
+    payload = json.dumps(candidate, sort_keys=True, default=str)
+    return f"payload-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]}"
+
+
+class CandidateStore:
+    """
+    Local copy of each job's candidates plus the scores they already received.
+
+    Every sync records a watermark (when it started), so the next "Fetch Candidates"
+    only has to ask Darwinbox for candidates created since then. Scores are stored per
+    job and JD hash, so an unchanged JD can reuse them instead of re-screening everyone.
+    """
+
+    def __init__(self, db_path: str = CANDIDATE_STORE_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS candidates (
+                    job_id TEXT NOT NULL,
+                    candidate_key TEXT NOT NULL,
+                    payload_json TEXT NOT NULL,
+                    first_seen_at TEXT NOT NULL,
+                    last_synced_at TEXT NOT NULL,
+                    PRIMARY KEY (job_id, candidate_key)
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    job_id TEXT PRIMARY KEY,
+                    watermark TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS candidate_scores (
+                    job_id TEXT NOT NULL,
+                    candidate_key TEXT NOT NULL,
+                    jd_hash TEXT NOT NULL,
+                    result_json TEXT NOT NULL,
+                    scored_at TEXT NOT NULL,
+                    PRIMARY KEY (job_id, candidate_key, jd_hash)
+                );
+                """
+            )
+            self._conn.commit()
+
+    def get_watermark(self, job_id):
+        """When the last successful sync for this job started, or None if it was never synced."""
+        with self._lock:
+            row = self._conn.execute("SELECT watermark FROM sync_state WHERE job_id = ?", (str(job_id),)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def merge_candidates(self, job_id, candidates: list, synced_at: datetime, advance_watermark: bool = True) -> set:
+        """
+        Upserts freshly fetched candidates and returns the keys of those never seen before.
+
+        Pass `advance_watermark=False` when the fetch was incomplete, so the next sync
+        asks for the same period again instead of silently skipping it.
+        """
+        job_id = str(job_id)
+        synced_at_str = synced_at.isoformat(timespec="seconds")
+        new_keys = set()
+        keyless = 0
+        with self._lock:
+            existing = {row[0] for row in self._conn.execute(
+                "SELECT candidate_key FROM candidates WHERE job_id = ?", (job_id,))}
+            for cand in candidates:
+                key = candidate_key(cand)
+                keyless += key.startswith("payload-")
+                if key not in existing:
+                    new_keys.add(key)
+                self._conn.execute(
+                    """
+                    INSERT INTO candidates VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (job_id, candidate_key) DO UPDATE SET
+                        payload_json = excluded.payload_json, last_synced_at = excluded.last_synced_at
+                    """,
+                    (job_id, key, json.dumps(cand, default=str), synced_at_str, synced_at_str),
+                )
+            if advance_watermark:
+                self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (job_id, synced_at_str))
+            self._conn.commit()
+        if keyless:
+            logger.warning(f"{keyless} candidates for job {job_id} have no id; they are stored under a hash of their data.")
+        logger.info(f"Merged {len(candidates)} candidates for job {job_id}; {len(new_keys)} new.")
+        return new_keys
+
+    def load_candidates(self, job_id) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload_json FROM candidates WHERE job_id = ? ORDER BY first_seen_at", (str(job_id),)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def save_scores(self, job_id, jd_hash: str, results: list):
+        """Stores analysis result rows (keyed by their 'Candidate ID') for this job and JD."""
+        scored_at = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO candidate_scores VALUES (?, ?, ?, ?, ?)",
+                [(str(job_id), str(r['Candidate ID']), jd_hash, json.dumps(r, default=str), scored_at)
+                 for r in results if r.get('Candidate ID')],
+            )
+            self._conn.commit()
+
+    def load_scores(self, job_id, jd_hash: str) -> dict:
+        """{candidate id: result row} for everything already scored against this JD."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT candidate_key, result_json FROM candidate_scores WHERE job_id = ? AND jd_hash = ?",
+                (str(job_id), jd_hash)).fetchall()
+        return {key: json.loads(result_json) for key, result_json in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_candidate_store() -> CandidateStore:
+    """The CandidateStore (and SQLite connection) shared by everything in this process."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CandidateStore()
+        return _default_store
+
+
+def sync_candidates(db_client, job_id, incremental: bool = True, store: CandidateStore = None):
+    """
+    Fetches a job's candidates through `db_client` and merges them into the store.
+
+    Returns (candidates, new candidate keys, previous watermark). When `incremental`, only
+    candidates created since the last sync are requested and the full list is read back
+    from the store; otherwise the whole lookback period is fetched and returned as-is.
+    """
+    store = store or get_candidate_store()
+    watermark = store.get_watermark(job_id) if incremental else None
+    synced_at = datetime.now()
+    fetched_candidates = db_client.get_candidates_for_job(job_id, since=watermark)
+    # Only move the watermark forward if the whole range was fetched.
+    new_keys = store.merge_candidates(job_id, fetched_candidates, synced_at, advance_watermark=db_client.last_fetch_ok)
+    candidates = store.load_candidates(job_id) if incremental else fetched_candidates
+    return candidates, new_keys, watermark
+
+
+def partition_by_prior_scores(candidates: list, prior_scores: dict):
+    """
+    Splits candidate rows into (still to analyze, reused result rows).
+
+    A candidate reuses its earlier result only if it isn't flagged as new and was
+    already scored against the same JD (see CandidateStore.load_scores).
+    """
+    to_analyze, reused_results = [], []
+    for cand in candidates:
+        prior = prior_scores.get(str(cand.get('candidate_unique_id')))
+        if prior and not cand.get('is_new'):
+            reused_results.append(prior)
+        else:
+            to_analyze.append(cand)
+    return to_analyze, reused_results
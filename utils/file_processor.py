@@ -1,52 +1,122 @@
+import io
 import os
 import requests
 import fitz  # PyMuPDF
 import pdfplumber
-from PIL import Image
-import pytesseract
 import logging
 from urllib.parse import urlparse
 import docx
+from utils.text_cache import TextCache
+from utils.http_client import PooledHttpClient
+from utils.ocr_engine import pages_needing_ocr, ocr_pdf_pages, ocr_image
+from utils import metrics, tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Bump whenever extraction logic changes so cached text from older versions is ignored.
+EXTRACTOR_VERSION = "3"
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff']
+_text_cache = TextCache()
+
+DOWNLOAD_TIMEOUT_S = 60
+DOWNLOAD_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+_download_client = PooledHttpClient(timeout=DOWNLOAD_TIMEOUT_S, headers=DOWNLOAD_HEADERS, name="downloads")
+
+def configure_download_pool(pool_size: int):
+    """Resizes the shared download connection pool, e.g. to match the number of download workers."""
+    global _download_client
+    if _download_client.pool_size != pool_size:
+        _download_client = PooledHttpClient(pool_size=pool_size, timeout=DOWNLOAD_TIMEOUT_S, headers=DOWNLOAD_HEADERS, name="downloads")
+
+def get_download_pool_stats() -> list:
+    return _download_client.pool_stats()
+
+def download_to_memory(file_url: str):
+    """
+    Downloads a file into a single in-memory buffer.
+
+    Returns (bytes, Content-Type header), or (None, None) on failure.
+    """
+    with metrics.timed("screening_download_seconds", outcome="error") as labels:
+        try:
+            r = _download_client.get(file_url, allow_redirects=True)
+            r.raise_for_status()
+            if not r.content:
+                logger.error(f"Downloaded file is empty: {file_url}")
+                labels["outcome"] = "empty"
+                return None, None
+            labels["outcome"] = "ok"
+            metrics.inc("screening_download_bytes_total", len(r.content))
+            return r.content, r.headers.get("Content-Type")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to download from {file_url}: {e}")
+            return None, None
+        except Exception as e:
+            logger.error(f"An unexpected error occurred during download from {file_url}: {e}")
+            return None, None
+
 def download_file(file_url: str, output_path: str) -> bool:
     """Downloads a file from a URL and saves it locally."""
-    try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        with requests.get(file_url, headers=headers, stream=True, timeout=60, allow_redirects=True) as r:
-            r.raise_for_status()
-            with open(output_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        
-        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-            logger.info(f"Successfully downloaded file to {output_path}")
-            return True
-        else:
-            logger.error(f"Downloaded file is empty or missing: {output_path}")
-            return False
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to download from {file_url}: {e}")
+    data, _ = download_to_memory(file_url)
+    if data is None:
         return False
-    except Exception as e:
-        logger.error(f"An unexpected error occurred during download from {file_url}: {e}")
+    try:
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        logger.info(f"Successfully downloaded file to {output_path}")
+        return True
+    except OSError as e:
+        logger.error(f"Could not save download to {output_path}: {e}")
         return False
 
-def extract_text_from_file(file_path: str) -> str:
-    """Extracts text from a given file (PDF, DOCX, TXT, or Image)."""
+def extract_text_from_file(file_path: str, use_cache: bool = True) -> str:
+    """Extracts text from a given file (PDF, DOCX, TXT, or Image). The file is read from disk once."""
     _, extension = os.path.splitext(file_path.lower())
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        logger.error(f"Error reading file {file_path}: {e}")
+        return f"Error: Failed to process file. Reason: {e}"
+    return extract_text_from_bytes(data, extension, use_cache=use_cache, source=file_path)
+
+def extract_text_from_bytes(data: bytes, extension: str, use_cache: bool = True, source: str = "<memory>") -> str:
+    """
+    Extracts text from an in-memory document; `extension` (e.g. '.pdf') selects the parser.
+
+    Results are cached on disk by a hash of the file contents, so a resume that was
+    already parsed (or OCR'd) in an earlier run is returned without re-processing.
+    """
+    extension = extension.lower()
+    with metrics.timed("screening_extract_seconds", extension=extension, cache="miss" if use_cache else "off") as labels, \
+            tracing.span("extract", category="extract", extension=extension) as trace_args:
+        cache_key = None
+        if use_cache:
+            cache_key = _text_cache.make_key(data, f"{EXTRACTOR_VERSION}{extension}")
+            cached_text = _text_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info(f"Text cache hit for {source}")
+                labels["cache"] = trace_args["cache"] = "hit"
+                return cached_text
+
+        with tracing.span(f"parse {extension}", category="extract", bytes=len(data)):
+            text_content = _extract_text(data, extension, source)
+        # Errors are not cached; they may be transient (e.g. a truncated download).
+        if cache_key and not text_content.startswith("Error:"):
+            _text_cache.put(cache_key, text_content)
+        return text_content
+
+def _extract_text(data: bytes, extension: str, source: str) -> str:
     text_content = ""
 
     try:
         # Handle DOCX files
         if extension == '.docx':
-            doc = docx.Document(file_path)
+            doc = docx.Document(io.BytesIO(data))
             full_text = []
             for para in doc.paragraphs:
                 full_text.append(para.text)
@@ -54,37 +124,29 @@ def extract_text_from_file(file_path: str) -> str:
         
         # Handle TXT files
         elif extension == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text_content = f.read()
+            text_content = data.decode('utf-8')
 
         # Handle PDF files
         elif extension == '.pdf':
-            with fitz.open(file_path) as doc:
-                for page in doc:
-                    text_content += page.get_text()
-            if not text_content.strip():
-                 with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            text_content += page_text + "\n"
-        
-        # Fallback to OCR for images or if text extraction yielded nothing
-        # This will also handle image file types like .png, .jpg
-        if not text_content.strip():
-            logger.warning(f"No text extracted from {file_path}. Attempting OCR.")
-            image_extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.tiff']
-            if extension == '.pdf':
-                doc = fitz.open(file_path)
-                for page_num in range(len(doc)):
-                    page = doc.load_page(page_num)
-                    pix = page.get_pixmap(dpi=200)
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    text_content += pytesseract.image_to_string(img) + "\n"
-                doc.close()
-            elif extension in image_extensions:
-                 img = Image.open(file_path)
-                 text_content = pytesseract.image_to_string(img)
+            with fitz.open(stream=data, filetype="pdf") as doc:
+                page_texts = [page.get_text() for page in doc]
+            if not "".join(page_texts).strip():
+                with pdfplumber.open(io.BytesIO(data)) as pdf:
+                    page_texts = [page.extract_text() or "" for page in pdf.pages]
+            # OCR only the pages without a usable text layer, not the whole document.
+            scanned_pages = pages_needing_ocr(page_texts)
+            if scanned_pages:
+                logger.warning(f"{len(scanned_pages)}/{len(page_texts)} pages of {source} have no text. Attempting OCR.")
+                metrics.inc("screening_ocr_pages_total", len(scanned_pages))
+                for page_number, ocr_text in ocr_pdf_pages(data, scanned_pages, source).items():
+                    if len(ocr_text.strip()) > len(page_texts[page_number].strip()):
+                        page_texts[page_number] = ocr_text
+            # Form feeds keep the page boundaries, so compaction can tell page headers/footers from content.
+            text_content = "\f".join(text.strip() for text in page_texts if text and text.strip())
+
+        # Images go straight to OCR
+        elif extension in IMAGE_EXTENSIONS:
+            text_content = ocr_image(data)
         
         if not text_content.strip():
             return "Error: Could not extract any text from the document."
@@ -92,5 +154,5 @@ def extract_text_from_file(file_path: str) -> str:
         return text_content.strip()
 
     except Exception as e:
-        logger.error(f"Error processing file {file_path}: {e}")
-        return f"Error: Failed to process file. Reason: {e}"
\ No newline at end of file
+        logger.error(f"Error processing file {source}: {e}")
+        return f"Error: Failed to process file. Reason: {e}"
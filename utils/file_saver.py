@@ -1,11 +1,18 @@
 import os
 import json
+import logging
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
 
 # Define the base directory for all output
 BASE_OUTPUT_DIR = "run_archive"
 
+# Archive writes are queued on a single background thread so they never hold up analysis.
+_archive_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive-writer")
+
 def get_timestamp_str():
     """Generates a string from the current date and time."""
     return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -56,4 +63,15 @@ def create_resume_folder(job_code: str):
     """Creates a dedicated folder for resumes of a specific job."""
     folder_path = os.path.join(BASE_OUTPUT_DIR, "Candidates_resumes", job_code)
     os.makedirs(folder_path, exist_ok=True)
-    return folder_path
\ No newline at end of file
+    return folder_path
+
+def _write_bytes(data: bytes, path: str):
+    try:
+        with open(path, 'wb') as f:
+            f.write(data)
+    except OSError as e:
+        logger.error(f"Could not archive file to {path}: {e}")
+
+def archive_file_async(data: bytes, path: str):
+    """Queues `data` to be written to `path` in the background (write-behind). Returns a Future."""
+    return _archive_writer.submit(_write_bytes, data, path)
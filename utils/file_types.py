@@ -0,0 +1,86 @@
+import codecs
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (magic prefix, extension) pairs for the formats extract_text_from_bytes can parse.
+_MAGIC_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"II*\x00", ".tiff"),
+    (b"MM\x00*", ".tiff"),
+]
+# Formats we recognise but cannot extract text from, with the reason shown to the recruiter.
+_UNSUPPORTED_SIGNATURES = [
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "legacy Word/Office (.doc) file"),
+    (b"{\\rtf", "RTF document"),
+    (b"Rar!", "RAR archive"),
+    (b"\x1f\x8b", "gzip archive"),
+]
+_CONTENT_TYPE_EXTENSIONS = {
+    "application/pdf": ".pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+    "text/plain": ".txt",
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/tiff": ".tiff",
+    "image/bmp": ".bmp",
+}
+SNIFF_BYTES = 1024
+
+
+def _looks_like_text(sample: bytes) -> bool:
+    try:
+        # Incremental decode tolerates a multi-byte character cut off at the end of the sample.
+        decoded = codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    printable = sum(1 for c in decoded if c.isprintable() or c in "\r\n\t")
+    return printable / max(1, len(decoded)) > 0.95
+
+
+def sniff_file_type(data: bytes, content_type: str = None):
+    """
+    Works out what a downloaded file really is from its leading bytes.
+
+    Returns (extension, None) for a parseable document, or (None, reason) for anything
+    that should be rejected before it reaches a parser or OCR. The Content-Type header
+    is only a hint: it decides between formats the bytes can't tell apart (plain text),
+    and flags HTML error pages early, but never overrides a clear magic-byte match.
+    """
+    if not data:
+        return None, "empty file"
+    head = data[:SNIFF_BYTES]
+    mime = (content_type or "").split(";")[0].strip().lower()
+
+    # PDFs may carry a little junk before the header; readers accept it within the first 1 KB.
+    if b"%PDF-" in head:
+        return ".pdf", None
+    if head.startswith(b"PK\x03\x04"):
+        # DOCX is a ZIP whose member names (stored uncompressed) include word/...
+        if b"word/" in data:
+            return ".docx", None
+        return None, "ZIP archive that is not a Word document"
+    for signature, extension in _MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return extension, None
+    # "BM" alone is too weak (a text resume could start with it); BMP headers also have 4 reserved zero bytes.
+    if head.startswith(b"BM") and head[6:10] == b"\x00\x00\x00\x00":
+        return ".bmp", None
+    for signature, description in _UNSUPPORTED_SIGNATURES:
+        if head.startswith(signature):
+            return None, description
+
+    # Only the start of the body counts: a text resume may well mention "<html" further down.
+    lowered = head.lstrip().removeprefix(codecs.BOM_UTF8).lstrip().lower()
+    if mime in ("text/html", "application/xhtml+xml") or lowered.startswith((b"<!doctype html", b"<html")):
+        return None, "HTML page (likely an expired link or login page)"
+    if lowered.startswith((b"{", b"[")) and mime in ("application/json", ""):
+        return None, "JSON response instead of a document"
+
+    if _looks_like_text(head):
+        return ".txt", None
+
+    if mime in _CONTENT_TYPE_EXTENSIONS:
+        logger.warning(f"Content-Type says {mime} but the file content does not match; rejecting.")
+    return None, f"unrecognized file type ({mime or 'no Content-Type'})"
@@ -4,6 +4,10 @@ import pandas as pd
 from datetime import datetime
 import logging
 import json # <-- NEW IMPORT
+import time
+import queue
+import threading
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -13,12 +17,85 @@ except KeyError:
     SPREADSHEET_KEY = None
     logger.error("GOOGLE_SHEET_KEY not found in secrets.toml. Google Sheets integration will be disabled.")
 
+# How long the background writer keeps collecting rows before it flushes them in one request.
+FLUSH_INTERVAL_S = 2.0
+# Rows that share these columns replace each other instead of piling up on every run.
+UPSERT_KEYS = {
+    "Job List": ("job_id",),
+    "Candidates Data": ("job_id", "candidate_unique_id"),
+    "AI Analysis Results": ("job_id", "Candidate ID"),
+}
+
+
+def _cell_to_str(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value)
+
+def serialize_for_sheets(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts every column to strings gspread can send, choosing the conversion by dtype:
+    numbers, booleans and datetimes are converted as whole columns; only object columns
+    (which may hold lists/dicts) are mapped value by value, once.
+    """
+    out = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            out[col] = series.dt.strftime("%Y-%m-%d %H:%M:%S").fillna("")
+        elif pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+                series = series.astype("Int64")  # Integer scores with a gap somewhere: 70, not 70.0
+            out[col] = series.astype(str).where(series.notna(), "")
+        else:
+            out[col] = series.map(_cell_to_str)
+    return pd.DataFrame(out, index=df.index)
+
+
+class _WorksheetState:
+    """What the writer knows about one worksheet, loaded once: headers, size and where each keyed row lives."""
+
+    def __init__(self, worksheet, key_columns):
+        self.worksheet = worksheet
+        self.key_columns = key_columns
+        values = worksheet.get_all_values()
+        self.headers = list(values[0]) if values else []
+        self.next_row = len(values) + 1
+        self.row_count = worksheet.row_count
+        self.col_count = worksheet.col_count
+        self.row_index = {}
+        if values and key_columns and all(k in self.headers for k in key_columns):
+            positions = [self.headers.index(k) for k in key_columns]
+            for row_number, row in enumerate(values[1:], start=2):
+                key = tuple(row[p] if p < len(row) else "" for p in positions)
+                if all(key):
+                    self.row_index[key] = row_number
+
 
 class GSheetsClient:
+    """
+    Writes tables to Google Sheets without blocking the caller.
+
+    `append_data_to_sheet` only queues the rows; a background thread collects everything
+    queued within FLUSH_INTERVAL_S and sends it as a single `batch_update` per worksheet.
+    Headers and row positions are read from each worksheet once and then tracked locally,
+    so worksheets with UPSERT_KEYS are updated in place instead of growing on every run.
+    A failed write is retried once in the next flush, after reloading the worksheet.
+    """
+
     def __init__(self):
         self.spreadsheet = None
         self.connected = False
-        
+        self.last_error = None
+        self._errors = {}  # worksheet name -> why its last rows were dropped; cleared by its next successful write
+        self._worksheets = {}
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._writer = None
+
         if not SPREADSHEET_KEY:
             return
 
@@ -27,7 +104,7 @@ class GSheetsClient:
             # Get the credentials string from secrets
             creds_str = st.secrets["gcp_service_account"]
             # Convert the string into a Python dictionary
-            creds_dict = json.loads(creds_str) 
+            creds_dict = json.loads(creds_str)
             # --- FIX ENDS HERE ---
 
             self.gc = gspread.service_account_from_dict(creds_dict) # Use the dictionary
@@ -37,62 +114,149 @@ class GSheetsClient:
         except Exception as e:
             st.error(f"Failed to connect to Google Sheets. Check API permissions and sharing settings. Error: {e}")
             logger.error(f"GSheets connection failed: {e}")
-    
-    def _prepare_data_for_sheets(self, df):
-        """Converts all data types to string to prevent gspread errors."""
-        # Create a copy to avoid modifying the original DataFrame in session_state
-        df_copy = df.copy()
-        for col in df_copy.columns:
-            # Convert lists/dicts to JSON strings, otherwise convert to simple string
-            if df_copy[col].apply(lambda x: isinstance(x, (list, dict))).any():
-                df_copy[col] = df_copy[col].apply(json.dumps)
-            else:
-                df_copy[col] = df_copy[col].astype(str)
-        return df_copy
 
-    def append_data_to_sheet(self, worksheet_name: str, data: list):
+    def append_data_to_sheet(self, worksheet_name: str, data: list, key_columns=None):
+        """
+        Queues `data` (a list of row dicts) for `worksheet_name` and returns immediately.
+        Rows are upserted on `key_columns` (default: UPSERT_KEYS for that worksheet) when
+        they have values for all of them, and appended otherwise.
+        """
         if not self.connected or not data:
             if not self.connected:
                 logger.warning("Google Sheets client not connected. Skipping data append.")
             return
 
-        try:
-            worksheet = self.spreadsheet.worksheet(worksheet_name)
-        except gspread.WorksheetNotFound:
+        key_columns = tuple(key_columns if key_columns is not None else UPSERT_KEYS.get(worksheet_name, ()))
+        run_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._pending_cond:
+            self._pending += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="gsheets-writer", daemon=True)
+                self._writer.start()
+        self._queue.put((worksheet_name, key_columns, run_timestamp, list(data)))
+
+    def flush(self, timeout=None) -> bool:
+        """Waits until everything queued so far has been written. Returns False on timeout."""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def _write_loop(self):
+        retry = []  # [(worksheet name, key columns, rows)] whose write failed once; they go first in the next flush
+        while True:
+            # With rows waiting for their retry, don't wait longer than one flush interval for new ones.
+            try:
+                batches = [self._queue.get(timeout=FLUSH_INTERVAL_S if retry else None)]
+            except queue.Empty:
+                batches = []
+            # Coalesce whatever else arrives shortly after, so a burst of calls becomes one request.
+            deadline = time.monotonic() + FLUSH_INTERVAL_S
+            while batches:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batches.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            retrying, retry = retry, []
+            # (row, already retried) per worksheet. Retried rows are older, so they go first and newer rows for the same key still win.
+            by_worksheet = {}
+            for worksheet_name, key_columns, rows in retrying:
+                by_worksheet.setdefault((worksheet_name, key_columns), []).extend((row, True) for row in rows)
+            for worksheet_name, key_columns, run_timestamp, rows in batches:
+                entry = by_worksheet.setdefault((worksheet_name, key_columns), [])
+                entry.extend((dict(row, run_timestamp=run_timestamp), False) for row in rows)
+            for (worksheet_name, key_columns), entries in by_worksheet.items():
+                rows = [row for row, _ in entries]
+                with metrics.timed("screening_gsheets_append_seconds", worksheet=worksheet_name, outcome="error") as labels:
+                    try:
+                        self._flush_rows(worksheet_name, key_columns, rows)
+                        labels["outcome"] = "ok"
+                        metrics.inc("screening_gsheets_rows_total", len(rows), worksheet=worksheet_name)
+                        self._errors.pop(worksheet_name, None)
+                    except Exception as e:
+                        # Reload the sheet before retrying; our cached view of it may no longer be right.
+                        self._worksheets.pop(worksheet_name, None)
+                        first_failures = [row for row, retried in entries if not retried]
+                        if first_failures:
+                            retry.append((worksheet_name, key_columns, first_failures))
+                            logger.warning(f"Failed to write {len(first_failures)} rows to '{worksheet_name}', retrying: {e}")
+                        if len(first_failures) < len(entries):
+                            self._errors[worksheet_name] = f"Could not write data to sheet '{worksheet_name}'. Error: {e}"
+                            logger.error(f"Dropped {len(entries) - len(first_failures)} rows for '{worksheet_name}' after a retry: {e}")
+            self.last_error = next(reversed(self._errors.values()), None)
+
+            with self._pending_cond:
+                self._pending += len(retry) - len(retrying) - len(batches)
+                self._pending_cond.notify_all()
+
+    def _get_worksheet_state(self, worksheet_name, key_columns) -> _WorksheetState:
+        state = self._worksheets.get(worksheet_name)
+        if state is None:
             try:
+                worksheet = self.spreadsheet.worksheet(worksheet_name)
+            except gspread.WorksheetNotFound:
                 worksheet = self.spreadsheet.add_worksheet(title=worksheet_name, rows="1000", cols="50")
                 logger.info(f"Created new worksheet: '{worksheet_name}'")
-            except Exception as e:
-                logger.error(f"Could not create worksheet '{worksheet_name}': {e}")
-                return
-        
-        try:
-            df_to_append = pd.DataFrame(data)
+            state = self._worksheets[worksheet_name] = _WorksheetState(worksheet, key_columns)
+        return state
 
-            df_to_append.insert(0, "run_timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    def _flush_rows(self, worksheet_name, key_columns, rows):
+        state = self._get_worksheet_state(worksheet_name, key_columns)
+        df = pd.DataFrame(rows)
+        # run_timestamp goes first, as it always has.
+        df = df[["run_timestamp"] + [c for c in df.columns if c != "run_timestamp"]]
+        df = serialize_for_sheets(df)
 
-            df_prepared = self._prepare_data_for_sheets(df_to_append)
-            
-            existing_headers = worksheet.row_values(1)
+        updates = []
+        new_cols = [col for col in df.columns if col not in state.headers]
+        if new_cols:
+            start_col = len(state.headers) + 1
+            updates.append({
+                "range": f"{gspread.utils.rowcol_to_a1(1, start_col)}:{gspread.utils.rowcol_to_a1(1, start_col + len(new_cols) - 1)}",
+                "values": [new_cols],
+            })
+            state.headers.extend(new_cols)
+            if state.next_row == 1:
+                state.next_row = 2  # The header row we are writing now
+            logger.info(f"Adding columns to '{worksheet_name}': {new_cols}")
+        values = df.reindex(columns=state.headers, fill_value="").values.tolist()
 
-            if not existing_headers:
-                worksheet.update([df_prepared.columns.values.tolist()] + df_prepared.values.tolist(), value_input_option='USER_ENTERED')
-                logger.info(f"Wrote initial data with headers to '{worksheet_name}'.")
+        # Later rows with the same key win, both within this batch and over what is already in the sheet.
+        key_positions = [state.headers.index(k) for k in key_columns] if key_columns and all(k in state.headers for k in key_columns) else None
+        appended = []
+        for row in values:
+            key = tuple(row[p] for p in key_positions) if key_positions else None
+            if key_positions:
+                # USER_ENTERED would store an id like "0123" as the number 123, which then never matches
+                # on the next load; a leading ' keeps the cell text, and Sheets reads it back as "0123".
+                row = [f"'{cell}" if p in key_positions and cell else cell for p, cell in enumerate(row)]
+            if key and all(key):
+                row_number = state.row_index.get(key)
+                if row_number is None:
+                    row_number = state.row_index[key] = state.next_row + len(appended)
+                    appended.append(row)
+                elif row_number >= state.next_row:
+                    appended[row_number - state.next_row] = row
+                else:
+                    updates.append({"range": f"A{row_number}:{gspread.utils.rowcol_to_a1(row_number, len(state.headers))}", "values": [row]})
             else:
-                new_cols_to_add = [col for col in df_prepared.columns if col not in existing_headers]
+                appended.append(row)
+        if appended:
+            first, last = state.next_row, state.next_row + len(appended) - 1
+            updates.append({"range": f"A{first}:{gspread.utils.rowcol_to_a1(last, len(state.headers))}", "values": appended})
 
-                if new_cols_to_add:
-                    start_col_index = len(existing_headers) + 1
-                    range_to_update = f"{gspread.utils.rowcol_to_a1(1, start_col_index)}:{gspread.utils.rowcol_to_a1(1, start_col_index + len(new_cols_to_add) - 1)}"
-                    worksheet.update(range_to_update, [new_cols_to_add])
-                    logger.info(f"Added new columns to '{worksheet_name}': {new_cols_to_add}")
-                    existing_headers.extend(new_cols_to_add)
-                
-                final_df = df_prepared.reindex(columns=existing_headers, fill_value="")
+        # batch_update can't write outside the grid, so grow it first if needed.
+        if state.next_row + len(appended) - 1 > state.row_count:
+            extra_rows = state.next_row + len(appended) - 1 - state.row_count + 1000
+            state.worksheet.add_rows(extra_rows)
+            state.row_count += extra_rows
+        if len(state.headers) > state.col_count:
+            state.worksheet.add_cols(len(state.headers) - state.col_count)
+            state.col_count = len(state.headers)
 
-                worksheet.append_rows(final_df.values.tolist(), value_input_option='USER_ENTERED')
-                logger.info(f"Appended {len(final_df)} rows to '{worksheet_name}'.")
-
-        except Exception as e:
-            st.warning(f"Could not write data to sheet '{worksheet_name}'. Error: {e}")
-            logger.error(f"Failed to append data to '{worksheet_name}': {e}")
\ No newline at end of file
+        state.worksheet.batch_update(updates, value_input_option="USER_ENTERED")
+        state.next_row += len(appended)
+        logger.info(f"Wrote {len(values)} rows to '{worksheet_name}' ({len(appended)} appended, "
+                    f"{len(values) - len(appended)} updated in place) in one request.")
@@ -0,0 +1,95 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT_S = 30
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_FACTOR = 0.5
+# Gateway errors are usually transient; anything else is left to the caller to interpret.
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+class PooledHttpClient:
+    """
+    Keep-alive HTTP client that can be shared by any number of worker threads.
+
+    requests.Session isn't documented as thread-safe, so every thread gets its own
+    Session, but they all mount the same HTTPAdapter. Connections therefore live in
+    one pool (sized with `pool_size`, ideally the number of workers using it) and a
+    TCP/TLS handshake is only paid when the pool has no idle connection to reuse.
+    Transport-level retries cover connection failures and, optionally, gateway errors;
+    they are counted per client `name` in screening_http_retries_total.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT_S, retries=DEFAULT_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, status_forcelist=RETRY_STATUS_CODES,
+                 retry_methods=Retry.DEFAULT_ALLOWED_METHODS, headers=None, name="http"):
+        self.name = name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.headers = headers or {}
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries if status_forcelist else 0,
+            status=retries if status_forcelist else 0,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist or (),
+            allowed_methods=retry_methods,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """The calling thread's Session, created on first use."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            session.headers.update(self.headers)
+            self._local.session = session
+        return session
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        response = self.session.request(method, url, **kwargs)
+        # urllib3 leaves the retries it made on the raw response; failed attempts never reach the caller otherwise.
+        retries = getattr(getattr(response.raw, "retries", None), "history", None)
+        if retries:
+            metrics.inc("screening_http_retries_total", len(retries), client=self.name)
+        return response
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def pool_stats(self) -> list:
+        """One entry per host connection pool: connections opened, requests served and idle connections."""
+        stats = []
+        pools = self._adapter.poolmanager.pools
+        for pool_key in list(pools.keys()):
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            stats.append({
+                "host": f"{pool.scheme}://{pool.host}",
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                "max_size": self.pool_size,
+            })
+        return stats
@@ -0,0 +1,269 @@
+import os
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+from utils.file_saver import BASE_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+METRICS_TEXTFILE_PATH = os.path.join(BASE_OUTPUT_DIR, "metrics", "screening.prom")
+# Seconds. Wide enough for sub-millisecond cache hits and multi-minute OCR or Mistral stalls.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# name -> (type, help). Only these names can be recorded, so typos fail loudly instead of creating new series.
+METRICS = {
+    "screening_download_seconds": ("histogram", "Resume download latency, by outcome."),
+    "screening_download_bytes_total": ("counter", "Bytes of resumes downloaded."),
+    "screening_extract_seconds": ("histogram", "Text extraction latency, by extension and cache result."),
+    "screening_ocr_pages_total": ("counter", "PDF pages sent to OCR."),
+    "screening_resume_tokens_total": ("counter", "Estimated resume tokens, by stage (extracted, compacted)."),
+    "screening_pipeline_stage_seconds": ("histogram", "Time an item spent in each pipeline stage (extraction includes the worker process round trip)."),
+    "screening_llm_request_seconds": ("histogram", "Mistral request latency per attempt, by key and HTTP status."),
+    "screening_llm_key_wait_seconds": ("histogram", "Time spent waiting for the key scheduler to hand out a Mistral key."),
+    "screening_llm_rate_limited_total": ("counter", "Mistral 429 responses, by key."),
+    "screening_llm_backoff_seconds_total": ("counter", "Seconds spent sleeping between Mistral attempts."),
+    "screening_llm_analyses_total": ("counter", "Resumes analyzed, by outcome (ok, cached, client_error, failed, malformed)."),
+    "screening_llm_batch_entries_total": ("counter", "Resumes sent in packed Mistral requests, by outcome (ok, malformed)."),
+    "screening_darwinbox_request_seconds": ("histogram", "Darwinbox API latency, by endpoint and outcome."),
+    "screening_gsheets_append_seconds": ("histogram", "Google Sheets append latency, by worksheet and outcome."),
+    "screening_gsheets_rows_total": ("counter", "Rows written to Google Sheets, by worksheet."),
+    "screening_http_retries_total": ("counter", "Transport-level retries made by pooled HTTP clients, by client."),
+}
+
+
+def mask_key(api_key: str) -> str:
+    """How API keys appear in labels and logs: only the last four characters."""
+    return f"...{str(api_key)[-4:]}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms with labels, rendered in the Prometheus text format.
+
+    Deliberately tiny instead of depending on prometheus_client: the app only needs to
+    write a textfile (for node_exporter's textfile collector) or answer one GET /metrics.
+    Metrics live in the process that records them. Worker processes send back what they
+    recorded (`delta_since`) and the parent adds it to its own registry (`merge`).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _series(name, labels):
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric '{name}'")
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        series = self._series(name, labels)
+        with self._lock:
+            self._counters[series] = self._counters.get(series, 0) + value
+
+    def observe(self, name, value, **labels):
+        series = self._series(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(series)
+            if histogram is None:
+                histogram = self._histograms[series] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timed(self, name, **labels):
+        """
+        Observes how long the block took. Labels can be filled in inside the block, e.g.
+        `with timed("x", outcome="error") as labels: ...; labels["outcome"] = "ok"`.
+        """
+        started = perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """The current values, as a baseline for delta_since()."""
+        with self._lock:
+            return dict(self._counters), {series: (list(h.counts), h.sum, h.count) for series, h in self._histograms.items()}
+
+    def delta_since(self, snapshot):
+        """What was recorded since `snapshot`, in the (picklable) form merge() takes."""
+        before_counters, before_histograms = snapshot
+        counters, histograms = self.snapshot()
+        counter_delta = {series: value - before_counters.get(series, 0) for series, value in counters.items()
+                         if value != before_counters.get(series, 0)}
+        histogram_delta = {}
+        for series, (counts, total, count) in histograms.items():
+            before = before_histograms.get(series)
+            if before is None:
+                histogram_delta[series] = (counts, total, count)
+            elif count != before[2]:
+                histogram_delta[series] = ([a - b for a, b in zip(counts, before[0])], total - before[1], count - before[2])
+        return counter_delta, histogram_delta
+
+    def merge(self, delta):
+        """Adds a delta_since() from another process (e.g. an extraction worker) to this registry."""
+        counter_delta, histogram_delta = delta
+        with self._lock:
+            for series, value in counter_delta.items():
+                self._counters[series] = self._counters.get(series, 0) + value
+            for series, (counts, total, count) in histogram_delta.items():
+                histogram = self._histograms.get(series)
+                if histogram is None:
+                    histogram = self._histograms[series] = _Histogram(self.buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+
+    def counter_values(self, name) -> dict:
+        """{labels dict as tuple: value} for one counter."""
+        with self._lock:
+            return {labels: value for (n, labels), value in self._counters.items() if n == name}
+
+    def histogram_summary(self, name, group_by=None) -> list:
+        """
+        Count, mean and estimated p50/p95 per value of the `group_by` label (all series
+        merged when None). Quantiles are interpolated within buckets, like histogram_quantile().
+        """
+        merged = {}
+        with self._lock:
+            for (n, labels), histogram in self._histograms.items():
+                if n != name:
+                    continue
+                group = dict(labels).get(group_by, "") if group_by else ""
+                counts, total, count = merged.get(group, ([0] * len(histogram.counts), 0.0, 0))
+                merged[group] = ([a + b for a, b in zip(counts, histogram.counts)], total + histogram.sum, count + histogram.count)
+        summary = []
+        for group, (counts, total, count) in sorted(merged.items()):
+            summary.append({
+                "group": group,
+                "count": count,
+                "mean_s": total / count if count else 0.0,
+                "p50_s": self._quantile(counts, count, 0.5),
+                "p95_s": self._quantile(counts, count, 0.95),
+                "total_s": total,
+            })
+        return summary
+
+    def _quantile(self, counts, count, q):
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # Beyond the last bucket we only know "more than this"
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {series: (list(h.counts), h.sum, h.count) for series, h in self._histograms.items()}
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            if metric_type == "counter":
+                series = {labels: value for (n, labels), value in counters.items() if n == name}
+            else:
+                series = {labels: value for (n, labels), value in histograms.items() if n == name}
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(series.items()):
+                if metric_type == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=METRICS_TEXTFILE_PATH):
+        """Atomically rewrites `path` with the current metrics, so a scraper never sees half a file."""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {e}")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    def escape(value):
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+# Process-wide registry; every module records into this one.
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+timed = registry.timed
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Serves GET /metrics from a background thread. Safe to call repeatedly (e.g. on every Streamlit rerun)."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        except OSError as e:
+            logger.error(f"Could not start the metrics endpoint on port {port}: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return _server
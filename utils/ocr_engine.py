@@ -0,0 +1,124 @@
+import io
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageOps
+import pytesseract
+
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+# A page with less selectable text than this is treated as scanned and sent to OCR.
+MIN_PAGE_TEXT_CHARS = 40
+# Resumes rarely carry anything useful past the first few pages; OCR on page 12 is wasted time.
+MAX_OCR_PAGES_PER_DOCUMENT = 6
+# Pages are rendered so their longest side is about TARGET_OCR_PIXELS, within these DPI bounds.
+# That gives Tesseract ~200 DPI on A4/Letter without blowing up small or oversized pages.
+TARGET_OCR_PIXELS = 2400
+MIN_OCR_DPI = 150
+MAX_OCR_DPI = 300
+BINARIZE_THRESHOLD = 160
+OCR_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# Inside the pipeline's extraction processes, which already run one document each, a scanned
+# document only gets its share of the CPUs (see configure_nested_ocr); with a share of one,
+# pages are OCRed one after another in the worker itself.
+NESTED_OCR_WORKERS = 1
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def pages_needing_ocr(page_texts: list) -> list:
+    """Indices of pages whose text layer is missing or too thin to be the real content."""
+    return [i for i, text in enumerate(page_texts) if len((text or "").strip()) < MIN_PAGE_TEXT_CHARS]
+
+
+def choose_dpi(page) -> int:
+    longest_side_pt = max(page.rect.width, page.rect.height) or 792  # 72 points per inch
+    dpi = int(TARGET_OCR_PIXELS * 72 / longest_side_pt)
+    return max(MIN_OCR_DPI, min(MAX_OCR_DPI, dpi))
+
+
+def preprocess_for_ocr(img: Image.Image) -> Image.Image:
+    """Grayscale, stretch contrast and binarize; Tesseract is faster and cleaner on black-on-white input."""
+    gray = ImageOps.autocontrast(ImageOps.grayscale(img))
+    return gray.point(lambda p: 255 if p > BINARIZE_THRESHOLD else 0, mode="1")
+
+
+def _ocr_loaded_page(page) -> str:
+    pix = page.get_pixmap(dpi=choose_dpi(page), colorspace=fitz.csGRAY)
+    img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+    return pytesseract.image_to_string(preprocess_for_ocr(img))
+
+
+def ocr_pdf_page(pdf_bytes: bytes, page_number: int) -> str:
+    """Renders and OCRs a single PDF page. Module-level so it can run in a worker process."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return _ocr_loaded_page(doc.load_page(page_number))
+
+
+def ocr_image(image_bytes: bytes) -> str:
+    with tracing.span("OCR image", category="ocr"), Image.open(io.BytesIO(image_bytes)) as img:
+        return pytesseract.image_to_string(preprocess_for_ocr(img))
+
+
+def configure_nested_ocr(extract_workers: int):
+    """Run in each pipeline extraction process: splits the CPUs between the `extract_workers` processes."""
+    global NESTED_OCR_WORKERS
+    NESTED_OCR_WORKERS = max(1, (os.cpu_count() or 1) // max(1, extract_workers))
+
+
+def _ocr_workers() -> int:
+    return NESTED_OCR_WORKERS if multiprocessing.parent_process() is not None else OCR_WORKERS
+
+
+def _ocr_page_traced(pdf_bytes: bytes, page_number: int, source: str):
+    """ocr_pdf_page for the pool; returns (text, spans) so the caller's trace still shows each page."""
+    tracer = tracing.Tracer()
+    with tracing.activate(tracer), tracing.span(f"OCR page {page_number + 1}", category="ocr", source=source):
+        text = ocr_pdf_page(pdf_bytes, page_number)
+    return text, tracer.events
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(max_workers=_ocr_workers(), mp_context=multiprocessing.get_context("spawn"))
+        return _ocr_pool
+
+
+def ocr_pdf_pages(pdf_bytes: bytes, page_numbers: list, source: str = "<memory>") -> dict:
+    """
+    OCRs the given pages (capped at MAX_OCR_PAGES_PER_DOCUMENT) and returns {page_number: text}.
+
+    Pages run in parallel in a process pool. Inside a worker process (e.g. the analysis
+    pipeline's extraction pool) that pool is NESTED_OCR_WORKERS processes owned by the worker,
+    and there is no pool at all when that is 1. Each page gets its own span in the trace either way.
+    """
+    if len(page_numbers) > MAX_OCR_PAGES_PER_DOCUMENT:
+        logger.info(f"OCR limited to {MAX_OCR_PAGES_PER_DOCUMENT} of {len(page_numbers)} scanned pages in {source}")
+        page_numbers = page_numbers[:MAX_OCR_PAGES_PER_DOCUMENT]
+
+    if len(page_numbers) <= 1 or _ocr_workers() <= 1:
+        page_texts = {}
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            for n in page_numbers:
+                with tracing.span(f"OCR page {n + 1}", category="ocr", source=source):
+                    page_texts[n] = _ocr_loaded_page(doc.load_page(n))
+        return page_texts
+
+    with tracing.span(f"OCR {len(page_numbers)} pages (pool)", category="ocr", source=source, pages=[n + 1 for n in page_numbers]):
+        pool = _get_ocr_pool()
+        futures = {n: pool.submit(_ocr_page_traced, pdf_bytes, n, source) for n in page_numbers}
+        page_texts, tracer = {}, tracing.current_tracer()
+        for n, future in futures.items():
+            page_texts[n], events = future.result()
+            if tracer:
+                tracer.extend(events, process_name="OCR worker")
+        return page_texts
@@ -0,0 +1,112 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+
+from utils.file_saver import BASE_OUTPUT_DIR
+
+logger = logging.getLogger(__name__)
+
+# Extracted text lives next to the other run artifacts so it survives app restarts.
+TEXT_CACHE_DIR = os.path.join(BASE_OUTPUT_DIR, "cache", "extracted_text")
+TEXT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# When the cache overflows, evict down to this fraction so we don't evict on every write.
+EVICT_TARGET_RATIO = 0.9
+
+
+class TextCache:
+    """
+    Content-addressed, size-bounded on-disk cache for extracted document text.
+
+    Entries are keyed by a SHA-256 of the file bytes plus an extractor version, so
+    the same resume downloaded again (for any job) maps to the same entry. Least
+    recently used entries are evicted once the cache grows past `max_bytes`; a hit
+    refreshes the entry's mtime, which is what the eviction order is based on.
+    """
+
+    def __init__(self, cache_dir: str = TEXT_CACHE_DIR, max_bytes: int = TEXT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_size = None  # Lazily computed total size of the cache in bytes
+
+    @staticmethod
+    def make_key(data: bytes, version: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(version.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.txt")
+
+    def get(self, key: str):
+        """Returns the cached text for `key`, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            os.utime(path)  # Mark as recently used
+            return text
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Could not read text cache entry {key[:12]}: {e}")
+            return None
+
+    def put(self, key: str, text: str):
+        """Stores `text` under `key`, evicting old entries if the cache is over its size limit."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write to a temp file first so concurrent readers never see a partial entry.
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            logger.warning(f"Could not write text cache entry {key[:12]}: {e}")
+            return
+
+        with self._lock:
+            if self._approx_size is None:
+                self._approx_size = self._scan_size()
+            else:
+                self._approx_size += len(text.encode("utf-8"))
+            if self._approx_size > self.max_bytes:
+                self._evict()
+
+    def _list_entries(self):
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".txt"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._list_entries())
+
+    def _evict(self):
+        # Other processes may share the directory, so re-scan instead of trusting our estimate.
+        entries = sorted(self._list_entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                evicted += 1
+            except OSError:
+                continue
+        self._approx_size = total
+        if evicted:
+            logger.info(f"Evicted {evicted} entries from text cache ({total / 1024 / 1024:.1f} MB remaining).")
@@ -0,0 +1,180 @@
+import re
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Estimated tokens of resume text that go into a prompt; longer resumes are trimmed section by section.
+DEFAULT_RESUME_TOKEN_BUDGET = 6000
+# Page headers/footers ("Jane Doe - Page 2", "Confidential"): a short line at the top or bottom of at
+# least this many pages. Only the first and last PAGE_EDGE_LINES lines of a page count as its edges.
+REPEATED_LINE_MIN_PAGES = 2
+REPEATED_LINE_MAX_CHARS = 120
+PAGE_EDGE_LINES = 3
+
+# Section headings, by the section they start. Experience and skills are what the analyst prompt scores on,
+# so they are kept first when a resume is over budget; then the top of the resume (name, summary), then the rest.
+SECTION_HEADINGS = {
+    'experience': ("experience", "work experience", "professional experience", "employment", "employment history",
+                   "work history", "career history", "internships", "internship"),
+    'skills': ("skills", "technical skills", "key skills", "core skills", "core competencies", "competencies",
+               "technologies", "tech stack", "tools", "expertise", "areas of expertise"),
+    'summary': ("summary", "profile", "professional summary", "career objective", "objective", "about me"),
+    'projects': ("projects", "key projects", "academic projects", "personal projects"),
+    'education': ("education", "academic background", "qualifications", "academic qualifications"),
+    'certifications': ("certifications", "certificates", "licenses", "courses", "training"),
+    # Recognised only so their text doesn't get counted as part of the section above them.
+    'other': ("achievements", "awards", "accomplishments", "publications", "languages", "hobbies", "interests",
+              "extracurricular activities", "personal details", "personal information", "references", "declaration"),
+}
+SECTION_PRIORITY = ('experience', 'skills', 'header', 'summary', 'projects', 'certifications', 'education')
+
+_HEADING_LOOKUP = {heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings}
+_PAGE_MARKER_RE = re.compile(r"^page\s*\d+(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+# "2", "- 2 -", "2 of 5", "2/5": only a page number when it sits at a page edge.
+_PAGE_NUMBER_RE = re.compile(r"^[-\u2013(]?\s*\d{1,3}(\s*(of|/)\s*\d{1,3})?\s*[-\u2013)]?$", re.IGNORECASE)
+_PAGE_IN_LINE_RE = re.compile(r"\bpage\s*\d+(\s*(of|/)\s*\d+)?\b", re.IGNORECASE)
+_INLINE_SPACE_RE = re.compile(r"[ \t\u00a0\u2000-\u200b\u3000]+")
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\ufffd]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text); good enough for sizing requests."""
+    return len(text or "") // 4 + 1
+
+
+def _line_key(line):
+    # Exact line, ignoring case. Only a "Page N (of M)" part is dropped, so per-page headers still match
+    # while lines that differ in other numbers (like "2016 - 2019" vs "2019 - 2022") never do.
+    return _PAGE_IN_LINE_RE.sub("", line.lower()).strip()
+
+
+def _is_noise(line, in_section=False):
+    """
+    Page numbers and OCR debris: lines with no letters or digits, or (before the first heading)
+    almost nothing but symbols. Inside a recognised section symbol-heavy lines like "C++ | C#" are real content.
+    """
+    if _PAGE_MARKER_RE.match(line):
+        return True
+    alnum = sum(c.isalnum() for c in line)
+    return alnum == 0 or (not in_section and len(line) > 3 and alnum / len(line) < 0.3)
+
+
+def _section_of(line):
+    """The section a heading line starts, or None if the line is not a heading."""
+    if len(line) > 40:
+        return None
+    return _HEADING_LOOKUP.get(re.sub(r"[^a-z ]", "", line.lower()).strip())
+
+
+def _edge_positions(page):
+    return set(range(min(PAGE_EDGE_LINES, len(page)))) | set(range(max(0, len(page) - PAGE_EDGE_LINES), len(page)))
+
+
+def clean_lines(text: str) -> list:
+    """
+    Normalized, non-empty lines with OCR noise and page furniture removed: page numbers and
+    header/footer lines repeated at the edges of several pages. Pages are separated by form
+    feeds (see utils.file_processor); text without any is a single page. The same line inside
+    a page (a role title or location under every job) is content and always kept.
+    """
+    text = (text or "").replace("\r\n", "\n").replace("\r", "\n")
+    pages, section = [], 'header'
+    for page_text in text.split("\f"):
+        page = []
+        for line in (_INLINE_SPACE_RE.sub(" ", _CONTROL_RE.sub("", line)).strip() for line in page_text.split("\n")):
+            if not line:
+                continue
+            section = _section_of(line) or section
+            if not _is_noise(line, in_section=section != 'header'):
+                page.append(line)
+        edges = _edge_positions(page)
+        pages.append([line for i, line in enumerate(page) if not (i in edges and _PAGE_NUMBER_RE.match(line))])
+
+    # Headings and sub-headings like "Responsibilities:" can open two pages in a row; they are never boilerplate.
+    edge_keys = [{_line_key(page[i]) for i in _edge_positions(page)
+                  if len(page[i]) <= REPEATED_LINE_MAX_CHARS and not page[i].endswith(":") and not _section_of(page[i])}
+                 for page in pages]
+    repeated = {key for key, n in Counter(key for keys in edge_keys for key in keys).items() if n >= REPEATED_LINE_MIN_PAGES}
+    seen = set()
+    kept = []
+    for page in pages:
+        edges = _edge_positions(page)
+        for i, line in enumerate(page):
+            key = _line_key(line)
+            if i in edges and key in repeated:
+                if key in seen:
+                    continue  # Keep the first copy; it may be the candidate's name at the top
+                seen.add(key)
+            kept.append(line)
+    return kept
+
+
+def split_sections(lines: list) -> list:
+    """[(section name, lines)] in resume order; whatever comes before the first heading is 'header'."""
+    sections = [('header', [])]
+    for line in lines:
+        section = _section_of(line)
+        if section:
+            sections.append((section, [line]))
+        else:
+            sections[-1][1].append(line)
+    return [(name, body) for name, body in sections if body]
+
+
+def trim_to_budget(lines: list, token_budget: int) -> list:
+    """
+    Keeps whole sections in SECTION_PRIORITY order (anything unrecognised last) until the
+    budget is used up, cutting the first section that does not fit at a line boundary and
+    dropping everything after it. Kept sections stay in their original order.
+    """
+    sections = split_sections(lines)
+    rank = {name: i for i, name in enumerate(SECTION_PRIORITY)}
+    order = sorted(range(len(sections)), key=lambda i: (rank.get(sections[i][0], len(SECTION_PRIORITY)), i))
+    remaining = token_budget
+    kept = {}
+    for i in order:
+        body = []
+        for line in sections[i][1]:
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                if remaining > 8:
+                    body.append(line[:remaining * 4])  # Part of a very long line still beats none of it
+                remaining = 0
+                break
+            body.append(line)
+            remaining -= cost
+        if body:
+            kept[i] = body
+        if remaining <= 0:
+            break
+    return [line for i in sorted(kept) for line in kept[i]]
+
+
+def compact_resume_text(text: str, token_budget=DEFAULT_RESUME_TOKEN_BUDGET):
+    """
+    Shrinks extracted resume text before it goes into a prompt: normalizes whitespace, drops
+    repeated header/footer lines and OCR noise, and trims to `token_budget` estimated tokens
+    keeping experience and skills first. Returns (text, stats).
+    """
+    lines = clean_lines(text)
+    compacted = "\n".join(lines)
+    trimmed = bool(token_budget) and estimate_tokens(compacted) > token_budget
+    if trimmed:
+        compacted = "\n".join(trim_to_budget(lines, token_budget))
+    stats = {
+        'chars_before': len(text or ""),
+        'chars_after': len(compacted),
+        'tokens_before': estimate_tokens(text),
+        'tokens_after': estimate_tokens(compacted),
+        'trimmed': trimmed,
+    }
+    return compacted, stats
+
+
+def describe_reduction(totals: dict) -> str:
+    """One line for logs and the UI from summed compaction stats."""
+    before, after = totals.get('tokens_before', 0), totals.get('tokens_after', 0)
+    saved = 100 * (before - after) / before if before else 0.0
+    return (f"Compacted {totals.get('resumes', 0)} resumes from ~{before:,} to ~{after:,} tokens ({saved:.0f}% smaller), "
+            f"{totals.get('trimmed', 0)} trimmed to the token budget.")
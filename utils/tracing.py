@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def _now_us() -> int:
+    # Wall clock rather than perf_counter, so spans recorded in extraction worker processes line up with ours.
+    return time.time_ns() // 1000
+
+
+class Tracer:
+    """
+    Collects spans for one analysis run and writes them as a Chrome trace (loadable in
+    chrome://tracing or ui.perfetto.dev). Each thread and worker process gets its own
+    track, so a long OCR job or a key stuck in backoff shows up as a wide bar.
+
+    Spans are only recorded on threads where the tracer was activated (see `activate`);
+    everywhere else `span()` is a no-op, so tracing costs nothing when it is off.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._named_tracks = set()
+
+    def add_span(self, name, category, start_us, duration_us, args=None):
+        pid, tid = os.getpid(), threading.get_native_id()
+        event = {"name": name, "cat": category, "ph": "X", "ts": start_us, "dur": duration_us,
+                 "pid": pid, "tid": tid, "args": args or {}}
+        with self._lock:
+            if (pid, tid) not in self._named_tracks:
+                self._named_tracks.add((pid, tid))
+                self._events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                                     "args": {"name": threading.current_thread().name}})
+            self._events.append(event)
+
+    def extend(self, events, process_name=None):
+        """Adds spans recorded by another tracer, e.g. one that ran in a worker process."""
+        with self._lock:
+            if events and process_name:
+                pid = events[0]["pid"]
+                if (pid, None) not in self._named_tracks:
+                    self._named_tracks.add((pid, None))
+                    self._events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": process_name}})
+            self._events.extend(events)
+
+    @property
+    def events(self) -> list:
+        with self._lock:
+            return list(self._events)
+
+    def write(self, path: str):
+        """Writes the trace JSON to `path` and returns the path, or None if it could not be written."""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, default=str)
+            logger.info(f"Wrote {len(self._events)} trace events to {path}")
+            return path
+        except OSError as e:
+            logger.error(f"Could not write trace to {path}: {e}")
+            return None
+
+
+def trace_path_for(results_path: str) -> str:
+    """Where the trace for a results file goes: next to it, e.g. JOB-1_<ts>.csv -> JOB-1_<ts>.trace.json."""
+    return f"{os.path.splitext(results_path)[0]}.trace.json"
+
+
+@contextmanager
+def activate(tracer, **context):
+    """
+    Routes spans recorded on this thread to `tracer` for the duration of the block. `context`
+    (e.g. candidate name and id) is added to the args of every span. `tracer=None` does nothing.
+    """
+    previous = (getattr(_local, "tracer", None), getattr(_local, "context", {}))
+    _local.tracer, _local.context = tracer, context
+    try:
+        yield tracer
+    finally:
+        _local.tracer, _local.context = previous
+
+
+def current_tracer():
+    return getattr(_local, "tracer", None)
+
+
+@contextmanager
+def span(name, category="pipeline", **args):
+    """
+    Records the block as a span on the active tracer. Yields the args dict so the block can
+    add results to it, e.g. `with span("LLM attempt 1") as s: ...; s["status"] = 429`.
+    """
+    tracer = getattr(_local, "tracer", None)
+    if tracer is None:
+        yield args
+        return
+    args.update(getattr(_local, "context", {}))
+    started = _now_us()
+    try:
+        yield args
+    finally:
+        tracer.add_span(name, category, started, _now_us() - started, args)